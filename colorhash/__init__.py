@@ -0,0 +1,4 @@
+"Generate a graphic based on the hash of an input file."
+from .pipeline import Renderer
+
+__all__ = ["Renderer"]
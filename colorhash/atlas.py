@@ -0,0 +1,241 @@
+"""
+Atlas (sprite sheet) writers, which pack many color matrices into a single image.
+
+Showing many pieces of art on one page costs a file and a request per image. An atlas holds all of
+them in one image, laid out in a grid, along with an index of where each tile is, so that clients
+can cut out (or, in CSS, position) each one.
+"""
+import abc
+import io
+import math
+from typing import BinaryIO, Iterator, Sequence
+
+from .color import Color, ColorMatrix, RGBColor
+from .palettes import CompiledPalette
+from .writer import PNGWriter, index_colors
+
+
+class AtlasWriter(metaclass=abc.ABCMeta):
+    """
+    Base class for atlas writers.
+
+    Tiles are laid out left to right, top to bottom, in a grid of equally sized cells. Matrices may
+    have different dimensions (e.g. hashes of different lengths); every cell is as large as the
+    largest matrix, and smaller tiles sit in the top left corner of their cell.
+    """
+
+    def __init__(self, square_size: int, columns: int | None = None, gap: int = 1) -> None:
+        """
+        Create a new atlas writer.
+
+        :param square_size: the size of the squares generated, in pixels.
+        :param columns: the number of tiles per row. default: enough to make the grid about square.
+        :param gap: the space between tiles, in squares.
+        """
+        self.square_size = square_size
+        self.columns = columns
+        self.gap = gap
+
+    def layout(self, tiles: Sequence[ColorMatrix]) -> tuple[int, int, int, int]:
+        """
+        Work out the grid for a set of tiles.
+
+        :param tiles: the color matrices to lay out.
+        :returns: the number of columns and rows of the grid, and the width and height of each cell,
+                  in squares (not including the gap).
+        """
+        if not tiles:
+            raise ValueError("an atlas needs at least one tile")
+        columns = self.columns or math.ceil(math.sqrt(len(tiles)))
+        columns = min(columns, len(tiles))
+        rows = math.ceil(len(tiles) / columns)
+        cell_w = max(len(tile[0]) for tile in tiles)
+        cell_h = max(len(tile) for tile in tiles)
+        return columns, rows, cell_w, cell_h
+
+    def index(self, tiles: Sequence[ColorMatrix], names: Sequence[str] | None = None) -> dict:
+        """
+        Get the offset index of an atlas, suitable for JSON.
+
+        :param tiles: the color matrices in the atlas.
+        :param names: a name for each tile. default: the position of each tile in `tiles`.
+        :returns: the size of the atlas image and the square size, and for each tile its name and
+                  the position and size of its box in the atlas, in pixels.
+        """
+        columns, rows, cell_w, cell_h = self.layout(tiles)
+        size = self.square_size
+        pitch_w = (cell_w + self.gap) * size
+        pitch_h = (cell_h + self.gap) * size
+        entries = []
+        for i, tile in enumerate(tiles):
+            row, column = divmod(i, columns)
+            entries.append(
+                {
+                    "name": names[i] if names is not None else str(i),
+                    "x": column * pitch_w,
+                    "y": row * pitch_h,
+                    "width": len(tile[0]) * size,
+                    "height": len(tile) * size,
+                }
+            )
+        return {
+            "width": columns * pitch_w - self.gap * size,
+            "height": rows * pitch_h - self.gap * size,
+            "square_size": size,
+            "tiles": entries,
+        }
+
+    @abc.abstractmethod
+    def write(self, tiles: Sequence[ColorMatrix]) -> bytes:
+        """
+        Generate an atlas image.
+
+        :param tiles: the color matrices to put in the atlas, in order.
+        :returns: the generated image.
+        """
+
+
+class SVGAtlasWriter(AtlasWriter):
+    """
+    SVG atlas writer.
+
+    Every distinct tile is drawn once, as a `<symbol>` (with one path per color, like the compact
+    `SVGWriter`), and placed in the grid with `<use>`. Tiles that appear more than once are only
+    drawn once. Symbols are drawn in units of squares and scaled up by the `<use>`, so the square
+    size only shows up in the grid positions.
+    """
+
+    def write(self, tiles: Sequence[ColorMatrix]) -> bytes:
+        columns, _, cell_w, cell_h = self.layout(tiles)
+        index = self.index(tiles)
+        size = self.square_size
+        pitch_w = (cell_w + self.gap) * size
+        pitch_h = (cell_h + self.gap) * size
+
+        svg = [
+            f'<svg width="{index["width"]}" height="{index["height"]}" '
+            'xmlns="http://www.w3.org/2000/svg"><defs>'
+        ]
+        symbols: dict[str, str] = {}
+        uses = []
+        for i, tile in enumerate(tiles):
+            palette, values = index_colors(tile)
+            h = len(values)
+            w = len(values[0])
+            body = self._symbol_body(palette, values)
+            symbol = symbols.get(body)
+            if symbol is None:
+                symbol = symbols[body] = f"t{len(symbols)}"
+                svg.append(f'<symbol id="{symbol}" viewBox="0 0 {w} {h}">{body}</symbol>')
+            row, column = divmod(i, columns)
+            uses.append(
+                f'<use href="#{symbol}" x="{column * pitch_w}" y="{row * pitch_h}" '
+                f'width="{w * size}" height="{h * size}"/>'
+            )
+        svg.append("</defs>")
+        svg += uses
+        svg.append("</svg>")
+        return "".join(svg).encode()
+
+    @staticmethod
+    def _symbol_body(palette: CompiledPalette, values: Sequence[Sequence[int]]) -> str:
+        # color -> path data, in order of first appearance, with horizontal runs merged
+        paths: dict[str, list[str]] = {}
+        fills = palette.html
+        for r, row in enumerate(values):
+            w = len(row)
+            c = 0
+            while c < w:
+                v = row[c]
+                run = c + 1
+                while run < w and row[run] == v:
+                    run += 1
+                paths.setdefault(fills[v], []).append(f"M{c} {r}h{run - c}v1h-{run - c}z")
+                c = run
+        return "".join(f'<path fill="{fill}" d="{"".join(d)}"/>' for fill, d in paths.items())
+
+
+class PNGAtlasWriter(AtlasWriter):
+    """
+    PNG atlas writer.
+
+    The tiles are written with `PNGWriter`, one row of tiles at a time, with the background color in
+    the gaps and empty cells. It uses a palette (or truecolor, when the tiles' palettes have more
+    than 256 colors between them), so large atlases stay small.
+    """
+
+    def __init__(
+        self,
+        square_size: int,
+        columns: int | None = None,
+        gap: int = 1,
+        background: Color | None = None,
+        compression_level: int = -1,
+        strategy: int = 0,
+    ) -> None:
+        """
+        Create a new PNG atlas writer.
+
+        :param square_size: the size of the squares generated, in pixels.
+        :param columns: the number of tiles per row. default: enough to make the grid about square.
+        :param gap: the space between tiles, in squares.
+        :param background: the color of the gaps and empty cells. default: white.
+        :param compression_level: the zlib compression level (see `PNGWriter`).
+        :param strategy: the zlib compression strategy (see `PNGWriter`).
+        """
+        super().__init__(square_size, columns, gap)
+        self.background = background or RGBColor(255, 255, 255)
+        self.writer = PNGWriter(square_size, compression_level, strategy)
+
+    def write(self, tiles: Sequence[ColorMatrix]) -> bytes:
+        out = io.BytesIO()
+        self.write_to(tiles, out)
+        return out.getvalue()
+
+    def write_to(self, tiles: Sequence[ColorMatrix], fp: BinaryIO) -> int:
+        """
+        Write an atlas image to a binary file object, one row of tiles at a time, so that the whole
+        atlas is never held in memory.
+
+        :param tiles: the color matrices to put in the atlas, in order.
+        :param fp: the file object to write the image to.
+        :returns: the number of bytes written.
+        """
+        columns, rows, cell_w, cell_h = self.layout(tiles)
+        gap = self.gap
+        width = columns * (cell_w + gap) - gap
+        height = rows * (cell_h + gap) - gap
+
+        # one PNG palette for the whole atlas: the background, then the colors of every distinct
+        # palette used by the tiles, without duplicates. Each tile's values are mapped through
+        # its palette's indices into it.
+        colors: dict[bytes, int] = {CompiledPalette([self.background]).rgb: 0}
+        # id -> (palette, indices); the palette is kept so that its id can't be reused
+        mappings: dict[int, tuple[CompiledPalette, list[int]]] = {}
+        indexed = []
+        for tile in tiles:
+            palette, values = index_colors(tile)
+            mapping = mappings.get(id(palette))
+            if mapping is None:
+                rgb = palette.rgb
+                indices = [
+                    colors.setdefault(rgb[v * 3 : v * 3 + 3], len(colors))
+                    for v in range(len(palette))
+                ]
+                mapping = mappings[id(palette)] = (palette, indices)
+            indexed.append((mapping[1], values))
+
+        def atlas_rows() -> Iterator[list[int]]:
+            for row in range(rows):
+                if row:
+                    for _ in range(gap):
+                        yield [0] * width
+                lines = [[0] * width for _ in range(cell_h)]
+                for i in range(row * columns, min((row + 1) * columns, len(tiles))):
+                    mapping, values = indexed[i]
+                    x = (i - row * columns) * (cell_w + gap)
+                    for r, values_row in enumerate(values):
+                        lines[r][x : x + len(values_row)] = [mapping[v] for v in values_row]
+                yield from lines
+
+        return self.writer.write_rows(fp, width, height, list(colors), atlas_rows())
@@ -0,0 +1,163 @@
+"Helpers for generating many pieces of art in a single invocation."
+import collections
+import os
+import sys
+from pathlib import Path, PurePath
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, TypeVar
+
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+DEFAULT_NAME_TEMPLATE = "{name}.{ext}"
+DEFAULT_MULTI_NAME_TEMPLATE = "{name}-{algo}.{ext}"
+
+# With -r, outputs mirror the directory tree underneath each input directory, so that files with the
+# same name in different directories get different outputs.
+DEFAULT_RECURSIVE_NAME_TEMPLATE = "{path}.{ext}"
+DEFAULT_RECURSIVE_MULTI_NAME_TEMPLATE = "{path}-{algo}.{ext}"
+
+
+def iter_inputs(
+    inputs: Iterable[str], files_from: str | None = None, recursive: bool = False
+) -> Iterator[tuple[str, str]]:
+    """
+    Iterate over all of the inputs for a batch run, lazily.
+
+    Inputs given on the command line come first, followed by the inputs listed in `files_from`, one
+    per line. Nothing is read ahead of time, so very long input lists are never held in memory.
+
+    :param inputs: the inputs given on the command line.
+    :param files_from: a file containing newline-separated inputs, or '-' for STDIN.
+    :param recursive: if true, any input that is a directory is walked and every file underneath
+                      it is yielded (in sorted order) instead of the directory itself.
+    :returns: an iterator over (input, relative path) for every input. The relative path of a file
+              found by walking a directory is its path relative to that directory; otherwise it is
+              the input itself. It is the `{path}` field of `output_path`.
+    """
+
+    def expand(item: str) -> Iterator[tuple[str, str]]:
+        if recursive and os.path.isdir(item):
+            for path in walk_files(item):
+                yield path, os.path.relpath(path, item)
+        else:
+            yield item, item
+
+    for item in inputs:
+        yield from expand(item)
+
+    if files_from is None:
+        return
+
+    if files_from == "-":
+        for line in sys.stdin:
+            line = line.rstrip("\r\n")
+            if line:
+                yield from expand(line)
+    else:
+        with open(files_from, "r", encoding="utf-8") as fp:
+            for line in fp:
+                line = line.rstrip("\r\n")
+                if line:
+                    yield from expand(line)
+
+
+def walk_files(root: str) -> Iterator[str]:
+    """
+    Walk a directory tree, yielding every regular file underneath it.
+
+    Directory entries are visited in sorted order so the output is stable between runs.
+
+    :param root: the directory to walk.
+    :returns: an iterator over the paths of all files in the tree.
+    """
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            yield os.path.join(dirpath, filename)
+
+
+def output_path(
+    out_dir: Path,
+    template: str,
+    item: str,
+    index: int,
+    relpath: str | None = None,
+    **fields: str,
+) -> Path:
+    """
+    Build the output path for a single batch item.
+
+    The template is a `str.format` string. The following fields are always available:
+
+    * `{name}` - the file name of the input (for non-path inputs, the input itself)
+    * `{stem}` - the file name of the input without its suffix
+    * `{path}` - the relative path of the input (see `iter_inputs`), which may contain directories.
+      Any root, `.` and `..` components are dropped, so the output stays underneath `out_dir`.
+    * `{index}` - the position of the input in the batch, starting at 0
+
+    Any extra keyword arguments (e.g. `algo`, `matrix`, `ext`) are also available as fields.
+
+    :param out_dir: the directory that outputs are written to.
+    :param template: the file name template.
+    :param item: the input that the output is being generated for.
+    :param index: the position of the input in the batch.
+    :param relpath: the relative path of the input. default: the input itself
+    :returns: the path to write the output to.
+    """
+    name = Path(item).name or item
+    stem = Path(name).stem or name
+    relative = PurePath(item if relpath is None else relpath)
+    parts = [part for part in relative.parts if part not in (relative.anchor, ".", "..")]
+    path = "/".join(parts) or name
+    return out_dir / template.format(name=name, stem=stem, path=path, index=index, **fields)
+
+
+def imap_ordered(
+    func: Callable[[T], R], items: Iterable[T], jobs: int = 1
+) -> Iterator[tuple[T, R | None, Exception | None]]:
+    """
+    Apply a function to every item, using a pool of `jobs` worker threads.
+
+    Results are yielded in the same order as the items, regardless of the order in which they
+    finish. Only a bounded number of items are in flight at any time, so this is safe to use with
+    very long (or endless) iterators. Exceptions raised by `func` do not stop the run; they are
+    yielded alongside the item that caused them instead.
+
+    Threads are used rather than processes because `hashlib` releases the GIL while hashing large
+    buffers, so digesting files scales across cores without having to pickle anything.
+
+    :param func: the function to apply to each item.
+    :param items: the items to apply the function to.
+    :param jobs: the number of worker threads to use. 1 or less runs everything in this thread.
+    :returns: an iterator of (item, result, error) tuples. Exactly one of result or error is set.
+    """
+    if jobs <= 1:
+        for item in items:
+            try:
+                yield item, func(item), None
+            except Exception as ex:  # pylint: disable=broad-exception-caught
+                yield item, None, ex
+        return
+
+    # imported here so runs without --jobs don't pay for it
+    from concurrent.futures import \
+        ThreadPoolExecutor  # pylint: disable=import-outside-toplevel
+
+    def collect(item: T, future: "Future[R]") -> tuple[T, R | None, Exception | None]:
+        try:
+            return item, future.result(), None
+        except Exception as ex:  # pylint: disable=broad-exception-caught
+            return item, None, ex
+
+    window = jobs * 4
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        pending: collections.deque[tuple[T, "Future[R]"]] = collections.deque()
+        for item in items:
+            pending.append((item, pool.submit(func, item)))
+            if len(pending) >= window:
+                yield collect(*pending.popleft())
+        while pending:
+            yield collect(*pending.popleft())
@@ -0,0 +1,366 @@
+"""
+Benchmarks for colorhash.
+
+Times each stage of the pipeline (matricizing, colorizing and writing) for every hash size, square
+size and writer, plus end-to-end runs of the command line program on files of several sizes.
+The digest cache is benchmarked by hashing a tree of small files, and a batch of them, with and
+without a warm `--cache-dir`. Results can be saved as JSON and compared against an earlier run, to
+catch regressions between commits:
+
+    python -m colorhash.bench --save before.json
+    (make changes)
+    python -m colorhash.bench --compare before.json
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from pathlib import Path
+from typing import Callable, Iterator
+
+from .color import colorize
+from .matricizer import Matricizer, NibbleMatricizer, RandomartMatricizer
+from .writer import ANSIWriter, PNGWriter, SVGWriter, Writer
+
+HASHES = ["md5", "sha1", "sha224", "sha256", "sha384", "sha512"]
+
+MATRICIZERS: dict[str, Matricizer] = {
+    "nibble": NibbleMatricizer(),
+    "randomart": RandomartMatricizer(),
+}
+
+SQUARE_SIZES = [1, 8, 32, 128]
+
+FILE_SIZES = {
+    "1KiB": 1 << 10,
+    "1MiB": 1 << 20,
+    "64MiB": 64 << 20,
+}
+
+# The directory tree hashed by the digest cache benchmarks: this many files of this size, spread over
+# directories of 100 files each.
+TREE_FILES = 1000
+TREE_FILE_SIZE = 64 << 10
+
+# Each benchmark works through this many different hashes, so that the results are not skewed by
+# one particular hash.
+DIGEST_COUNT = 64
+
+# The format version of the saved results.
+RESULTS_VERSION = 1
+
+Benchmark = tuple[str, Callable[[], object], int]
+
+
+def digests(algo: str) -> list[bytes]:
+    """
+    Get the hashes used for benchmarking a hash algorithm. The hashes are the same on every run.
+
+    :param algo: the hash algorithm.
+    :returns: the hashes.
+    """
+    return [hashlib.new(algo, i.to_bytes(4, "big")).digest() for i in range(DIGEST_COUNT)]
+
+
+def pipeline_benchmarks() -> Iterator[Benchmark]:
+    """
+    Get the benchmarks for each stage of the pipeline.
+
+    :returns: an iterator over (name, function, operations per call) for each benchmark.
+    """
+    for algo in HASHES:
+        hashes = digests(algo)
+        for name, matricizer in MATRICIZERS.items():
+            matricize = matricizer.matricize
+            yield (
+                f"matricize/{name}/{algo}",
+                lambda matricize=matricize, hashes=hashes: [matricize(h) for h in hashes],
+                len(hashes),
+            )
+
+            inputs = [(matricizer.choose_palette(h), matricizer.matricize(h)) for h in hashes]
+            yield (
+                f"colorize/{name}/{algo}",
+                lambda inputs=inputs: [colorize(palette, matrix) for palette, matrix in inputs],
+                len(inputs),
+            )
+
+    # the writers only see the matrix, so one hash size is enough per matricizer
+    writers: list[tuple[str, Writer]] = [
+        ("ansi/truecolor", ANSIWriter()),
+        ("ansi/256", ANSIWriter("256")),
+        ("ansi/16", ANSIWriter("16")),
+    ]
+    for size in SQUARE_SIZES:
+        writers += [
+            (f"svg/{size}", SVGWriter(size)),
+            (f"svg-compact/{size}", SVGWriter(size, compact=True)),
+            (f"png/{size}", PNGWriter(size)),
+        ]
+    for name, matricizer in MATRICIZERS.items():
+        hashes = digests("sha512")
+        matrices = [colorize(matricizer.choose_palette(h), matricizer.matricize(h)) for h in hashes]
+        for writer_name, writer in writers:
+            write = writer.write
+            yield (
+                f"write/{writer_name}/{name}",
+                lambda write=write, matrices=matrices: [write(m) for m in matrices],
+                len(matrices),
+            )
+
+
+def time_benchmark(func: Callable[[], object], repeat: int, min_time: float) -> list[float]:
+    """
+    Time a benchmark.
+
+    :param func: the function to time.
+    :param repeat: the number of timings to take.
+    :param min_time: the minimum time of each timing, in seconds. The function is called as many
+                     times as needed to reach it.
+    :returns: the time of a single call to the function, for each timing, in seconds.
+    """
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed * 10 >= min_time else 10
+    return [elapsed / number] + [t / number for t in timer.repeat(repeat - 1, number)]
+
+
+def cli_benchmarks(directory: Path) -> Iterator[Benchmark]:
+    """
+    Get the end-to-end benchmarks, which run the command line program on files of several sizes.
+
+    :param directory: a directory to create the input and output files in.
+    :returns: an iterator over (name, function, bytes hashed per call) for each benchmark.
+    """
+    root = str(Path(__file__).resolve().parent.parent)
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [root, env.get("PYTHONPATH")]))
+    for name, size in FILE_SIZES.items():
+        infile = directory / f"input-{name}"
+        with open(infile, "wb") as fp:
+            remaining = size
+            while remaining > 0:
+                chunk = os.urandom(min(remaining, 1 << 20))
+                fp.write(chunk)
+                remaining -= len(chunk)
+        for output_type in ["svg", "png"]:
+            command = [
+                sys.executable, "-m", "colorhash", str(infile),
+                "-x", "path", "-y", output_type, "-o", str(directory / f"output.{output_type}"),
+            ]
+            yield (
+                f"cli/{output_type}/{name}",
+                lambda command=command: subprocess.run(command, env=env, check=True),
+                size,
+            )
+
+    # the files are older than digestcache.RACY_SECONDS, or they would never be cached
+    tree = directory / "tree"
+    old = time.time() - 3600
+    paths = []
+    for i in range(TREE_FILES):
+        path = tree / f"d{i // 100}" / f"f{i % 100}"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(os.urandom(TREE_FILE_SIZE))
+        os.utime(path, (old, old))
+        paths.append(str(path))
+    files_from = directory / "files"
+    files_from.write_text("".join(f"{path}\n" for path in paths))
+    name = f"{TREE_FILES}x{TREE_FILE_SIZE >> 10}KiB"
+    # the warm-up call fills the cache, so the timed runs are all warm
+    cache = ["--cache-dir", str(directory / "cache")]
+    for mode, args in [
+        ("tree", ["-x", "tree", str(tree), "-o", str(directory / "tree.svg")]),
+        ("batch", ["--files-from", str(files_from), "-y", "ansi"]),
+    ]:
+        for suffix, extra in [("", []), ("-cached", cache)]:
+            command = [sys.executable, "-m", "colorhash", *args, *extra]
+            yield (
+                f"cli/{mode}{suffix}/{name}",
+                lambda command=command: subprocess.run(
+                    command, env=env, stdout=subprocess.DEVNULL, check=True
+                ),
+                TREE_FILES * TREE_FILE_SIZE,
+            )
+
+
+def run(args: argparse.Namespace) -> dict[str, dict[str, float]]:
+    """
+    Run the selected benchmarks, printing the results as they are taken.
+
+    :param args: the parsed command line arguments.
+    :returns: the results, keyed by benchmark name.
+    """
+    pattern = re.compile(args.filter) if args.filter else None
+    results: dict[str, dict[str, float]] = {}
+
+    def measure(benchmarks: Iterator[Benchmark], unit: str, repeat: int, min_time: float) -> None:
+        for name, func, ops in benchmarks:
+            if pattern is not None and not pattern.search(name):
+                continue
+            func()  # warm up (lazily built tables, imports, file system caches)
+            times = time_benchmark(func, repeat, min_time)
+            best = min(times)
+            median = statistics.median(times)
+            # times are per call; a call covers `ops` hashes (or bytes, for the cli benchmarks)
+            results[name] = {"best": best, "median": median, "ops": ops}
+            if unit == "op":
+                rate = f"{ops / median:12.0f} op/s  {median / ops * 1e6:10.2f} us/op"
+            else:
+                rate = f"{ops / median / (1 << 20):10.1f} MiB/s  {median * 1000:10.2f} ms/run"
+            print(f"{name:40} {rate}", flush=True)
+
+    quick = args.quick
+    measure(pipeline_benchmarks(), "op", 3 if quick else 7, 0.05 if quick else 0.2)
+    if not args.no_cli:
+        with tempfile.TemporaryDirectory(prefix="colorhash-bench-") as tmp:
+            # every run is at least one process startup, so there is no need for a minimum time
+            measure(cli_benchmarks(Path(tmp)), "byte", 3 if quick else 5, 0.0)
+    return results
+
+
+def compare(old: dict, new: dict[str, dict[str, float]], threshold: float) -> bool:
+    """
+    Compare the results of two runs, printing the change for each benchmark.
+
+    :param old: the saved results of the earlier run.
+    :param new: the results of this run.
+    :param threshold: the fraction a benchmark may slow down by before it counts as a regression.
+    :returns: True if no benchmark regressed.
+    """
+    if old.get("version") != RESULTS_VERSION:
+        raise ValueError(f"unsupported results version: {old.get('version')}")
+    ok = True
+    print()
+    if not set(new) & set(old["results"]):
+        print("no benchmarks in common with the earlier run")
+        return ok
+    print(f"{'benchmark':40} {'before':>12} {'after':>12} {'change':>8}")
+    for name, result in new.items():
+        before = old["results"].get(name)
+        if before is None:
+            continue
+        # the best time is the least noisy estimate of how fast the code can go
+        ratio = result["best"] / before["best"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            ok = False
+        print(
+            f"{name:40} {before['best'] * 1000:10.3f}ms {result['best'] * 1000:10.3f}ms "
+            f"{(ratio - 1) * 100:+7.1f}%{flag}"
+        )
+    return ok
+
+
+def git_commit() -> str | None:
+    "Get the commit the benchmarks are running against, if colorhash is in a git checkout."
+    try:
+        proc = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=Path(__file__).resolve().parent,
+            capture_output=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return proc.stdout.decode().strip()
+
+
+def bench_main() -> None:
+    "Entrypoint for `python -m colorhash.bench`."
+    ap = argparse.ArgumentParser(
+        prog="python -m colorhash.bench",
+        description="Benchmark colorhash. Times are per hash for the pipeline benchmarks, and per "
+        "process for the command line (cli/) benchmarks.",
+    )
+    ap.add_argument(
+        "-k",
+        "--filter",
+        metavar="REGEX",
+        help="Only run benchmarks whose name matches this regular expression.",
+    )
+    ap.add_argument(
+        "--quick",
+        action="store_true",
+        help="Take fewer, shorter timings. Less accurate, but much faster.",
+    )
+    ap.add_argument(
+        "--no-cli",
+        action="store_true",
+        help="Skip the command line benchmarks.",
+    )
+    ap.add_argument(
+        "--save",
+        metavar="PATH",
+        type=Path,
+        help="Save the results as JSON to this path.",
+    )
+    ap.add_argument(
+        "--compare",
+        metavar="PATH",
+        type=Path,
+        help="Compare the results against results saved by an earlier run. Exits with status 1 "
+        "if any benchmark regressed.",
+    )
+    ap.add_argument(
+        "--threshold",
+        metavar="PERCENT",
+        type=float,
+        default=10.0,
+        help="How much slower a benchmark may get before it counts as a regression. default: 10",
+    )
+    args = ap.parse_args()
+
+    old = None
+    if args.compare is not None:
+        # read this up front, so a bad path doesn't waste a whole run
+        try:
+            old = json.loads(args.compare.read_text())
+        except (OSError, ValueError) as ex:
+            print(f"ERROR: could not read {args.compare}: {ex}", file=sys.stderr)
+            raise SystemExit(1) from ex
+
+    results = run(args)
+
+    if args.save is not None:
+        args.save.write_text(
+            json.dumps(
+                {
+                    "version": RESULTS_VERSION,
+                    "commit": git_commit(),
+                    "time": time.time(),
+                    "python": platform.python_version(),
+                    "implementation": platform.python_implementation(),
+                    "machine": platform.machine(),
+                    "results": results,
+                },
+                indent=2,
+            )
+            + "\n"
+        )
+
+    if old is not None:
+        try:
+            ok = compare(old, results, args.threshold / 100)
+        except (KeyError, ValueError) as ex:
+            print(f"ERROR: could not compare against {args.compare}: {ex}", file=sys.stderr)
+            raise SystemExit(1) from ex
+        if not ok:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    bench_main()
@@ -0,0 +1,121 @@
+"""
+Vectorized operations for generating art for many hashes at once.
+
+This module requires NumPy, which is an optional dependency. Nothing else in colorhash imports this
+module, so the rest of the package keeps working (using the pure Python implementations) when NumPy
+is not installed.
+"""
+from typing import TYPE_CHECKING, Any, Iterable, Mapping
+
+from .matricizer import NibbleMatricizer, detect_hash_algorithm
+from .palettes import GRADIENT_PALETTES, Palette, compile_palette
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None  # type: ignore
+
+if TYPE_CHECKING:
+    import numpy.typing as npt
+
+    Array = npt.NDArray[Any]
+else:
+    Array = Any
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise ImportError("the colorhash bulk API requires NumPy to be installed")
+
+
+def digests_to_array(digests: Iterable[bytes]) -> Array:
+    """
+    Pack a collection of hashes into a 2D array suitable for the other functions in this module.
+
+    :param digests: the hashes to pack. All hashes must be the same length.
+    :returns: an (N, digest_len) uint8 array.
+    """
+    _require_numpy()
+    digests = list(digests)
+    if not digests:
+        raise ValueError("at least one hash is required")
+    length = len(digests[0])
+    if any(len(d) != length for d in digests):
+        raise ValueError("all hashes must be the same length")
+    return np.frombuffer(b"".join(digests), dtype=np.uint8).reshape(len(digests), length)
+
+
+def nibble_matrices(digests: Array) -> Array:
+    """
+    Vectorized equivalent of `NibbleMatricizer.matricize` for many hashes.
+
+    :param digests: an (N, digest_len) uint8 array of hashes.
+    :returns: an (N, h, w) uint8 array of matrices, using the `NibbleMatricizer.DIMENSIONS`
+              dimensions for the hash length.
+    """
+    _require_numpy()
+    digests = np.asarray(digests, dtype=np.uint8)
+    n, length = digests.shape
+    algo = detect_hash_algorithm(bytes(length))
+    if algo is None:
+        raise ValueError("unable to determine hash algorithm")
+    w, h = NibbleMatricizer.DIMENSIONS[algo]
+
+    nibbles = np.empty((n, length * 2), dtype=np.uint8)
+    nibbles[:, 0::2] = digests >> 4
+    nibbles[:, 1::2] = digests & 0x0F
+    return nibbles.reshape(n, h, w)
+
+
+def choose_palettes(
+    digests: Array, palettes: Mapping[str, Palette] | None = None
+) -> Array:
+    """
+    Vectorized equivalent of `Matricizer.choose_palette` for many hashes.
+
+    :param digests: an (N, digest_len) uint8 array of hashes.
+    :param palettes: the palettes to choose from. default: the palettes used by
+                     `NibbleMatricizer.choose_palette`.
+    :returns: an (N,) array of indices into `palettes.values()`.
+    """
+    _require_numpy()
+    if palettes is None:
+        palettes = GRADIENT_PALETTES
+    digests = np.asarray(digests, dtype=np.uint8)
+    return digests.sum(axis=1, dtype=np.int64) % len(palettes)
+
+
+def palette_table(palettes: Mapping[str, Palette]) -> Array:
+    """
+    Build an RGB lookup table for a set of palettes.
+
+    :param palettes: the palettes to build the table for.
+    :returns: a (P, C, 3) uint8 array, where P is the number of palettes and C is the length of the
+              longest palette.
+    """
+    _require_numpy()
+    compiled = [compile_palette(p) for p in palettes.values()]
+    table = np.zeros((len(compiled), max(len(p) for p in compiled), 3), dtype=np.uint8)
+    for i, palette in enumerate(compiled):
+        table[i, : len(palette)] = np.frombuffer(palette.rgb, dtype=np.uint8).reshape(-1, 3)
+    return table
+
+
+def render_rgb(digests: Array, palettes: Mapping[str, Palette] | None = None) -> Array:
+    """
+    Generate nibble art for many hashes at once, as RGB pixels.
+
+    Each cell of each matrix is one pixel, with the same colors that `PNGWriter` would use.
+
+    :param digests: an (N, digest_len) uint8 array of hashes.
+    :param palettes: the palettes to choose from. default: the palettes used by
+                     `NibbleMatricizer.choose_palette`.
+    :returns: an (N, h, w, 3) uint8 array of RGB pixels.
+    """
+    _require_numpy()
+    if palettes is None:
+        palettes = GRADIENT_PALETTES
+    matrices = nibble_matrices(digests)
+    choices = choose_palettes(digests, palettes)
+    table = palette_table(palettes)
+    return table[choices[:, None, None], matrices]
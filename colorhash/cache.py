@@ -0,0 +1,163 @@
+"Caching of rendered images."
+import collections
+import hashlib
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Callable, Hashable
+
+from .matricizer import Matricizer
+from .palettes import PALETTES, Palette, compile_palette
+from .writer import Writer
+
+RenderKey = tuple[Hashable, ...]
+
+# The version of the rendered output, which is part of every render key. Bump this whenever a
+# change makes any writer produce different output for the same input, so that images rendered by
+# an earlier version (e.g. in a --cache-dir) are not served again.
+CACHE_VERSION = 1
+
+
+def render_key(
+    data: bytes, matricizer: Matricizer, palette: Palette, writer: Writer
+) -> RenderKey:
+    """
+    Create the cache key for rendering a hash.
+
+    The key includes everything that affects the rendered image: `CACHE_VERSION`, the hash data,
+    the matricizer class, the resolved palette (by name if it is a built-in palette, otherwise by
+    its colors, since custom palettes may reuse names), the writer class and all of the writer's
+    options (including the square size).
+
+    :param data: the hash data.
+    :param matricizer: the matricizer used to turn the hash into a matrix.
+    :param palette: the palette chosen for the hash.
+    :param writer: the writer used to generate the image.
+    :returns: the cache key.
+    """
+    compiled = compile_palette(palette)
+    builtin = compiled.name is not None and PALETTES.get(compiled.name) is compiled
+    palette_key = compiled.name if builtin else compiled.html
+    writer_options = tuple(sorted(vars(writer).items()))
+    return (
+        CACHE_VERSION,
+        bytes(data),
+        type(matricizer).__qualname__,
+        palette_key,
+        type(writer).__qualname__,
+        writer_options,
+    )
+
+
+class RenderCache:
+    """
+    A bounded, least-recently-used cache of rendered images.
+
+    Optionally, rendered images are also stored on disk in a content-addressed directory (named by
+    the SHA-256 of the render key), so they can be reused between runs. The disk store is not
+    bounded; clear it by deleting the directory.
+    """
+
+    def __init__(self, maxsize: int = 1024, directory: Path | None = None) -> None:
+        """
+        Create a new render cache.
+
+        :param maxsize: the maximum number of images kept in memory.
+        :param directory: the directory of the on-disk store. If not supplied, images are only
+                          cached in memory.
+        """
+        self.maxsize = maxsize
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._entries: collections.OrderedDict[RenderKey, bytes] = (
+            collections.OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def _path(self, key: RenderKey) -> Path:
+        assert self.directory is not None
+        name = hashlib.sha256(repr(key).encode()).hexdigest()
+        return self.directory / name[:2] / name
+
+    def get(self, key: RenderKey) -> bytes | None:
+        """
+        Get a rendered image from the cache.
+
+        :param key: the render key, from `render_key`.
+        :returns: the rendered image, or None if it was not cached.
+        """
+        with self._lock:
+            output = self._entries.get(key)
+            if output is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return output
+
+        if self.directory is not None:
+            try:
+                output = self._path(key).read_bytes()
+            except FileNotFoundError:
+                pass
+            else:
+                self._remember(key, output)
+                with self._lock:
+                    self.hits += 1
+                return output
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: RenderKey, output: bytes) -> None:
+        """
+        Add a rendered image to the cache.
+
+        :param key: the render key, from `render_key`.
+        :param output: the rendered image.
+        """
+        self._remember(key, output)
+        if self.directory is not None:
+            path = self._path(key)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # write to a temporary file first, so other processes never see a partial image
+            fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+            try:
+                with os.fdopen(fd, "wb") as fp:
+                    fp.write(output)
+                os.replace(tmp, path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+
+    def get_or_render(self, key: RenderKey, render: Callable[[], bytes]) -> bytes:
+        """
+        Get a rendered image from the cache, rendering and caching it if it is not there.
+
+        :param key: the render key, from `render_key`.
+        :param render: a function that renders the image.
+        :returns: the rendered image.
+        """
+        output = self.get(key)
+        if output is None:
+            output = render()
+            self.put(key, output)
+        return output
+
+    def clear(self) -> None:
+        "Remove every image from the in-memory cache, and reset the hit and miss counters."
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def _remember(self, key: RenderKey, output: bytes) -> None:
+        with self._lock:
+            self._entries[key] = output
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
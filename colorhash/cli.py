@@ -1,23 +1,85 @@
 "Main driver for the colorhash program."
 import argparse
-import hashlib
+import contextlib
 import sys
 import textwrap
 from pathlib import Path
+from typing import TYPE_CHECKING, Callable, TextIO
 
-from .color import colorize
-from .matricizer import Matricizer, NibbleMatricizer, RandomartMatricizer
-from .palettes import PALETTES, Palette
+from .batch import (DEFAULT_MULTI_NAME_TEMPLATE, DEFAULT_NAME_TEMPLATE,
+                    DEFAULT_RECURSIVE_MULTI_NAME_TEMPLATE,
+                    DEFAULT_RECURSIVE_NAME_TEMPLATE, imap_ordered, iter_inputs,
+                    output_path)
+from .digest import hash_input
+from .palettes import PALETTES, PaletteSet
+from .pipeline import Renderer
+from .stream import DEFAULT_MAX_RECORD_SIZE, DELIMITERS
 from .writer import ANSIWriter, PNGWriter, SVGWriter, Writer
 
+if TYPE_CHECKING:
+    from .cache import RenderCache
+    from .digestcache import DigestCache
+    from .atlas import AtlasWriter
+    from .color import ColorMatrix
+    from .timings import Timings, TimingsSummary
+
 # TODO - option to add a caption based on the filename (for SVG)
-# TODO - load palettes from a file
+
+
+def watch_main(args: argparse.Namespace, renderer: Renderer) -> None:
+    "Run watch mode until interrupted."
+    # pylint: disable=import-outside-toplevel
+    import os
+
+    from .stream import write_frame
+    from .watch import watch
+
+    def on_change(digests: dict[str, bytes]) -> None:
+        for algo, hashdata in digests.items():
+            if str(args.out) != "-":
+                out: Path = args.out
+                if len(digests) > 1:
+                    out = out.with_name(f"{out.stem}-{algo}{out.suffix}")
+                # write next to the output and move it into place, so readers never see half of it
+                tmp = out.with_name(f".{out.name}.tmp")
+                with tmp.open("wb") as outfile:
+                    renderer.render_to(hashdata, outfile)
+                os.replace(tmp, out)
+            elif args.output_type != "ansi":
+                write_frame(sys.stdout.buffer, renderer.render(hashdata))
+            else:
+                if sys.stdout.isatty() and algo == args.hash[0]:
+                    # redraw in place
+                    sys.stdout.buffer.write(b"\x1b[H\x1b[2J")
+                if len(digests) > 1:
+                    sys.stdout.buffer.write(f"{algo}\n".encode())
+                renderer.render_to(hashdata, sys.stdout.buffer)
+                sys.stdout.buffer.write(b"\n")
+        sys.stdout.buffer.flush()
+
+    def on_error(ex: OSError) -> None:
+        print(f"ERROR: {args.input[0]}: {ex}", file=sys.stderr, flush=True)
+
+    watch(args.input[0], args.hash, on_change, args.interval, on_error=on_error)
 
 
 def cli_main() -> None:
     "Main function entrypoint."
+    with contextlib.ExitStack() as stack:
+        _cli_main(stack)
+
+
+def _cli_main(stack: contextlib.ExitStack) -> None:
+    "Run the program. Files opened for the whole run are closed by `stack`."
     # pylint: disable=invalid-name
 
+    if sys.argv[1:2] == ["serve"]:
+        # imported here so the one-shot CLI doesn't pay for asyncio
+        from .server import serve_main  # pylint: disable=import-outside-toplevel
+
+        serve_main(sys.argv[2:])
+        return
+
     MATRIX_CHOICES = {
         "nibble": "Use each nibble (4 bits) of the hash to generate a matrix",
         "randomart": "Use the SSH 'randomart' algorithm to generate a matrix",
@@ -41,8 +103,19 @@ def cli_main() -> None:
         ]
     )
     HASH_CHOICES = ["md5", "sha1", "sha224", "sha256", "sha384", "sha512"]
+
+    def hash_list(value: str) -> list[str]:
+        algos = value.split(",")
+        for algo in algos:
+            if algo not in HASH_CHOICES:
+                raise argparse.ArgumentTypeError(
+                    f"invalid choice: {algo!r} (choose from {', '.join(HASH_CHOICES)})"
+                )
+        return algos
     INPUT_TYPE_CHOICES = {
         "path": "the input should be treated as a path and data is read from the path",
+        "tree": "the input should be treated as a directory, fingerprinted as a whole (a hash of "
+        "the sorted names and hashes of everything in it; see colorhash.tree)",
         "hash": "the input should be treated as a hexadecimal hash (requires -a or --hash to be supplied)",
         "data": "the input should be treated as raw data",
     }
@@ -57,8 +130,23 @@ def cli_main() -> None:
     OUTPUT_TYPE_HELP = "OUTPUT TYPE (-y, --output-type)\n" + "\n".join(
         [f"     {choice} - {desc}" for choice, desc in OUTPUT_TYPE_CHOICES.items()]
     )
+    # names of the zlib strategy constants; zlib is only imported when writing a PNG
+    PNG_STRATEGY_CHOICES = {
+        "default": "Z_DEFAULT_STRATEGY",
+        "filtered": "Z_FILTERED",
+        "huffman": "Z_HUFFMAN_ONLY",
+        "rle": "Z_RLE",
+        "fixed": "Z_FIXED",
+    }
+    SUBCOMMAND_HELP = "\n".join(
+        [
+            "SUBCOMMANDS",
+            "    serve - run an HTTP server that renders art (see 'serve -h'). To use a file named",
+            "            'serve' as the input, use './serve' instead.",
+        ]
+    )
     EPILOGUE = "\n\n".join(
-        [MATRIX_HELP, PALETTE_HELP, INPUT_TYPE_HELP, OUTPUT_TYPE_HELP]
+        [MATRIX_HELP, PALETTE_HELP, INPUT_TYPE_HELP, OUTPUT_TYPE_HELP, SUBCOMMAND_HELP]
     )
 
     progname: str = sys.argv[0]
@@ -75,8 +163,8 @@ def cli_main() -> None:
     ap.add_argument(
         "input",
         type=str,
-        default="-",
-        help="The input to use. When acting as a path, set to '-' or blank for STDIN. Use -x or --input-type to control how input is treated. default: -",
+        nargs="*",
+        help="The input(s) to use. When acting as a path, set to '-' or blank for STDIN. Use -x or --input-type to control how input is treated. Giving more than one input enables batch mode. default: -",
     )
     ap.add_argument(
         "-o",
@@ -86,6 +174,153 @@ def cli_main() -> None:
         default="-",
         help="The output file to use. Set to '-' or blank for STDOUT. default: STDOUT",
     )
+    ap.add_argument(
+        "-O",
+        "--out-dir",
+        metavar="OUTDIR",
+        type=Path,
+        help="Batch mode: write one output per input into this directory, named using --name-template.",
+    )
+    ap.add_argument(
+        "--name-template",
+        metavar="TEMPLATE",
+        help="Batch mode: the file name template for outputs written to --out-dir. Available fields: "
+        "{name}, {stem}, {path} (the input's path, relative to the directory it was found in with "
+        "-r; may contain directories), {index}, {algo}, {matrix}, {ext}. default: "
+        + DEFAULT_NAME_TEMPLATE
+        + " (or "
+        + DEFAULT_MULTI_NAME_TEMPLATE
+        + " when several hash algorithms are used; with -r, "
+        + DEFAULT_RECURSIVE_NAME_TEMPLATE
+        + " or "
+        + DEFAULT_RECURSIVE_MULTI_NAME_TEMPLATE
+        + "). Two inputs that would be written to the same output are reported as errors.",
+    )
+    ap.add_argument(
+        "-r",
+        "--recursive",
+        action="store_true",
+        help="Batch mode: when an input path is a directory, use every file underneath it as an input.",
+    )
+    ap.add_argument(
+        "--files-from",
+        metavar="LISTFILE",
+        help="Batch mode: read additional newline-separated inputs from this file. Set to '-' for STDIN.",
+    )
+    ap.add_argument(
+        "--atlas",
+        metavar="PATH",
+        type=Path,
+        help="Batch mode: write every output into a single SVG or PNG image (a sprite sheet) at "
+        "this path, laid out in a grid, instead of one file per input. An index of where each "
+        "input is in the image is written as JSON to --atlas-index.",
+    )
+    ap.add_argument(
+        "--atlas-index",
+        metavar="PATH",
+        type=Path,
+        help="Where to write the --atlas index. default: the atlas path with a .json suffix",
+    )
+    ap.add_argument(
+        "--atlas-columns",
+        metavar="N",
+        type=int,
+        help="The number of tiles per row of the --atlas. default: enough to make it about square",
+    )
+    ap.add_argument(
+        "--atlas-gap",
+        metavar="SQUARES",
+        type=int,
+        default=1,
+        help="The space between tiles of the --atlas, in squares. default: 1",
+    )
+    ap.add_argument(
+        "--watch",
+        action="store_true",
+        help="Watch mode: keep watching the input file, and write the output again whenever its "
+        "hash changes. Only data appended since the last change is hashed, which assumes that the "
+        "file only grows or is rewritten near its end: other changes are only noticed if the file "
+        "also shrinks, is replaced, changes its first 4KiB or does not grow, and then it is "
+        "hashed again in full. Outputs to a file (-o) are replaced "
+        "atomically; SVG and PNG outputs to STDOUT are written as length-prefixed frames (see "
+        "--records). Stop with Ctrl-C.",
+    )
+    ap.add_argument(
+        "--interval",
+        metavar="SECONDS",
+        type=float,
+        default=1.0,
+        help="Watch mode: how long to wait between checks of the file. default: 1",
+    )
+    ap.add_argument(
+        "--records",
+        metavar="DELIMITER",
+        choices=DELIMITERS.keys(),
+        help="Streaming mode: read records from STDIN, delimited by newlines (lines) or NUL bytes "
+        "(nul), and render each one as soon as it arrives. Records are treated according to -x; "
+        "with -x hash, the hash algorithm of each record is detected from its length. ANSI output "
+        "is written as it is; SVG and PNG outputs are written as frames, each prefixed with its "
+        "length as a 32 bit big-endian integer (an empty frame means the record failed).",
+    )
+    ap.add_argument(
+        "--max-record-size",
+        metavar="BYTES",
+        type=int,
+        default=DEFAULT_MAX_RECORD_SIZE,
+        help="Streaming mode: the largest record accepted; longer records are skipped. "
+        f"default: {DEFAULT_MAX_RECORD_SIZE}",
+    )
+    ap.add_argument(
+        "-j",
+        "--jobs",
+        metavar="N",
+        type=int,
+        default=1,
+        help="Batch mode: hash up to N inputs in parallel. Outputs are still written in input order. "
+        "With -x tree and a single input: hash up to N files of the tree in parallel. default: 1",
+    )
+    ap.add_argument(
+        "--cache-dir",
+        metavar="DIR",
+        type=Path,
+        help="Cache rendered images in this directory, and reuse them when the same hash is rendered with the same options again.",
+    )
+    ap.add_argument(
+        "--cache-size",
+        metavar="N",
+        type=int,
+        default=1024,
+        help="The maximum number of rendered images to keep in memory when --cache-dir is used. default: 1024",
+    )
+    ap.add_argument(
+        "--digest-cache-size",
+        metavar="N",
+        type=int,
+        default=100_000,
+        help="The maximum number of file hashes to keep when --cache-dir is used. Unchanged files are not hashed again. default: 100000",
+    )
+    ap.add_argument(
+        "--clear-cache",
+        action="store_true",
+        help="Remove everything from --cache-dir before running.",
+    )
+    ap.add_argument(
+        "--timings",
+        metavar="FORMAT",
+        nargs="?",
+        const="text",
+        choices=["text", "json"],
+        help="Report the time spent in each stage (digest, cache, matricize, colorize, write) and "
+        "the bytes in and out. Batch mode reports percentiles over every input at the end. FORMAT "
+        "is text (default) or json, for JSON lines. Reports go to STDERR unless --timings-file is "
+        "given.",
+    )
+    ap.add_argument(
+        "--timings-file",
+        metavar="PATH",
+        type=Path,
+        help="Write --timings reports to this file instead of STDERR.",
+    )
     ap.add_argument(
         "-m",
         "--matrix",
@@ -98,25 +333,70 @@ def cli_main() -> None:
         "-p",
         "--palette",
         metavar="PALETTE",
-        choices=PALETTE_CHOICES,
         default="auto",
         help="Choose the palette. default: auto",
     )
+    ap.add_argument(
+        "--palette-file",
+        metavar="PATH",
+        type=Path,
+        action="append",
+        help="Load custom palettes from a JSON or TOML file (see colorhash.palettefile). May be "
+        "given more than once. Custom palettes can be chosen by name with -p, and -p auto chooses "
+        "from them instead of the built-in palettes. With --cache-dir, files are only parsed and "
+        "validated once.",
+    )
     ap.add_argument(
         "-a",  # the "a" is for "algorithm" (since -h is taken)
         "--hash",
         metavar="ALGORITHM",
-        choices=HASH_CHOICES,
+        type=hash_list,
+        action="extend",
         # default="sha512",
         required=False,
-        help="Choose the hash algorithm. default: sha512",
+        help="Choose the hash algorithm. Several algorithms may be given (e.g. -a md5,sha512 or "
+        "-a md5 -a sha512), in which case files are read once and one output is generated for "
+        "each algorithm. default: sha512",
     )
     ap.add_argument(
         "--square-size",
         metavar="PX",
         type=int,
         default=32,
-        help="For SVG outputs, decide how big the output squares are, in pixels. default: 32",
+        help="For SVG and PNG outputs, decide how big the output squares are, in pixels. default: 32",
+    )
+    ap.add_argument(
+        "--ansi-colors",
+        choices=["truecolor", "256", "16"],
+        default="truecolor",
+        help="For ANSI outputs, the colors supported by the terminal. Other colors are approximated. default: truecolor",
+    )
+    ap.add_argument(
+        "--svg-compact",
+        action="store_true",
+        help="For SVG outputs, generate a compact SVG with one path per color instead of one rect per square.",
+    )
+    ap.add_argument(
+        "--png-level",
+        metavar="LEVEL",
+        type=int,
+        choices=range(-1, 10),
+        default=-1,
+        help="For PNG outputs, the zlib compression level (0-9, or -1 for the zlib default). default: -1",
+    )
+    ap.add_argument(
+        "--png-strategy",
+        metavar="STRATEGY",
+        choices=PNG_STRATEGY_CHOICES.keys(),
+        default="default",
+        help="For PNG outputs, the zlib compression strategy, one of: "
+        + ", ".join(PNG_STRATEGY_CHOICES)
+        + ". default: default",
+    )
+    ap.add_argument(
+        "--png-scale-hint",
+        action="store_true",
+        help="For PNG outputs, draw each square as a single pixel and ask viewers to scale it up to --square-size instead.",
     )
     ap.add_argument(
         "-x",
@@ -138,73 +418,327 @@ def cli_main() -> None:
     # End arg parsing
     ############################################################################
 
-    # -a/--hash arg is not required when we're using file and data input types. only required for
-    # hash input type
-    if args.input_type in ("data", "path") and args.hash is None:
-        args.hash = "sha512"
+    # -a/--hash arg is not required when we're using file, tree and data input types. only required
+    # for hash input type
+    if args.input_type in ("data", "path", "tree") and args.hash is None:
+        args.hash = ["sha512"]
 
-    # Get the hash
-    match args.input_type:
-        case "path":
-            if args.input == "-":
-                infile = sys.stdin.buffer
-            else:
-                # TODO - pretty error message for when the file doesn't exist
-                infile = open(args.input, "rb")  # pylint: disable=consider-using-with
-            # file_digest (I hope) will not load too much into memory
-            hashdata = hashlib.file_digest(infile, args.hash).digest()  # type: ignore
-            # NOTE : previous line has typing ignored because file_digest requires a
-            # "_BytesIOLike | _FileDigestFileObj", both of which look like API leaks. Specifying
-            # infile to be BinaryIO is not enough and causes the same error.
-        case "hash":
-            # TODO - maybe a better error message?
-            if args.hash is None:
-                print(
-                    "ERROR: -a or --hash should be supplied on the command line when using the hash input type",
-                    file=sys.stderr,
-                )
-                raise SystemExit(1)
-            # TODO - pretty error message for malformed input
-            hashdata = bytes([int(byte, 16) for byte in textwrap.wrap(args.input, 2)])
-        case "data":
-            hashdata = hashlib.new(args.hash, args.input.encode()).digest()
-        case _:
-            assert False, f"unknown input type {args.input_type}"
-
-    # Choose the dimensions and the matricizer
-    matricizer: Matricizer
-    match args.matrix:
-        case "nibble":
-            matricizer = NibbleMatricizer()
-        case "randomart":
-            matricizer = RandomartMatricizer()
-        case _:
-            assert False, f"invalid args.matrix: {args.matrix}"
-
-    # Choose the palette
-    palette: Palette
-    if args.palette == "auto":
-        palette = matricizer.choose_palette(hashdata)
-    else:
-        palette = PALETTES[args.palette]
-
-    # Matricize and colorize
-    matrix = matricizer.matricize(hashdata)
-    colors = colorize(palette, matrix)
+    if args.records is not None and (
+        args.input not in ([], ["-"])
+        or args.files_from is not None
+        or args.recursive
+        or args.out_dir is not None
+    ):
+        print(
+            "ERROR: --records reads from STDIN, and cannot be combined with inputs, --files-from, "
+            "-r or -O",
+            file=sys.stderr,
+        )
+        raise SystemExit(1)
+
+    if not args.input and args.files_from is None:
+        args.input = ["-"]
+
+    if args.records is not None and args.input_type == "hash":
+        # the algorithm of each record is detected from its length
+        args.hash = args.hash or ["sha512"]
+
+    if args.input_type == "hash" and args.hash is None:
+        # TODO - maybe a better error message?
+        print(
+            "ERROR: -a or --hash should be supplied on the command line when using the hash input type",
+            file=sys.stderr,
+        )
+        raise SystemExit(1)
+
+    if args.input_type == "hash" and len(args.hash) > 1:
+        print(
+            "ERROR: only one -a or --hash may be supplied when using the hash input type",
+            file=sys.stderr,
+        )
+        raise SystemExit(1)
+
+    # remove duplicate algorithms, keeping the order they were given in
+    args.hash = list(dict.fromkeys(args.hash))
 
     # Choose the output writer
     writer: Writer
     match args.output_type:
         case "ansi":
-            writer = ANSIWriter()
+            writer = ANSIWriter(args.ansi_colors)
         case "svg":
-            writer = SVGWriter(args.square_size)
+            writer = SVGWriter(args.square_size, compact=args.svg_compact)
         case "png":
-            writer = PNGWriter(args.square_size)
+            import zlib  # pylint: disable=import-outside-toplevel
+
+            writer = PNGWriter(
+                args.square_size,
+                compression_level=args.png_level,
+                strategy=getattr(zlib, PNG_STRATEGY_CHOICES[args.png_strategy]),
+                scale_hint=args.png_scale_hint,
+            )
+
+    cache: "RenderCache | None" = None
+    digest_cache: "DigestCache | None" = None
+    if args.cache_dir is not None:
+        # imported here so runs without caching don't pay for them
+        # pylint: disable=import-outside-toplevel
+        from .cache import RenderCache
+        from .digestcache import DigestCache
+
+        if args.clear_cache:
+            import shutil
+
+            shutil.rmtree(args.cache_dir / "renders", ignore_errors=True)
+            shutil.rmtree(args.cache_dir / "palettes", ignore_errors=True)
+        cache = RenderCache(args.cache_size, args.cache_dir / "renders")
+        # closed when the run ends, which saves the hashes it queued
+        digest_cache = stack.enter_context(
+            DigestCache(args.cache_dir / "digests.sqlite3", args.digest_cache_size)
+        )
+        if args.clear_cache:
+            digest_cache.clear()
+
+    palettes: "PaletteSet | None" = None
+    if args.palette_file:
+        from .palettefile import load_palette_files  # pylint: disable=import-outside-toplevel
+
+        try:
+            palettes = load_palette_files(args.palette_file, args.cache_dir)
+        except (OSError, ValueError) as ex:
+            print(f"ERROR: {ex}", file=sys.stderr)
+            raise SystemExit(1) from ex
+    if args.palette not in PALETTE_CHOICES and (palettes is None or args.palette not in palettes):
+        choices = PALETTE_CHOICES + [name for name in palettes or [] if name not in PALETTES]
+        ap.error(
+            f"argument -p/--palette: invalid choice: {args.palette!r} "
+            f"(choose from {', '.join(map(repr, choices))})"
+        )
+
+    batch = (
+        len(args.input) > 1
+        or args.out_dir is not None
+        or args.files_from is not None
+        or args.recursive
+        or args.records is not None
+        or args.atlas is not None
+    )
+
+    summary: "TimingsSummary | None" = None
+    on_timings: "Callable[[Timings], None] | None" = None
+    timings_file: TextIO = sys.stderr
+    if args.timings is not None:
+        # pylint: disable=import-outside-toplevel
+        from .timings import Timings, TimingsSummary, json_line
+
+        if args.timings_file is not None:
+            timings_file = stack.enter_context(args.timings_file.open("w"))
+        if batch:
+            summary = TimingsSummary()
+
+        def on_timings(timings: "Timings") -> None:
+            if summary is not None:
+                summary.add(timings)
+            if args.timings == "json":
+                print(json_line("render", timings.as_dict()), file=timings_file, flush=True)
+            elif not batch:
+                print(timings.format(), file=timings_file)
+
+    def report_summary() -> None:
+        if summary is None:
+            return
+        if args.timings == "json":
+            print(json_line("summary", summary.as_dict()), file=timings_file)
+        else:
+            print(summary.format(), file=timings_file)
+
+    def algo_timings(base: "Timings | None", algo: str, first: bool) -> "Timings | None":
+        # every algorithm gets its own timings; the input was read once, so that goes with the first
+        if base is None:
+            return None
+        timings = Timings(base.item, algo)
+        if first:
+            timings.bytes_in = base.bytes_in
+            timings.stages.update(base.stages)
+        return timings
+
+    renderer = Renderer(
+        args.matrix, args.palette, writer, cache=cache, on_timings=on_timings, palettes=palettes
+    )
+
+    if args.records is not None:
+        # pylint: disable=import-outside-toplevel
+        from .stream import render_stream
+
+        def on_error(index: int, message: str) -> None:
+            print(f"ERROR: record {index}: {message}", file=sys.stderr)
+
+        outfile = sys.stdout.buffer if str(args.out) == "-" else args.out.open("wb")
+        try:
+            failures = render_stream(
+                sys.stdin.buffer,
+                outfile,
+                renderer,
+                args.input_type,
+                args.hash,
+                frames=args.output_type != "ansi",
+                delimiter=DELIMITERS[args.records],
+                max_size=args.max_record_size,
+                on_error=on_error,
+                make_timings=Timings if on_timings is not None else None,
+            )
+        finally:
+            if outfile is not sys.stdout.buffer:
+                outfile.close()
+        report_summary()
+        if failures:
+            raise SystemExit(1)
+        return
+
+    if args.watch:
+        if batch or args.input_type != "path" or args.input[0] == "-":
+            print(
+                "ERROR: --watch requires a single file input, with -x path",
+                file=sys.stderr,
+            )
+            raise SystemExit(1)
+        try:
+            watch_main(args, renderer)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    if not batch:
+        base = Timings(args.input[0]) if on_timings is not None else None
+        try:
+            digests = hash_input(
+                args.input[0], args.input_type, args.hash, digest_cache, base, args.jobs
+            )
+        except (OSError, ValueError) as ex:
+            print(f"ERROR: {args.input[0]}: {ex}", file=sys.stderr)
+            raise SystemExit(1) from ex
+        for i, (algo, hashdata) in enumerate(digests.items()):
+            timings = algo_timings(base, algo, i == 0)
+            if str(args.out) == "-":
+                if len(digests) > 1:
+                    sys.stdout.buffer.write(f"{algo}\n".encode())
+                renderer.render_to(hashdata, sys.stdout.buffer, timings)
+                if len(digests) > 1:
+                    sys.stdout.buffer.write(b"\n")
+            else:
+                out: Path = args.out
+                if len(digests) > 1:
+                    # one output per algorithm, e.g. out.svg -> out-md5.svg
+                    out = out.with_name(f"{out.stem}-{algo}{out.suffix}")
+                with out.open("wb") as outfile:
+                    renderer.render_to(hashdata, outfile, timings)
+        return
+
+    atlas: "AtlasWriter | None" = None
+    tiles: list[ColorMatrix] = []
+    tile_names: list[str] = []
+    if args.atlas is not None:
+        if args.output_type == "ansi" or args.out_dir is not None:
+            print(
+                "ERROR: --atlas requires -y svg or -y png, and cannot be combined with -O",
+                file=sys.stderr,
+            )
+            raise SystemExit(1)
+        # pylint: disable=import-outside-toplevel
+        from .atlas import PNGAtlasWriter, SVGAtlasWriter
+
+        if args.output_type == "svg":
+            atlas = SVGAtlasWriter(args.square_size, args.atlas_columns, args.atlas_gap)
+        else:
+            import zlib
+
+            atlas = PNGAtlasWriter(
+                args.square_size,
+                args.atlas_columns,
+                args.atlas_gap,
+                compression_level=args.png_level,
+                strategy=getattr(zlib, PNG_STRATEGY_CHOICES[args.png_strategy]),
+            )
+    elif args.out_dir is None and args.output_type != "ansi":
+        print(
+            "ERROR: -O or --out-dir should be supplied on the command line when using batch mode "
+            "with svg or png output",
+            file=sys.stderr,
+        )
+        raise SystemExit(1)
+    if args.out_dir is not None:
+        args.out_dir.mkdir(parents=True, exist_ok=True)
+
+    name_template = args.name_template
+    if name_template is None:
+        if args.recursive:
+            name_template = (
+                DEFAULT_RECURSIVE_NAME_TEMPLATE
+                if len(args.hash) == 1
+                else DEFAULT_RECURSIVE_MULTI_NAME_TEMPLATE
+            )
+        else:
+            name_template = (
+                DEFAULT_NAME_TEMPLATE if len(args.hash) == 1 else DEFAULT_MULTI_NAME_TEMPLATE
+            )
+
+    def hash_item(entry: tuple[str, str]) -> "tuple[dict[str, bytes], Timings | None]":
+        item = entry[0]
+        base = Timings(item) if on_timings is not None else None
+        return hash_input(item, args.input_type, args.hash, digest_cache, base), base
+
+    # the input each output was written for, so two inputs never silently share an output
+    written: dict[Path, tuple[int, str]] = {}
+    failed = False
+    results = imap_ordered(
+        hash_item, iter_inputs(args.input, args.files_from, args.recursive), args.jobs
+    )
+    for index, ((item, relpath), result, error) in enumerate(results):
+        try:
+            if error is not None:
+                raise error
+            assert result is not None
+            digests, base = result
+            for i, (algo, hashdata) in enumerate(digests.items()):
+                timings = algo_timings(base, algo, i == 0)
+                if atlas is not None:
+                    tiles.append(renderer.colorize(hashdata))
+                    tile_names.append(item if len(digests) == 1 else f"{item} ({algo})")
+                elif args.out_dir is None:
+                    label = item if len(digests) == 1 else f"{item} ({algo})"
+                    sys.stdout.buffer.write(f"{label}\n".encode())
+                    renderer.render_to(hashdata, sys.stdout.buffer, timings)
+                    sys.stdout.buffer.write(b"\n")
+                    sys.stdout.buffer.flush()
+                else:
+                    out = output_path(
+                        args.out_dir,
+                        name_template,
+                        item,
+                        index,
+                        relpath,
+                        algo=algo,
+                        matrix=args.matrix,
+                        ext=args.output_type,
+                    )
+                    first, other = written.setdefault(out, (index, item))
+                    if first != index:
+                        raise ValueError(f"{out} was already written for {other}")
+                    out.parent.mkdir(parents=True, exist_ok=True)
+                    with out.open("wb") as outfile:
+                        renderer.render_to(hashdata, outfile, timings)
+        except (OSError, ValueError) as ex:
+            print(f"ERROR: {item}: {ex}", file=sys.stderr)
+            failed = True
+
+    if atlas is not None and tiles:
+        import json  # pylint: disable=import-outside-toplevel
+
+        args.atlas.write_bytes(atlas.write(tiles))
+        index_path = args.atlas_index or args.atlas.with_suffix(".json")
+        index_path.write_text(json.dumps(atlas.index(tiles, tile_names), indent=2) + "\n")
 
-    output = writer.write(colors)
+    report_summary()
 
-    if str(args.out) == "-":
-        sys.stdout.buffer.write(output)
-    else:
-        args.out.write_bytes(output)
+    if failed:
+        raise SystemExit(1)
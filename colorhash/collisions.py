@@ -0,0 +1,443 @@
+"""
+Finding hashes whose art looks the same, or nearly the same.
+
+Different hashes can render identically: the art only depends on the matrix and the chosen
+palette, and palettes are chosen from a small set (see "Weaknesses" in the README). This module
+indexes a collection of hashes by what they render to, and reports groups that collide:
+
+* identical - every cell is the same color. Renders are bucketed by a signature of their cell
+  colors, so this is a single pass plus a sort.
+* near - at most `max_distance` cells differ by more than `tolerance` (in any of R, G or B).
+  Candidates are found with locality-sensitive hashing: each of `bands` bands samples `band_size`
+  cells at random and buckets renders by those cells' colors, coarsely quantized (with a different
+  random offset per band, so colors near a quantization boundary land together in some bands).
+  Renders that are close share a bucket in at least one band with high probability, while
+  unrelated renders almost never do. Only renders that share a bucket are compared cell by cell.
+
+  The tolerance is meant for colors that look the same, such as the same color in two palettes; the
+  neighbouring colors of a palette are further apart than the default, so they count as different.
+
+Both take O(N log N) time and O(N * bands) memory for N hashes, instead of comparing every pair.
+Near groups may miss a pair now and then, as LSH does; more bands, or fewer cells per band, miss
+fewer pairs at the cost of more comparisons.
+
+The index can be run over a list of hashes, one per line, such as the output of `sha256sum`:
+
+    sha256sum keys/* | python -m colorhash.collisions
+"""
+import argparse
+import contextlib
+import functools
+import itertools
+import json
+import operator
+import random
+import sys
+from array import array
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Sequence, TextIO
+
+from .matricizer import detect_hash_algorithm
+from .palettes import CompiledPalette, PaletteSet, compile_palette
+from .pipeline import Renderer
+
+# The width of each bucket of the quantized colors used for LSH, per channel.
+QUANTUM = 64
+
+DEFAULT_BANDS = 16
+DEFAULT_BAND_SIZE = 16
+DEFAULT_MAX_DISTANCE = 4
+DEFAULT_TOLERANCE = 8
+
+# Within a large LSH bucket, each render is only compared against this many of the renders after it,
+# so that a bucket of M renders costs O(M) comparisons instead of O(M^2). Large buckets are sorted
+# by another band first, so the renders in the window are the likeliest to be near.
+BUCKET_WINDOW = 16
+
+# The number of renders kept in memory while comparing near candidates.
+PLANES_CACHE_SIZE = 1 << 16
+
+
+class _Planes:
+    "The colors of every cell of a render, as one plane per channel."
+
+    __slots__ = ("width", "height", "r", "g", "b", "bits")
+
+    def __init__(self, width: int, height: int, r: bytes, g: bytes, b: bytes) -> None:
+        self.width = width
+        self.height = height
+        self.r = r
+        self.g = g
+        self.b = b
+        # the planes as integers, for comparing whole planes at once
+        self.bits = tuple(int.from_bytes(plane, "big") for plane in (r, g, b))
+
+    def signature(self) -> bytes:
+        return b"".join(
+            [self.width.to_bytes(2, "big"), self.height.to_bytes(2, "big"), self.r, self.g, self.b]
+        )
+
+
+class CollisionIndex:
+    """
+    An index of hashes by the art they render to.
+
+    Each distinct hash is stored once, along with the names it was added under. Hashes of
+    different lengths may be mixed; they never collide with each other, since their art has
+    different dimensions.
+    """
+
+    def __init__(
+        self,
+        matrix: str = "nibble",
+        palette: str = "auto",
+        palettes: PaletteSet | None = None,
+        bands: int = DEFAULT_BANDS,
+        band_size: int = DEFAULT_BAND_SIZE,
+        seed: int = 0,
+    ) -> None:
+        """
+        Create a new, empty index.
+
+        :param matrix: the name of the matricizer ("nibble" or "randomart").
+        :param palette: the palette, or "auto" (see `Renderer`).
+        :param palettes: custom palettes (see `Renderer`).
+        :param bands: the number of LSH bands, for finding near collisions.
+        :param band_size: the number of cells sampled by each band.
+        :param seed: the seed for choosing the cells of each band.
+        """
+        self.renderer = Renderer(matrix, palette, "ansi", palettes=palettes)
+        self.bands = bands
+        self.band_size = band_size
+        # the distinct hashes, and the names each one was added under
+        self.digests: list[bytes] = []
+        self.names: list[list[str]] = []
+        self._positions: dict[bytes, int] = {}
+        # the exact signature of every render, and its key in every band, as (64 bit) hashes
+        self._signatures = array("q")
+        self._band_keys = [array("q") for _ in range(bands)]
+        rng = random.Random(seed)
+        self._offsets = [rng.randrange(QUANTUM) for _ in range(bands)]
+        self._quantize = [
+            bytes.maketrans(bytes(range(256)), bytes((v + offset) // QUANTUM for v in range(256)))
+            for offset in self._offsets
+        ]
+        self._band_seeds = [rng.getrandbits(64) for _ in range(bands)]
+        self._samplers: dict[tuple[int, int], list[Callable]] = {}
+        self._tables: dict[int, tuple[CompiledPalette, bytes, bytes, bytes]] = {}
+
+    def __len__(self) -> int:
+        return len(self.digests)
+
+    def _planes(self, digest: bytes) -> _Planes:
+        matrix = self.renderer.matricizer.matricize(digest)
+        palette = compile_palette(self.renderer.choose_palette(digest))
+        tables = self._tables.get(id(palette))
+        if tables is None:
+            # translation tables from matrix values to each channel; the palette is kept so that
+            # its id can't be reused
+            rgb = palette.rgb.ljust(256 * 3, b"\0")
+            tables = self._tables[id(palette)] = (palette, rgb[0::3], rgb[1::3], rgb[2::3])
+        _, r, g, b = tables
+        data = bytes(matrix.data)
+        return _Planes(
+            matrix.width, matrix.height, data.translate(r), data.translate(g), data.translate(b)
+        )
+
+    def _band_samplers(self, width: int, height: int) -> list[Callable]:
+        # the cells sampled by each band, as itemgetters; they only depend on the dimensions
+        samplers = self._samplers.get((width, height))
+        if samplers is None:
+            cells = width * height
+            samplers = []
+            for band_seed in self._band_seeds:
+                rng = random.Random(band_seed ^ cells)
+                positions = sorted(rng.sample(range(cells), min(self.band_size, cells)))
+                samplers.append(operator.itemgetter(*positions, positions[0]))
+            self._samplers[(width, height)] = samplers
+        return samplers
+
+    def add(self, digest: bytes, name: str | None = None) -> None:
+        """
+        Add a hash to the index.
+
+        :param digest: the hash.
+        :param name: the name of the hash, such as the name of the file or key it belongs to.
+                     default: the hash in hexadecimal.
+        """
+        digest = bytes(digest)
+        name = name if name is not None else digest.hex()
+        position = self._positions.get(digest)
+        if position is not None:
+            self.names[position].append(name)
+            return
+        if detect_hash_algorithm(digest) is None:
+            raise ValueError(f"unable to determine hash algorithm of a {len(digest)} byte hash")
+        planes = self._planes(digest)
+        self._positions[digest] = len(self.digests)
+        self.digests.append(digest)
+        self.names.append([name])
+        self._signatures.append(hash(planes.signature()))
+        dims = (planes.width, planes.height)
+        for keys, quantize, sampler in zip(
+            self._band_keys, self._quantize, self._band_samplers(*dims)
+        ):
+            # the extra (repeated) first position makes sure itemgetter always returns a tuple
+            key = (
+                sampler(planes.r.translate(quantize))
+                + sampler(planes.g.translate(quantize))
+                + sampler(planes.b.translate(quantize))
+            )
+            keys.append(hash((dims, key)))
+
+    @staticmethod
+    def _buckets(keys: Sequence[int], items: Iterable[int]) -> Iterator[list[int]]:
+        # the items with equal keys, for every key with more than one item
+        ordered = sorted(items, key=keys.__getitem__)
+        start = 0
+        for end in range(1, len(ordered) + 1):
+            if end == len(ordered) or keys[ordered[end]] != keys[ordered[start]]:
+                if end - start > 1:
+                    yield ordered[start:end]
+                start = end
+
+    def identical(self) -> list[list[int]]:
+        """
+        Find the hashes that render identically.
+
+        :returns: groups of (the positions in `digests` of) hashes with identical art, each in the
+                  order they were added, ordered by their first hash.
+        """
+        groups = []
+        for bucket in self._buckets(self._signatures, range(len(self.digests))):
+            # the signatures are hashes, so make sure the renders really are identical
+            exact: dict[bytes, list[int]] = {}
+            for i in bucket:
+                exact.setdefault(self._planes(self.digests[i]).signature(), []).append(i)
+            groups += [sorted(group) for group in exact.values() if len(group) > 1]
+        return sorted(groups)
+
+    def near(
+        self, max_distance: int = DEFAULT_MAX_DISTANCE, tolerance: int = DEFAULT_TOLERANCE
+    ) -> list[list[int]]:
+        """
+        Find the hashes that render nearly identically.
+
+        :param max_distance: the most cells that may differ for two renders to count as near.
+        :param tolerance: how far apart two colors may be, in any of R, G or B, and still count as
+                          the same.
+        :returns: groups of (the positions in `digests` of) hashes that are connected by near
+                  renders, each in the order they were added, ordered by their first hash. Hashes
+                  with identical art are included in the same group, but groups where every render
+                  is identical are left out (see `identical`).
+        """
+        parents = list(range(len(self.digests)))
+
+        def find(i: int) -> int:
+            while parents[i] != i:
+                parents[i] = parents[parents[i]]
+                i = parents[i]
+            return i
+
+        def union(i: int, j: int) -> None:
+            i, j = find(i), find(j)
+            parents[max(i, j)] = min(i, j)
+
+        # identical renders are merged up front, and only one of each is compared
+        identical = self.identical()
+        for group in identical:
+            for i in group[1:]:
+                union(group[0], i)
+        representatives = [i for i in range(len(self.digests)) if find(i) == i]
+
+        @functools.lru_cache(maxsize=PLANES_CACHE_SIZE)
+        def planes(i: int) -> _Planes:
+            return self._planes(self.digests[i])
+
+        def is_near(a: _Planes, b: _Planes) -> bool:
+            if (a.width, a.height) != (b.width, b.height):
+                return False
+            # find the cells that differ at all, a whole plane at a time
+            size = len(a.r)
+            (r1, g1, b1), (r2, g2, b2) = a.bits, b.bits
+            changed = ((r1 ^ r2) | (g1 ^ g2) | (b1 ^ b2)).to_bytes(size, "big")
+            if size - changed.count(0) <= max_distance:
+                return True
+            if tolerance == 0:
+                return False
+            distance = 0
+            for cell in itertools.compress(range(size), changed):
+                if (
+                    abs(a.r[cell] - b.r[cell]) > tolerance
+                    or abs(a.g[cell] - b.g[cell]) > tolerance
+                    or abs(a.b[cell] - b.b[cell]) > tolerance
+                ):
+                    distance += 1
+                    if distance > max_distance:
+                        return False
+            return True
+
+        for band, keys in enumerate(self._band_keys):
+            for bucket in self._buckets(keys, representatives):
+                if len(bucket) > BUCKET_WINDOW + 1:
+                    # renders that also share the next band's bucket end up next to each other
+                    bucket.sort(key=self._band_keys[(band + 1) % self.bands].__getitem__)
+                for n, i in enumerate(bucket):
+                    for j in bucket[n + 1 : n + 1 + BUCKET_WINDOW]:
+                        if find(i) != find(j) and is_near(planes(i), planes(j)):
+                            union(i, j)
+
+        groups: dict[int, list[int]] = {}
+        for i in range(len(self.digests)):
+            groups.setdefault(find(i), []).append(i)
+        exact = {tuple(group) for group in identical}
+        return sorted(
+            group for group in groups.values() if len(group) > 1 and tuple(group) not in exact
+        )
+
+
+def parse_line(line: str) -> tuple[bytes, str | None]:
+    """
+    Parse a line of a hash list: a hexadecimal hash, optionally followed by whitespace and a name
+    (as written by `sha256sum` and friends).
+
+    :param line: the line, without the line ending.
+    :returns: the hash, and its name if there is one.
+    :raises ValueError: if the line does not start with a hexadecimal hash.
+    """
+    hexdigest, name = (line.strip().split(None, 1) + [""])[:2]
+    # sha256sum marks files read in binary mode with a "*"
+    name = name[1:] if name.startswith("*") else name
+    return bytes.fromhex(hexdigest), name or None
+
+
+def _write_groups(
+    out: TextIO, kind: str, groups: list[list[int]], index: CollisionIndex, as_json: bool
+) -> None:
+    for group in groups:
+        if as_json:
+            members = [{"hash": index.digests[i].hex(), "names": index.names[i]} for i in group]
+            print(json.dumps({"type": kind, "hashes": members}), file=out)
+        else:
+            print(f"{kind} ({len(group)} hashes):", file=out)
+            for i in group:
+                print(f"    {index.digests[i].hex()}  {', '.join(index.names[i])}", file=out)
+
+
+def main(argv: list[str] | None = None) -> None:
+    "Find colliding art in lists of hashes."
+    ap = argparse.ArgumentParser(
+        prog="python -m colorhash.collisions",
+        description="Find hashes whose art looks the same or nearly the same. Reads hashes in "
+        "hexadecimal, one per line, optionally followed by a name (like the output of sha256sum).",
+    )
+    ap.add_argument(
+        "input",
+        type=Path,
+        nargs="*",
+        help="Files listing the hashes. default: STDIN",
+    )
+    ap.add_argument(
+        "-m",
+        "--matrix",
+        choices=["nibble", "randomart"],
+        default="nibble",
+        help="The strategy that turns hashes into matrices. default: nibble",
+    )
+    ap.add_argument("-p", "--palette", default="auto", help="The palette. default: auto")
+    ap.add_argument(
+        "--palette-file",
+        metavar="PATH",
+        type=Path,
+        action="append",
+        help="Load custom palettes from a file, as for the colorhash program.",
+    )
+    ap.add_argument(
+        "--max-distance",
+        metavar="CELLS",
+        type=int,
+        default=DEFAULT_MAX_DISTANCE,
+        help="The most cells that may differ for art to count as nearly the same. "
+        f"default: {DEFAULT_MAX_DISTANCE}",
+    )
+    ap.add_argument(
+        "--tolerance",
+        metavar="N",
+        type=int,
+        default=DEFAULT_TOLERANCE,
+        help="How far apart (0-255, in any of R, G or B) two colors may be and still count as the "
+        f"same. default: {DEFAULT_TOLERANCE}",
+    )
+    ap.add_argument(
+        "--bands",
+        metavar="N",
+        type=int,
+        default=DEFAULT_BANDS,
+        help=f"The number of LSH bands. More bands miss fewer near pairs. default: {DEFAULT_BANDS}",
+    )
+    ap.add_argument(
+        "--band-size",
+        metavar="N",
+        type=int,
+        default=DEFAULT_BAND_SIZE,
+        help=f"The number of cells sampled by each LSH band. default: {DEFAULT_BAND_SIZE}",
+    )
+    ap.add_argument(
+        "--identical-only",
+        action="store_true",
+        help="Only look for identical art.",
+    )
+    ap.add_argument(
+        "--json",
+        action="store_true",
+        help="Write each group as a line of JSON.",
+    )
+    args = ap.parse_args(argv)
+
+    palettes = None
+    if args.palette_file:
+        # pylint: disable=import-outside-toplevel
+        from .palettefile import load_palette_files
+
+        try:
+            palettes = load_palette_files(args.palette_file)
+        except (OSError, ValueError) as ex:
+            print(f"ERROR: {ex}", file=sys.stderr)
+            raise SystemExit(1) from ex
+    try:
+        index = CollisionIndex(
+            args.matrix, args.palette, palettes, bands=args.bands, band_size=args.band_size
+        )
+    except ValueError as ex:
+        print(f"ERROR: {ex}", file=sys.stderr)
+        raise SystemExit(1) from ex
+
+    failed = False
+    for path in args.input or [Path("-")]:
+        name = "STDIN" if str(path) == "-" else str(path)
+        with contextlib.nullcontext(sys.stdin) if str(path) == "-" else path.open() as fp:
+            for lineno, line in enumerate(fp, 1):
+                if not line.strip():
+                    continue
+                try:
+                    index.add(*parse_line(line))
+                except ValueError as ex:
+                    print(f"ERROR: {name}, line {lineno}: {ex}", file=sys.stderr)
+                    failed = True
+
+    identical = index.identical()
+    _write_groups(sys.stdout, "identical", identical, index, args.json)
+    near = []
+    if not args.identical_only:
+        near = index.near(args.max_distance, args.tolerance)
+        _write_groups(sys.stdout, "near", near, index, args.json)
+    print(
+        f"{len(index)} hashes: {len(identical)} identical groups, {len(near)} near groups",
+        file=sys.stderr,
+    )
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
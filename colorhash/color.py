@@ -1,11 +1,10 @@
 import abc
 import colorsys
-import dataclasses
-from typing import Sequence, TYPE_CHECKING
+from typing import Sequence, TYPE_CHECKING, overload
 
 
 if TYPE_CHECKING:
-    from .palettes import Palette
+    from .palettes import CompiledPalette, Palette
     from .matricizer import Matrix
 
 
@@ -34,15 +33,33 @@ class Color(metaclass=abc.ABCMeta):
         "Convert this color into an HSL color."
 
 
-@dataclasses.dataclass
+# NOTE : RGBColor and HSLColor are plain classes rather than dataclasses, because importing and
+# applying dataclasses costs more than everything else that happens when rendering a single hash.
+# They keep the dataclass constructor, repr, equality and positional `match` patterns, but
+# `dataclasses.replace`, `asdict` and `fields` no longer work on them; use the attributes instead.
+
+
 class RGBColor(Color):
     """
     An RGB color. Colors are expected to be a floating point value from [0.0-255.0).
     """
 
-    r: float
-    g: float
-    b: float
+    __match_args__ = ("r", "g", "b")
+
+    def __init__(self, r: float, g: float, b: float) -> None:
+        self.r = r
+        self.g = g
+        self.b = b
+
+    def __repr__(self) -> str:
+        return f"RGBColor(r={self.r!r}, g={self.g!r}, b={self.b!r})"
+
+    def __eq__(self, other: object) -> bool:
+        if other.__class__ is self.__class__:
+            return (self.r, self.g, self.b) == (other.r, other.g, other.b)  # type: ignore
+        return NotImplemented
+
+    __hash__ = None  # type: ignore
 
     def to_html_color(self) -> str:
         r, g, b = round(self.r), round(self.g), round(self.b)
@@ -59,11 +76,28 @@ class RGBColor(Color):
         return HSLColor(h * 360.0, s * 100.0, l * 100.0)
 
 
-@dataclasses.dataclass
 class HSLColor(Color):
-    h: float
-    s: float
-    l: float
+    """
+    An HSL color. The hue is expected to be in degrees [0.0-360.0), and the saturation and
+    lightness are expected to be percentages [0.0-100.0].
+    """
+
+    __match_args__ = ("h", "s", "l")
+
+    def __init__(self, h: float, s: float, l: float) -> None:
+        self.h = h
+        self.s = s
+        self.l = l
+
+    def __repr__(self) -> str:
+        return f"HSLColor(h={self.h!r}, s={self.s!r}, l={self.l!r})"
+
+    def __eq__(self, other: object) -> bool:
+        if other.__class__ is self.__class__:
+            return (self.h, self.s, self.l) == (other.h, other.s, other.l)  # type: ignore
+        return NotImplemented
+
+    __hash__ = None  # type: ignore
 
     def to_html_color(self) -> str:
         return f"hsl({self.h:.02f},{self.s:.02f}%,{self.l:.02f}%)"
@@ -82,6 +116,106 @@ class HSLColor(Color):
 ColorMatrix = Sequence[Sequence[Color]]
 
 
+# The default xterm values for the 16 basic ANSI colors.
+ANSI16_COLORS = [
+    (0, 0, 0),
+    (205, 0, 0),
+    (0, 205, 0),
+    (205, 205, 0),
+    (0, 0, 238),
+    (205, 0, 205),
+    (0, 205, 205),
+    (229, 229, 229),
+    (127, 127, 127),
+    (255, 0, 0),
+    (0, 255, 0),
+    (255, 255, 0),
+    (92, 92, 255),
+    (255, 0, 255),
+    (0, 255, 255),
+    (255, 255, 255),
+]
+
+# The levels of each channel in the 6x6x6 color cube of the 256 color ANSI palette.
+ANSI256_CUBE_LEVELS = [0, 95, 135, 175, 215, 255]
+
+
+def _distance(a: tuple[float, float, float], b: tuple[float, float, float]) -> float:
+    return (a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2 + (a[2] - b[2]) ** 2
+
+
+def rgb_to_ansi256(color: RGBColor) -> int:
+    """
+    Find the closest color in the 256 color ANSI palette.
+
+    Only the color cube (16-231) and the grayscale ramp (232-255) are considered, since the first 16
+    colors are often redefined by terminal themes.
+
+    :param color: the color to convert.
+    :returns: the index of the closest color in the 256 color palette.
+    """
+    rgb = (color.r, color.g, color.b)
+    cube = [
+        min(range(6), key=lambda i, v=v: abs(ANSI256_CUBE_LEVELS[i] - v)) for v in rgb
+    ]
+    cube_rgb = tuple(ANSI256_CUBE_LEVELS[i] for i in cube)
+    gray = min(max(round((sum(rgb) / 3 - 8) / 10), 0), 23)
+    gray_rgb = (8 + gray * 10,) * 3
+    if _distance(rgb, gray_rgb) < _distance(rgb, cube_rgb):  # type: ignore
+        return 232 + gray
+    return 16 + 36 * cube[0] + 6 * cube[1] + cube[2]
+
+
+def rgb_to_ansi16(color: RGBColor) -> int:
+    """
+    Find the closest of the 16 basic ANSI colors.
+
+    :param color: the color to convert.
+    :returns: the SGR foreground color code of the closest color (30-37 or 90-97).
+    """
+    rgb = (color.r, color.g, color.b)
+    i = min(range(16), key=lambda i: _distance(rgb, ANSI16_COLORS[i]))
+    return 30 + i if i < 8 else 90 + i - 8
+
+
+class IndexedColorMatrix(Sequence[Sequence[Color]]):
+    """
+    A color matrix that is stored as a matrix of palette indices, plus the compiled palette.
+
+    This behaves like any other color matrix, but writers can use the `palette` and `matrix`
+    members directly to look up precomputed color tables instead of converting every cell.
+    """
+
+    def __init__(self, palette: "CompiledPalette", matrix: "Matrix") -> None:
+        """
+        Create a new indexed color matrix.
+
+        :param palette: the compiled palette that the matrix values index into.
+        :param matrix: the matrix of palette indices.
+        """
+        self.palette = palette
+        self.matrix = matrix
+
+    @overload
+    def __getitem__(self, index: int) -> Sequence[Color]: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> Sequence[Sequence[Color]]: ...
+
+    def __getitem__(
+        self, index: int | slice
+    ) -> Sequence[Color] | Sequence[Sequence[Color]]:
+        palette = self.palette
+        if isinstance(index, slice):
+            return [[palette[v] for v in row] for row in self.matrix[index]]
+        return [palette[v] for v in self.matrix[index]]
+
+    def __len__(self) -> int:
+        return len(self.matrix)
+
+
 def colorize(palette: "Palette", matrix: "Matrix") -> ColorMatrix:
     "Converts a matrix of values from [0x0..0xf] to a matrix of colors."
-    return [[palette[v] for v in row] for row in matrix]
+    from .palettes import compile_palette  # pylint: disable=import-outside-toplevel
+
+    return IndexedColorMatrix(compile_palette(palette), matrix)
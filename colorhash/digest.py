@@ -0,0 +1,150 @@
+"""
+Hashing of inputs.
+
+`hashlib` is imported when it is first needed, so that rendering a hash given on the command line
+doesn't pay for it.
+"""
+import mmap
+import os
+import stat
+import sys
+import textwrap
+from typing import TYPE_CHECKING, BinaryIO, Sequence
+
+if TYPE_CHECKING:
+    from .digestcache import DigestCache
+    from .timings import Timings
+
+# How much of a file is fed to every hasher at a time. Small enough to stay in the CPU cache while
+# it is passed from one hasher to the next, big enough that per-call overhead doesn't matter.
+CHUNK_SIZE = 1 << 20
+
+
+def file_digest(infile: BinaryIO, algo: str) -> bytes:
+    """
+    Hash the contents of a file.
+
+    :param infile: the file to hash.
+    :param algo: the hash algorithm to use.
+    :returns: the hash data.
+    """
+    import hashlib  # pylint: disable=import-outside-toplevel
+
+    # file_digest (I hope) will not load too much into memory
+    return hashlib.file_digest(infile, algo).digest()  # type: ignore
+    # NOTE : previous line has typing ignored because file_digest requires a
+    # "_BytesIOLike | _FileDigestFileObj", both of which look like API leaks. Specifying
+    # infile to be BinaryIO is not enough and causes the same error.
+
+
+def file_digests(infile: BinaryIO, algos: Sequence[str]) -> dict[str, bytes]:
+    """
+    Hash the contents of a file with several hash algorithms, reading the file only once.
+
+    Regular files are memory-mapped; anything else (pipes, STDIN) is read in chunks. Each chunk is
+    fed to every hasher before moving on to the next one.
+
+    :param infile: the file to hash.
+    :param algos: the hash algorithms to use.
+    :returns: the hash data for each algorithm.
+    """
+    if len(algos) == 1:
+        return {algos[0]: file_digest(infile, algos[0])}
+
+    import hashlib  # pylint: disable=import-outside-toplevel
+
+    hashers = [hashlib.new(algo) for algo in algos]
+
+    try:
+        fd = infile.fileno()
+        st = os.fstat(fd)
+    except (AttributeError, OSError):
+        st = None
+
+    if st is not None and stat.S_ISREG(st.st_mode) and st.st_size > 0:
+        with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                for start in range(0, len(view), CHUNK_SIZE):
+                    chunk = view[start : start + CHUNK_SIZE]
+                    for hasher in hashers:
+                        hasher.update(chunk)
+                    chunk.release()
+            finally:
+                view.release()
+    else:
+        buf = bytearray(CHUNK_SIZE)
+        view = memoryview(buf)
+        while True:
+            size = infile.readinto(view)  # type: ignore
+            if not size:
+                break
+            for hasher in hashers:
+                hasher.update(view[:size])
+
+    return {algo: hasher.digest() for algo, hasher in zip(algos, hashers)}
+
+
+def hash_input(
+    item: str,
+    input_type: str,
+    algos: Sequence[str],
+    digest_cache: "DigestCache | None" = None,
+    timings: "Timings | None" = None,
+    jobs: int = 1,
+) -> dict[str, bytes]:
+    """
+    Get the hash data for a single input.
+
+    :param item: the input, as given on the command line.
+    :param input_type: how the input should be treated; one of "path", "tree", "hash" or "data".
+    :param algos: the hash algorithms to use. The hash input type only supports one algorithm.
+    :param digest_cache: if supplied, file hashes are looked up in (and added to) this cache.
+    :param timings: if supplied, the time spent hashing is added to these timings as the "digest"
+                    stage, and the size of the input is recorded.
+    :param jobs: the number of files to hash at once, for the tree input type.
+    :returns: the hash data for each algorithm.
+    """
+    if timings is None:
+        return _hash_input(item, input_type, algos, digest_cache, None, jobs)
+    with timings.stage("digest"):
+        return _hash_input(item, input_type, algos, digest_cache, timings, jobs)
+
+
+def _hash_input(
+    item: str,
+    input_type: str,
+    algos: Sequence[str],
+    digest_cache: "DigestCache | None",
+    timings: "Timings | None",
+    jobs: int,
+) -> dict[str, bytes]:
+    match input_type:
+        case "path":
+            if item == "-":
+                return file_digests(sys.stdin.buffer, algos)
+            # TODO - pretty error message for when the file doesn't exist
+            with open(item, "rb") as infile:
+                if timings is not None:
+                    timings.bytes_in = os.fstat(infile.fileno()).st_size
+                if digest_cache is not None:
+                    return digest_cache.digests(infile, algos, file_digests)
+                return file_digests(infile, algos)
+        case "tree":
+            from .tree import tree_digests  # pylint: disable=import-outside-toplevel
+
+            return tree_digests(item, algos, digest_cache, jobs)
+        case "hash":
+            if len(algos) != 1:
+                raise ValueError("the hash input type only supports a single hash algorithm")
+            # TODO - pretty error message for malformed input
+            return {algos[0]: bytes([int(byte, 16) for byte in textwrap.wrap(item, 2)])}
+        case "data":
+            import hashlib  # pylint: disable=import-outside-toplevel
+
+            data = item.encode()
+            if timings is not None:
+                timings.bytes_in = len(data)
+            return {algo: hashlib.new(algo, data).digest() for algo in algos}
+        case _:
+            assert False, f"unknown input type {input_type}"
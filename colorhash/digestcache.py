@@ -0,0 +1,274 @@
+"A persistent cache of file hashes, so unchanged files do not have to be hashed again."
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import BinaryIO, Callable, Sequence
+
+# Files modified this recently are not cached. A file could be changed again within the same
+# modification time tick after it was hashed, which would leave a stale hash in the cache.
+RACY_SECONDS = 2
+
+# Writes (new hashes, and the last-used times of cache hits) are queued and made in a single
+# transaction once this many are waiting, and when the cache is closed. A transaction per file costs
+# more than hashing a small file does.
+FLUSH_EVERY = 1000
+
+
+class DigestCache:
+    """
+    A cache of file hashes, stored in an SQLite database.
+
+    Hashes are keyed by the device, inode, size and modification time of the file, plus the hash
+    algorithm. If any of those change, the cached hash is no longer used. When the cache grows past
+    `max_entries`, the least recently used entries are removed.
+
+    The digests of directory trees (see `colorhash.tree`) are kept as well, keyed by a hash of
+    everything in the tree that could change its digest. They are limited to `max_entries` on their
+    own.
+
+    Writes are batched (see `FLUSH_EVERY`), so the cache must be closed for the last of them to be
+    saved. The cache may be shared between threads.
+    """
+
+    def __init__(self, path: Path, max_entries: int = 100_000) -> None:
+        """
+        Open (or create) a digest cache.
+
+        :param path: the path to the cache database.
+        :param max_entries: the maximum number of hashes to keep.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # with a write-ahead log, readers in other processes don't wait for writers, and a commit
+        # doesn't have to wait for the disk
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS digests (
+                dev INTEGER NOT NULL,
+                ino INTEGER NOT NULL,
+                algo TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                digest BLOB NOT NULL,
+                used INTEGER NOT NULL,
+                PRIMARY KEY (dev, ino, algo)
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS digests_used ON digests (used)")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS subtrees (
+                key BLOB NOT NULL,
+                algo TEXT NOT NULL,
+                digest BLOB NOT NULL,
+                used INTEGER NOT NULL,
+                PRIMARY KEY (key, algo)
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS subtrees_used ON subtrees (used)")
+        self._db.commit()
+        # queued writes: file hashes by (dev, ino, algo), subtree digests by key, and the
+        # last-used times of cache hits
+        self._new_digests: dict[tuple[int, int, str], tuple] = {}
+        self._new_subtrees: dict[bytes, list[tuple]] = {}
+        self._used_digests: list[tuple[int, int, int, str]] = []
+        self._used_subtrees: list[tuple[int, bytes]] = []
+        self._queued = 0
+
+    def lookup(self, st: os.stat_result, algo: str) -> bytes | None:
+        """
+        Look up the hash of a file.
+
+        :param st: the stat result of the file.
+        :param algo: the hash algorithm.
+        :returns: the cached hash, or None if the file is not in the cache or has changed.
+        """
+        with self._lock:
+            new = self._new_digests.get((st.st_dev, st.st_ino, algo))
+            if new is not None and new[3:5] == (st.st_size, st.st_mtime_ns):
+                self.hits += 1
+                return new[5]
+            row = self._db.execute(
+                "SELECT digest FROM digests "
+                "WHERE dev = ? AND ino = ? AND algo = ? AND size = ? AND mtime_ns = ?",
+                (st.st_dev, st.st_ino, algo, st.st_size, st.st_mtime_ns),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._used_digests.append((time.time_ns(), st.st_dev, st.st_ino, algo))
+            self._queue()
+            return bytes(row[0])
+
+    def store(self, st: os.stat_result, algo: str, digest: bytes) -> None:
+        """
+        Store the hash of a file.
+
+        Files that were modified in the last `RACY_SECONDS` seconds are not stored.
+
+        :param st: the stat result of the file, taken before it was hashed.
+        :param algo: the hash algorithm.
+        :param digest: the hash of the file.
+        """
+        now = time.time_ns()
+        if now - st.st_mtime_ns < RACY_SECONDS * 1_000_000_000:
+            return
+        with self._lock:
+            self._new_digests[(st.st_dev, st.st_ino, algo)] = (
+                st.st_dev, st.st_ino, algo, st.st_size, st.st_mtime_ns, digest, now
+            )
+            self._queue()
+
+    def digests(
+        self,
+        fp: BinaryIO,
+        algos: Sequence[str],
+        compute: Callable[[BinaryIO, Sequence[str]], dict[str, bytes]],
+    ) -> dict[str, bytes]:
+        """
+        Get the hashes of an open file, using the cache when possible.
+
+        :param fp: the file to hash. Must be a real file with a file descriptor.
+        :param algos: the hash algorithms.
+        :param compute: a function that hashes the file with several algorithms at once, used for
+                        the hashes that are not cached.
+        :returns: the hash of the file for each algorithm.
+        """
+        st = os.fstat(fp.fileno())
+        digests = {}
+        missing = []
+        for algo in algos:
+            digest = self.lookup(st, algo)
+            if digest is None:
+                missing.append(algo)
+            else:
+                digests[algo] = digest
+        if missing:
+            for algo, digest in compute(fp, missing).items():
+                self.store(st, algo, digest)
+                digests[algo] = digest
+        return {algo: digests[algo] for algo in algos}
+
+    def lookup_subtree(self, key: bytes) -> dict[str, bytes] | None:
+        """
+        Look up the digests of a directory tree.
+
+        :param key: the subtree key, which covers the hash algorithms as well as the tree.
+        :returns: the cached digest for each algorithm, or None if the tree is not in the cache.
+        """
+        with self._lock:
+            new = self._new_subtrees.get(key)
+            if new is not None:
+                self.hits += 1
+                return {algo: digest for _, algo, digest, _ in new}
+            rows = self._db.execute(
+                "SELECT algo, digest FROM subtrees WHERE key = ?", (key,)
+            ).fetchall()
+            if not rows:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._used_subtrees.append((time.time_ns(), key))
+            self._queue()
+            return {algo: bytes(digest) for algo, digest in rows}
+
+    def store_subtree(self, key: bytes, digests: dict[str, bytes]) -> None:
+        """
+        Store the digests of a directory tree.
+
+        :param key: the subtree key.
+        :param digests: the digest of the tree for each algorithm.
+        """
+        now = time.time_ns()
+        with self._lock:
+            self._new_subtrees[key] = [(key, algo, digest, now) for algo, digest in digests.items()]
+            self._queue()
+
+    def flush(self) -> None:
+        """
+        Write the queued hashes and last-used times to the database, then remove the least recently
+        used hashes until there are at most `max_entries` of them.
+        """
+        with self._lock:
+            self._flush()
+
+    def prune(self) -> None:
+        "Remove the least recently used hashes until there are at most `max_entries` of them."
+        self.flush()
+
+    def _queue(self) -> None:
+        self._queued += 1
+        if self._queued >= FLUSH_EVERY:
+            self._flush()
+
+    def _flush(self) -> None:
+        # one transaction for everything queued; the size of the cache is checked here too, since
+        # counting rows is not free
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?, ?, ?, ?)",
+                self._new_digests.values(),
+            )
+            self._db.executemany(
+                "UPDATE digests SET used = ? WHERE dev = ? AND ino = ? AND algo = ?",
+                self._used_digests,
+            )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO subtrees VALUES (?, ?, ?, ?)",
+                (row for rows in self._new_subtrees.values() for row in rows),
+            )
+            self._db.executemany(
+                "UPDATE subtrees SET used = ? WHERE key = ?", self._used_subtrees
+            )
+            self._prune()
+        self._new_digests.clear()
+        self._new_subtrees.clear()
+        self._used_digests.clear()
+        self._used_subtrees.clear()
+        self._queued = 0
+
+    def _prune(self) -> None:
+        for table in ("digests", "subtrees"):
+            (count,) = self._db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()
+            if count > self.max_entries:
+                self._db.execute(
+                    f"DELETE FROM {table} WHERE rowid IN "
+                    f"(SELECT rowid FROM {table} ORDER BY used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+
+    def clear(self) -> None:
+        "Remove every hash from the cache."
+        with self._lock:
+            self._new_digests.clear()
+            self._new_subtrees.clear()
+            self._used_digests.clear()
+            self._used_subtrees.clear()
+            self._queued = 0
+            with self._db:
+                self._db.execute("DELETE FROM digests")
+                self._db.execute("DELETE FROM subtrees")
+
+    def close(self) -> None:
+        "Write the queued hashes, and close the cache database."
+        with self._lock:
+            self._flush()
+            self._db.close()
+
+    def __enter__(self) -> "DigestCache":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
@@ -1,14 +1,111 @@
 "All things that turn a hash into a matrix."
 import abc
+import itertools
 import re
-from typing import Mapping, Sequence
+from typing import Iterable, Iterator, Mapping, Sequence, overload
 
 from .palettes import (DEFAULT_PALETTES, GRADIENT_PALETTES,
-                       MULTICOLOR_PALETTES, Palette)
+                       MULTICOLOR_PALETTES, Palette, PaletteSet)
 
 Matrix = Sequence[Sequence[int]]
 
 
+class ByteMatrix(Sequence[Sequence[int]]):
+    """
+    A compact matrix of values between 0x0 and 0xff, stored row by row in a single buffer.
+
+    Rows are returned as memoryviews into the buffer, so they can be passed around without copying.
+    Matrices pickle as their dimensions plus a single bytes object, which makes them cheap to send
+    across process boundaries.
+    """
+
+    __slots__ = ("width", "height", "data")
+
+    def __init__(
+        self, width: int, height: int, data: bytes | bytearray | None = None
+    ) -> None:
+        """
+        Create a new matrix.
+
+        :param width: the number of columns in the matrix.
+        :param height: the number of rows in the matrix.
+        :param data: the values of the matrix, row by row. If not supplied, the matrix is filled
+                     with zeroes.
+        """
+        if data is None:
+            data = bytearray(width * height)
+        if len(data) != width * height:
+            raise ValueError(
+                f"matrix data length ({len(data)}) must match matrix dimensions "
+                f"({width}x{height} = {width * height})"
+            )
+        self.width = width
+        self.height = height
+        self.data = data
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Iterable[int]]) -> "ByteMatrix":
+        """
+        Create a new matrix from a sequence of rows.
+
+        :param rows: the rows of the matrix. Every row must be the same length.
+        :returns: the new matrix.
+        """
+        rows = [bytes(row) for row in rows]
+        width = len(rows[0]) if rows else 0
+        if any(len(row) != width for row in rows):
+            raise ValueError("all matrix rows must be the same length")
+        return cls(width, len(rows), b"".join(rows))
+
+    def view(self) -> memoryview:
+        "Get a read-only view of the whole matrix buffer, row by row."
+        return memoryview(self.data).toreadonly()
+
+    def tolist(self) -> list[list[int]]:
+        "Convert this matrix into a list of rows of values."
+        return [list(row) for row in self]
+
+    @overload
+    def __getitem__(self, index: int) -> memoryview: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[memoryview]: ...
+
+    def __getitem__(self, index: int | slice) -> memoryview | list[memoryview]:
+        if isinstance(index, slice):
+            return [self[r] for r in range(*index.indices(self.height))]
+        if index < 0:
+            index += self.height
+        if not 0 <= index < self.height:
+            raise IndexError("matrix row index out of range")
+        start = index * self.width
+        return self.view()[start : start + self.width]
+
+    def __len__(self) -> int:
+        return self.height
+
+    def __iter__(self) -> Iterator[memoryview]:
+        view = self.view()
+        w = self.width
+        for start in range(0, self.width * self.height, w or 1):
+            yield view[start : start + w]
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, ByteMatrix):
+            return (self.width, self.height, self.data) == (
+                other.width,
+                other.height,
+                other.data,
+            )
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"ByteMatrix({self.width}, {self.height}, {bytes(self.data)!r})"
+
+    def __reduce__(self) -> tuple:
+        return (ByteMatrix, (self.width, self.height, bytes(self.data)))
+
+
 def detect_hash_algorithm(hash_or_algo: str | bytes) -> str | None:
     """
     Detect the hash algorithm based on a string.
@@ -43,7 +140,7 @@ class Matricizer(metaclass=abc.ABCMeta):
     """
 
     @abc.abstractmethod
-    def matricize(self, data: bytes) -> Matrix:
+    def matricize(self, data: bytes) -> ByteMatrix:
         """
         Convert a hash to a matrix of given width and height.
 
@@ -59,10 +156,21 @@ class Matricizer(metaclass=abc.ABCMeta):
 
         By default, this method will choose the Nth palette from the sum of the data mod the length
         of all palettes provided (using all palettes as the default).
+
+        :param data: the hash data.
+        :param palettes: the palettes to choose from, such as a custom `PaletteSet`.
+        :returns: the chosen palette.
         """
         if palettes is None:
             palettes = DEFAULT_PALETTES
-        return list(palettes.values())[sum(data) % len(palettes)]
+        index = sum(data) % len(palettes)
+        if isinstance(palettes, PaletteSet):
+            # only build the palette that is actually chosen
+            return palettes.at(index)
+        return next(itertools.islice(palettes.values(), index, None))
+
+
+_HEX_TO_NIBBLE = bytes.maketrans(b"0123456789abcdef", bytes(range(16)))
 
 
 class NibbleMatricizer(Matricizer):
@@ -82,7 +190,7 @@ class NibbleMatricizer(Matricizer):
         "sha512": (16, 8),
     }
 
-    def matricize(self, data: bytes) -> Matrix:
+    def matricize(self, data: bytes) -> ByteMatrix:
         """
         Convert a set of bytes to a list of rows of nibbles.
 
@@ -95,11 +203,8 @@ class NibbleMatricizer(Matricizer):
             raise ValueError("unable to determine hash algorithm")
         w, h = self.DIMENSIONS[algo]
 
-        nibbles = []
-        for b in data:
-            top = (b & 0xF0) >> 4
-            bottom = b & 0x0F
-            nibbles += [top, bottom]
+        # each hex digit of the hash is exactly one nibble, top nibble first
+        nibbles = data.hex().encode("ascii").translate(_HEX_TO_NIBBLE)
 
         if len(nibbles) != w * h:
             raise ValueError(
@@ -107,15 +212,7 @@ class NibbleMatricizer(Matricizer):
                 f"({w}x{h} = {w * h})"
             )
 
-        cols = []
-        row = []
-        for b in nibbles:
-            row += [b]
-            if len(row) == w:
-                cols += [row]
-                row = []
-
-        return cols
+        return ByteMatrix(w, h, nibbles)
 
     def choose_palette(
         self, data: bytes, palettes: Mapping[str, Palette] | None = None
@@ -123,6 +220,24 @@ class NibbleMatricizer(Matricizer):
         return super().choose_palette(data, palettes or GRADIENT_PALETTES)
 
 
+def _randomart_move(
+    w: int, h: int, pos: int, value: int
+) -> tuple[int, tuple[tuple[int, int], ...]]:
+    """
+    Take the four randomart steps for a single byte.
+
+    :returns: the final position, and the (cell, count) pairs of every cell that was visited.
+    """
+    r, c = divmod(pos, w)
+    visits: dict[int, int] = {}
+    for _ in range(4):
+        c = min(max(c + (1 if value & 0x1 else -1), 0), w - 1)
+        r = min(max(r + (1 if value & 0x2 else -1), 0), h - 1)
+        visits[r * w + c] = visits.get(r * w + c, 0) + 1
+        value >>= 2
+    return r * w + c, tuple(visits.items())
+
+
 class RandomartMatricizer(Matricizer):
     """
     A matricizer that converts hash data into a matrix based on the "randomart" algorithm from
@@ -140,7 +255,12 @@ class RandomartMatricizer(Matricizer):
         "sha512": (11, 10),
     }
 
-    def matricize(self, data: bytes) -> Matrix:
+    # Move tables, keyed by DIMENSIONS entry. See `_move_table`.
+    _MOVE_TABLES: dict[
+        tuple[int, int], list[tuple[int, tuple[tuple[int, int], ...]] | None]
+    ] = {}
+
+    def matricize(self, data: bytes) -> ByteMatrix:
         """
         Create a matrix based on the "randomart" algorithm from ssh-keygen.
 
@@ -157,12 +277,38 @@ class RandomartMatricizer(Matricizer):
         :param data: the hash data to turn into a matrix.
         :returns: the matrix converted from the hash data.
         """
-        algo = detect_hash_algorithm(data)
-        if algo is None:
-            raise ValueError("unable to determine hash algorithm")
-        w, h = self.DIMENSIONS[algo]
+        w, h = self._dimensions(data)
+
+        # Instead of stepping through every pair of bits, look up where each byte's four steps end
+        # up from the current position, and how many times each cell was visited along the way.
+        moves = self._move_table(w, h)
+        cells = bytearray(w * h)
+        pos = (h // 2) * w + w // 2
+        for value in data:
+            key = (pos << 8) | value
+            move = moves[key]
+            if move is None:
+                move = moves[key] = _randomart_move(w, h, pos, value)
+            pos, visits = move
+            for cell, count in visits:
+                # max value is 0xf
+                cells[cell] = min(cells[cell] + count, 0xF)
+        return ByteMatrix(w, h, cells)
+
+    def matricize_stepwise(self, data: bytes) -> ByteMatrix:
+        """
+        Create a matrix based on the "randomart" algorithm, one step at a time.
+
+        This is the straightforward implementation of the algorithm described in `matricize`. It is
+        slower, but it is kept as the reference that the table-driven implementation is checked
+        against.
 
-        rows = [[0] * w for _ in range(h)]
+        :param data: the hash data to turn into a matrix.
+        :returns: the matrix converted from the hash data.
+        """
+        w, h = self._dimensions(data)
+
+        cells = bytearray(w * h)
         c = w // 2
         r = h // 2
         for value in data:
@@ -178,10 +324,31 @@ class RandomartMatricizer(Matricizer):
                 c = min(max(c, 0), w - 1)
                 r = min(max(r, 0), h - 1)
                 # max value is 0xf
-                if rows[r][c] < 0xF:
-                    rows[r][c] += 1
+                if cells[r * w + c] < 0xF:
+                    cells[r * w + c] += 1
                 value >>= 2
-        return rows
+        return ByteMatrix(w, h, cells)
+
+    def _dimensions(self, data: bytes) -> tuple[int, int]:
+        algo = detect_hash_algorithm(data)
+        if algo is None:
+            raise ValueError("unable to determine hash algorithm")
+        return self.DIMENSIONS[algo]
+
+    @classmethod
+    def _move_table(cls, w: int, h: int) -> list[tuple[int, tuple[tuple[int, int], ...]] | None]:
+        """
+        Get the move table for the given dimensions.
+
+        The table is indexed by `(position << 8) | byte`, where the position is `row * w + col`.
+        Each entry is the position after the four steps for that byte, plus the (cell, count)
+        pairs of every cell visited along the way. Entries are filled in the first time they are
+        needed, so a single hash does not pay for building the whole table.
+        """
+        table = cls._MOVE_TABLES.get((w, h))
+        if table is None:
+            table = cls._MOVE_TABLES[(w, h)] = [None] * ((w * h) << 8)
+        return table
 
     def choose_palette(
         self, data: bytes, palettes: Mapping[str, Palette] | None = None
@@ -0,0 +1,263 @@
+"""
+Loading custom palettes from files.
+
+Palette files are JSON or TOML (chosen by the file extension, `.toml` for TOML and anything else
+for JSON), with a `palettes` table mapping each palette name to its 16 colors. A palette is either
+a list of 16 colors, each an HTML color (`"#ff8800"` or `"#f80"`) or a list of R, G and B values
+from 0 to 255, or a table of `hue`, `sat` and `light` values like `hsl_palette` takes:
+
+    [palettes]
+    ocean = ["#001f3f", "#003366", ...]
+
+    [palettes.ember]
+    hue = [0, 45]       # from 0 to 45 degrees (inclusive), in 16 steps
+    sat = 100           # the same for every color
+    light = [10, 60]
+
+Each of `hue`, `sat` and `light` is a single number, a `[start, end]` pair, or a list of 16
+numbers. Hues are in degrees, and saturation and lightness in percent.
+
+Files are validated and compiled into a compact binary form: a header, the palette names, and then
+a table of 16 RGB triples (48 bytes) per palette, in the same order as the names:
+
+    magic     8 bytes    b"CHPAL\\x00\\x00\\x01"
+    count     uint16     the number of palettes
+    names     count * (uint8 length + UTF-8 name)
+    tables    count * 48 bytes
+
+All integers are big-endian. With a cache directory, the compiled form is kept there, keyed by the
+path, size and modification time of the palette file, so later runs load it with a single read
+instead of parsing and validating the file again. Compiled files may also be loaded directly.
+"""
+import functools
+import hashlib
+import json
+import os
+import struct
+import time
+from pathlib import Path
+from typing import Any, Mapping, Sequence
+
+from .color import Color, HSLColor, RGBColor
+from .palettes import Palette, PaletteSet
+
+MAGIC = b"CHPAL\x00\x00\x01"
+
+# The number of colors in every palette; matrix values are from 0 to 15.
+PALETTE_SIZE = 16
+
+_COUNT = struct.Struct(">H")
+_TABLE_SIZE = PALETTE_SIZE * 3
+
+
+def _check_number(value: Any, low: float, high: float, what: str) -> float:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{what} must be a number, not {value!r}")
+    if not low <= value <= high:
+        raise ValueError(f"{what} must be between {low} and {high}, not {value!r}")
+    return value
+
+
+def _parse_color(value: Any, what: str) -> RGBColor:
+    if isinstance(value, str):
+        digits = value[1:] if value.startswith("#") else ""
+        if len(digits) == 3:
+            digits = "".join(c * 2 for c in digits)
+        try:
+            rgb = bytes.fromhex(digits)
+            if len(digits) != 6 or len(rgb) != 3:
+                raise ValueError
+        except ValueError:
+            raise ValueError(f"{what} is not an HTML color (#rrggbb or #rgb): {value!r}") from None
+        return RGBColor(*rgb)
+    if isinstance(value, list) and len(value) == 3:
+        r, g, b = (_check_number(v, 0, 255, what) for v in value)
+        return RGBColor(r, g, b)
+    raise ValueError(f"{what} must be an HTML color or a list of R, G and B values, not {value!r}")
+
+
+def _parse_channel(value: Any, high: float, what: str) -> list[float]:
+    if isinstance(value, list):
+        if len(value) == 2:
+            start, end = (_check_number(v, 0, high, what) for v in value)
+            return [start + i * (end - start) / (PALETTE_SIZE - 1) for i in range(PALETTE_SIZE)]
+        if len(value) == PALETTE_SIZE:
+            return [_check_number(v, 0, high, what) for v in value]
+        raise ValueError(
+            f"{what} must be a number, a [start, end] pair or a list of {PALETTE_SIZE} numbers"
+        )
+    return [_check_number(value, 0, high, what)] * PALETTE_SIZE
+
+
+def _parse_palette(value: Any, what: str) -> list[Color]:
+    if isinstance(value, list):
+        if len(value) != PALETTE_SIZE:
+            raise ValueError(f"{what} must have {PALETTE_SIZE} colors, not {len(value)}")
+        return [_parse_color(color, f"{what}, color {i}") for i, color in enumerate(value)]
+    if isinstance(value, dict):
+        unknown = set(value) - {"hue", "sat", "light"}
+        if unknown:
+            raise ValueError(f"{what} has unknown keys: {', '.join(sorted(unknown))}")
+        missing = {"hue", "sat", "light"} - set(value)
+        if missing:
+            raise ValueError(f"{what} is missing: {', '.join(sorted(missing))}")
+        hue = _parse_channel(value["hue"], 360, f"{what}, hue")
+        sat = _parse_channel(value["sat"], 100, f"{what}, sat")
+        light = _parse_channel(value["light"], 100, f"{what}, light")
+        return [HSLColor(h, s, l) for h, s, l in zip(hue, sat, light)]
+    raise ValueError(f"{what} must be a list of colors or a table of hue, sat and light")
+
+
+def parse_palettes(source: Mapping[str, Any]) -> dict[str, list[Color]]:
+    """
+    Validate the contents of a palette file.
+
+    :param source: the parsed JSON or TOML document.
+    :returns: the colors of each palette, by name, in the order they appear.
+    :raises ValueError: if the document is not a valid palette file.
+    """
+    palettes = source.get("palettes") if isinstance(source, Mapping) else None
+    if not isinstance(palettes, Mapping) or not palettes:
+        raise ValueError("expected a non-empty 'palettes' table")
+    result = {}
+    for name, value in palettes.items():
+        if name == "auto" or not 0 < len(name.encode()) < 256:
+            raise ValueError(f"invalid palette name: {name!r}")
+        result[name] = _parse_palette(value, f"palette {name!r}")
+    return result
+
+
+def compile_palettes(palettes: Mapping[str, Palette]) -> bytes:
+    """
+    Compile palettes into the binary form (see the module documentation).
+
+    Colors are converted to RGB and rounded to whole numbers.
+
+    :param palettes: the palettes to compile, by name.
+    :returns: the compiled palettes.
+    """
+    if len(palettes) > 0xFFFF:
+        raise ValueError(f"too many palettes: {len(palettes)}")
+    names = bytearray()
+    tables = bytearray()
+    for name, palette in palettes.items():
+        encoded = name.encode()
+        names.append(len(encoded))
+        names += encoded
+        for color in palette:
+            rgb = color.to_rgb()
+            tables += bytes((round(rgb.r), round(rgb.g), round(rgb.b)))
+    return MAGIC + _COUNT.pack(len(palettes)) + bytes(names) + bytes(tables)
+
+
+def _table_palette(data: bytes, offset: int) -> list[Color]:
+    table = data[offset : offset + _TABLE_SIZE]
+    return [RGBColor(*table[i : i + 3]) for i in range(0, _TABLE_SIZE, 3)]
+
+
+def load_compiled(data: bytes) -> PaletteSet:
+    """
+    Load compiled palettes. Palettes are only turned into colors when they are first used.
+
+    :param data: the compiled palettes, from `compile_palettes`.
+    :returns: the palettes.
+    :raises ValueError: if the data is not compiled palettes.
+    """
+    if not data.startswith(MAGIC) or len(data) < len(MAGIC) + _COUNT.size:
+        raise ValueError("not a compiled palette file")
+    pos = len(MAGIC)
+    (count,) = _COUNT.unpack_from(data, pos)
+    pos += _COUNT.size
+    names = []
+    for _ in range(count):
+        if pos >= len(data):
+            raise ValueError("compiled palette file is truncated")
+        size = data[pos]
+        names.append(data[pos + 1 : pos + 1 + size].decode())
+        pos += 1 + size
+    if len(data) != pos + count * _TABLE_SIZE:
+        raise ValueError("compiled palette file has the wrong size")
+    return PaletteSet(
+        {
+            name: functools.partial(_table_palette, data, pos + i * _TABLE_SIZE)
+            for i, name in enumerate(names)
+        }
+    )
+
+
+def read_palette_file(path: Path) -> dict[str, list[Color]]:
+    """
+    Read and validate a JSON or TOML palette file.
+
+    :param path: the palette file.
+    :returns: the colors of each palette, by name.
+    :raises ValueError: if the file is not a valid palette file.
+    """
+    data = path.read_bytes()
+    try:
+        if path.suffix.lower() == ".toml":
+            import tomllib  # pylint: disable=import-outside-toplevel
+
+            source = tomllib.loads(data.decode())
+        else:
+            source = json.loads(data)
+        return parse_palettes(source)
+    except ValueError as ex:  # includes JSON, TOML and UTF-8 decoding errors
+        raise ValueError(f"{path}: {ex}") from None
+
+
+def load_palette_file(path: Path, cache_dir: Path | None = None) -> PaletteSet:
+    """
+    Load a palette file: JSON, TOML or already compiled.
+
+    :param path: the palette file.
+    :param cache_dir: if supplied, the compiled form of JSON and TOML files is looked up in (and
+                      added to) the "palettes" directory underneath this directory.
+    :returns: the palettes in the file, in the order they appear.
+    :raises ValueError: if the file is not a valid palette file.
+    """
+    cached = None
+    if cache_dir is not None:
+        # pylint: disable=import-outside-toplevel
+        from .digestcache import RACY_SECONDS
+
+        st = path.stat()
+        key = f"{os.path.abspath(path)}\0{st.st_size}\0{st.st_mtime_ns}".encode()
+        cached = cache_dir / "palettes" / (hashlib.sha256(MAGIC + key).hexdigest() + ".bin")
+        try:
+            return load_compiled(cached.read_bytes())
+        except (OSError, ValueError):
+            pass
+        # a file modified this recently could change again without its modification time changing
+        if time.time_ns() - st.st_mtime_ns < RACY_SECONDS * 1_000_000_000:
+            cached = None
+
+    with path.open("rb") as fp:
+        is_compiled = fp.read(len(MAGIC)) == MAGIC
+    if is_compiled:
+        try:
+            return load_compiled(path.read_bytes())
+        except ValueError as ex:
+            raise ValueError(f"{path}: {ex}") from None
+
+    data = compile_palettes(read_palette_file(path))
+    if cached is not None:
+        # write next to the cached file and move it into place, so readers never see half of it
+        cached.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cached.with_name(f".{cached.name}.{os.getpid()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, cached)
+    return load_compiled(data)
+
+
+def load_palette_files(paths: Sequence[Path], cache_dir: Path | None = None) -> PaletteSet:
+    """
+    Load palette files into a single set. Palettes from later files replace those with the same name
+    from earlier files.
+
+    :param paths: the palette files.
+    :param cache_dir: the cache directory (see `load_palette_file`).
+    :returns: the palettes in all of the files.
+    :raises ValueError: if any of the files is not a valid palette file.
+    """
+    return PaletteSet.merge(*(load_palette_file(path, cache_dir) for path in paths))
@@ -1,13 +1,161 @@
 "Base color palette definitions."
-from typing import Sequence
+import functools
+from typing import Callable, Iterable, Iterator, Mapping, Sequence, overload
 
-from .color import Color, HSLColor
+from .color import Color, HSLColor, rgb_to_ansi16, rgb_to_ansi256
 
 
 HSLRange = range | float | int | list[float | int]
 Palette = Sequence[Color]
 
 
+class CompiledPalette(Sequence[Color]):
+    """
+    A palette with every per-color conversion done up front.
+
+    Writers look colors up in these tables instead of converting HSL to RGB and formatting strings
+    for every cell of every image. Since this is still a sequence of colors, it can be used
+    anywhere a `Palette` is expected.
+
+    * `rgb` - every color packed as 3 bytes of R, G and B (truncated to integers)
+    * `html` - every color as an HTML color string (see `Color.to_html_color`)
+    * `ansi` - every color as an ANSI 24-bit foreground color escape sequence
+
+    Escape sequences for terminals without true color are available through `ansi_table`.
+    """
+
+    def __init__(self, colors: Iterable[Color], name: str | None = None) -> None:
+        """
+        Compile a palette.
+
+        :param colors: the colors of the palette.
+        :param name: the name of the palette, if it has one.
+        """
+        self.name = name
+        self.colors: tuple[Color, ...] = tuple(colors)
+        rgb = [c.to_rgb() for c in self.colors]
+        self.rgb = bytes(v for c in rgb for v in (int(c.r), int(c.g), int(c.b)))
+        self.html: tuple[str, ...] = tuple(c.to_html_color() for c in self.colors)
+        self.ansi: tuple[str, ...] = tuple(
+            f"\x1b[38;2;{round(c.r)};{round(c.g)};{round(c.b)}m" for c in rgb
+        )
+        self._ansi_tables = {"truecolor": self.ansi}
+
+    def ansi_table(self, colors: str = "truecolor") -> tuple[str, ...]:
+        """
+        Get the ANSI foreground color escape sequences for every color in this palette.
+
+        :param colors: the colors supported by the terminal; one of "truecolor", "256" or "16".
+                       Colors are approximated with the closest color the terminal supports.
+        :returns: the escape sequence for every color.
+        """
+        table = self._ansi_tables.get(colors)
+        if table is None:
+            rgb = [c.to_rgb() for c in self.colors]
+            match colors:
+                case "256":
+                    table = tuple(f"\x1b[38;5;{rgb_to_ansi256(c)}m" for c in rgb)
+                case "16":
+                    table = tuple(f"\x1b[{rgb_to_ansi16(c)}m" for c in rgb)
+                case _:
+                    raise ValueError(f"unknown ANSI color support: {colors}")
+            self._ansi_tables[colors] = table
+        return table
+
+    @overload
+    def __getitem__(self, index: int) -> Color: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> Sequence[Color]: ...
+
+    def __getitem__(self, index: int | slice) -> Color | Sequence[Color]:
+        return self.colors[index]
+
+    def __len__(self) -> int:
+        return len(self.colors)
+
+    def __repr__(self) -> str:
+        return f"CompiledPalette({list(self.colors)!r}, name={self.name!r})"
+
+
+def compile_palette(palette: Palette, name: str | None = None) -> CompiledPalette:
+    """
+    Compile a palette, if it isn't compiled already.
+
+    :param palette: the palette to compile.
+    :param name: the name of the palette, if it has one.
+    :returns: the compiled palette.
+    """
+    if isinstance(palette, CompiledPalette):
+        return palette
+    return CompiledPalette(palette, name)
+
+
+class PaletteSet(Mapping[str, CompiledPalette]):
+    """
+    An ordered set of named palettes, which are only built and compiled when they are first used.
+
+    Palettes may be given as palettes, or as functions that create a palette. Building every
+    palette up front is wasted work for a program that only ever uses one of them.
+    """
+
+    def __init__(
+        self, palettes: Mapping[str, Palette | Callable[[], Palette]] | None = None
+    ) -> None:
+        """
+        Create a new palette set.
+
+        :param palettes: the palettes (or functions creating the palettes), by name.
+        """
+        self._sources = dict(palettes or {})
+        self._names = list(self._sources)
+        self._compiled: dict[str, CompiledPalette] = {}
+
+    @classmethod
+    def merge(cls, *sets: "PaletteSet") -> "PaletteSet":
+        """
+        Merge palette sets into a new set. Palettes from later sets replace those with the same name
+        from earlier sets.
+
+        Palettes are shared with the original sets, so each palette is still only built once.
+
+        :param sets: the palette sets to merge.
+        :returns: the merged palette set.
+        """
+        merged: dict[str, Callable[[], Palette]] = {}
+        for palettes in sets:
+            for name in palettes:
+                merged[name] = functools.partial(palettes.__getitem__, name)
+        return cls(merged)
+
+    def at(self, index: int) -> CompiledPalette:
+        """
+        Get a palette by its position in the set.
+
+        :param index: the position of the palette.
+        :returns: the palette.
+        """
+        return self[self._names[index]]
+
+    def __getitem__(self, name: str) -> CompiledPalette:
+        palette = self._compiled.get(name)
+        if palette is None:
+            source = self._sources[name]
+            if callable(source):
+                source = source()
+            palette = self._compiled[name] = compile_palette(source, name)
+        return palette
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._names)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._sources
+
+
 def quantize(r: range, steps: int = 16) -> list[float]:
     """
     Given a range and a number of steps, create a list of numbers starting and ending in the range
@@ -51,7 +199,7 @@ def hsl_palette(hue: HSLRange, sat: HSLRange, light: HSLRange) -> list[HSLColor]
     return [HSLColor(h, s, l) for h, s, l in zip(hue, sat, light)]
 
 
-GRADIENT_PALETTES = {
+GRADIENT_PALETTES = PaletteSet({
     # Interesting thing with human perception.
     # Between red and yellow, we can perceive "orange". We have a name for it and see it as a
     # distinct color. However, between yellow and green, we see a sickly green; between green and
@@ -69,56 +217,53 @@ GRADIENT_PALETTES = {
     #
     # Also disabling yellow-light, that one just gives me a headache. It's hard to look at.
     #
-    "red-light": hsl_palette(0, 100, range(50, 100)),
-    "red-dark": hsl_palette(0, 100, range(0, 50)),
+    "red-light": lambda: hsl_palette(0, 100, range(50, 100)),
+    "red-dark": lambda: hsl_palette(0, 100, range(0, 50)),
     #
-    "orange-light": hsl_palette(30, 100, range(50, 100)),
-    "orange-dark": hsl_palette(30, 100, range(0, 50)),
+    "orange-light": lambda: hsl_palette(30, 100, range(50, 100)),
+    "orange-dark": lambda: hsl_palette(30, 100, range(0, 50)),
     #
-    # "yellow-light": hsl_palette(60, 100, range(50, 100)),
-    "yellow-dark": hsl_palette(60, 100, range(0, 50)),
+    # "yellow-light": lambda: hsl_palette(60, 100, range(50, 100)),
+    "yellow-dark": lambda: hsl_palette(60, 100, range(0, 50)),
     #
-    # "lime-light": hsl_palette(90, 100, range(50, 100)),
-    # "lime-dark": hsl_palette(90, 100, range(0, 50)),
+    # "lime-light": lambda: hsl_palette(90, 100, range(50, 100)),
+    # "lime-dark": lambda: hsl_palette(90, 100, range(0, 50)),
     #
-    "green-light": hsl_palette(120, 100, range(50, 100)),
-    "green-dark": hsl_palette(120, 100, range(0, 50)),
+    "green-light": lambda: hsl_palette(120, 100, range(50, 100)),
+    "green-dark": lambda: hsl_palette(120, 100, range(0, 50)),
     #
-    # "seafoam-light": hsl_palette(150, 100, range(50, 100)),
-    # "seafoam-dark": hsl_palette(150, 100, range(0, 50)),
+    # "seafoam-light": lambda: hsl_palette(150, 100, range(50, 100)),
+    # "seafoam-dark": lambda: hsl_palette(150, 100, range(0, 50)),
     #
-    "cyan-light": hsl_palette(180, 100, range(50, 100)),
-    "cyan-dark": hsl_palette(180, 100, range(0, 50)),
+    "cyan-light": lambda: hsl_palette(180, 100, range(50, 100)),
+    "cyan-dark": lambda: hsl_palette(180, 100, range(0, 50)),
     #
-    # "teal-light": hsl_palette(210, 100, range(50, 100)),
-    # "teal-dark": hsl_palette(210, 100, range(0, 50)),
+    # "teal-light": lambda: hsl_palette(210, 100, range(50, 100)),
+    # "teal-dark": lambda: hsl_palette(210, 100, range(0, 50)),
     #
-    "blue-light": hsl_palette(240, 100, range(50, 100)),
-    "blue-dark": hsl_palette(240, 100, range(0, 50)),
+    "blue-light": lambda: hsl_palette(240, 100, range(50, 100)),
+    "blue-dark": lambda: hsl_palette(240, 100, range(0, 50)),
     #
-    "purple-light": hsl_palette(270, 100, range(50, 100)),
-    "purple-dark": hsl_palette(270, 100, range(0, 50)),
+    "purple-light": lambda: hsl_palette(270, 100, range(50, 100)),
+    "purple-dark": lambda: hsl_palette(270, 100, range(0, 50)),
     #
-    "magenta-light": hsl_palette(300, 100, range(50, 100)),
-    "magenta-dark": hsl_palette(300, 100, range(0, 50)),
+    "magenta-light": lambda: hsl_palette(300, 100, range(50, 100)),
+    "magenta-dark": lambda: hsl_palette(300, 100, range(0, 50)),
     #
-    "pink-light": hsl_palette(330, 100, range(50, 100)),
-    "pink-dark": hsl_palette(330, 100, range(0, 50)),
+    "pink-light": lambda: hsl_palette(330, 100, range(50, 100)),
+    "pink-dark": lambda: hsl_palette(330, 100, range(0, 50)),
     #
-    "gray-light": hsl_palette(0, 0, range(50, 100)),
-    "gray-dark": hsl_palette(0, 0, range(0, 50)),
-}
+    "gray-light": lambda: hsl_palette(0, 0, range(50, 100)),
+    "gray-dark": lambda: hsl_palette(0, 0, range(0, 50)),
+})
 
 
-MULTICOLOR_PALETTES = {
-    "rainbow": hsl_palette(range(0, 360), 100, 50),
-    "rainbow-reverse": list(reversed(hsl_palette(range(0, 360), 100, 50))),
-}
+MULTICOLOR_PALETTES = PaletteSet({
+    "rainbow": lambda: hsl_palette(range(0, 360), 100, 50),
+    "rainbow-reverse": lambda: list(reversed(hsl_palette(range(0, 360), 100, 50))),
+})
 
-DEFAULT_PALETTES = {
-    **GRADIENT_PALETTES,
-    **MULTICOLOR_PALETTES,
-}
+DEFAULT_PALETTES = PaletteSet.merge(GRADIENT_PALETTES, MULTICOLOR_PALETTES)
 
 
-PALETTES = {**DEFAULT_PALETTES}
+PALETTES = PaletteSet.merge(DEFAULT_PALETTES)
@@ -0,0 +1,242 @@
+"Reusable rendering pipelines, for using colorhash as a library."
+import os
+from typing import TYPE_CHECKING, BinaryIO, Callable, Iterable, Iterator
+
+from .color import ColorMatrix, colorize
+from .digest import file_digests
+from .matricizer import Matricizer, NibbleMatricizer, RandomartMatricizer
+from .palettes import PALETTES, Palette, PaletteSet, compile_palette
+from .writer import ANSIWriter, PNGWriter, SVGWriter, Writer
+
+if TYPE_CHECKING:
+    from .cache import RenderCache
+    from .timings import Timings
+
+MATRICIZERS: dict[str, type[Matricizer]] = {
+    "nibble": NibbleMatricizer,
+    "randomart": RandomartMatricizer,
+}
+
+
+def make_writer(output_type: str, square_size: int = 32) -> Writer:
+    """
+    Create a writer for an output type, with default options.
+
+    :param output_type: the output type; one of "ansi", "svg" or "png".
+    :param square_size: the size of the squares generated, in pixels (for SVG and PNG).
+    :returns: the writer.
+    """
+    match output_type:
+        case "ansi":
+            return ANSIWriter()
+        case "svg":
+            return SVGWriter(square_size)
+        case "png":
+            return PNGWriter(square_size)
+        case _:
+            raise ValueError(f"unknown output type: {output_type}")
+
+
+class Renderer:
+    """
+    A configured pipeline that turns hashes into images.
+
+    The matricizer, palette and writer are chosen once, when the renderer is created, so rendering
+    a hash only does the per-hash work. A renderer can be reused for any number of hashes:
+
+        renderer = Renderer("randomart", output="png", square_size=16)
+        png = renderer.render(hashlib.sha256(data).digest())
+
+    To find out where the time goes, pass `on_timings`. It is called with a `Timings` after every
+    render, holding the time spent in each stage and the size of the output.
+    """
+
+    def __init__(
+        self,
+        matrix: str | Matricizer = "nibble",
+        palette: str | Palette = "auto",
+        output: str | Writer = "svg",
+        square_size: int = 32,
+        cache: "RenderCache | None" = None,
+        on_timings: "Callable[[Timings], None] | None" = None,
+        palettes: PaletteSet | None = None,
+    ) -> None:
+        """
+        Create a new renderer.
+
+        :param matrix: the matricizer, or the name of one ("nibble" or "randomart").
+        :param palette: the palette, or the name of one. "auto" lets the matricizer choose the
+                        palette based on each hash.
+        :param output: the writer, or the name of an output type ("ansi", "svg" or "png").
+        :param square_size: the size of the squares generated, in pixels. Only used when the output
+                            is given by name.
+        :param cache: if supplied, rendered images are looked up in (and added to) this cache.
+        :param on_timings: if supplied, this is called with the timings of every render.
+        :param palettes: custom palettes (see `colorhash.palettefile`). If supplied, "auto" chooses
+                         from these instead of the matricizer's palettes, and palette names are
+                         looked up here before the built-in palettes.
+        """
+        if isinstance(matrix, str):
+            try:
+                matrix = MATRICIZERS[matrix]()
+            except KeyError:
+                raise ValueError(f"unknown matrix: {matrix}") from None
+        self.matricizer: Matricizer = matrix
+
+        self.palette: Palette | None
+        if isinstance(palette, str):
+            if palette == "auto":
+                self.palette = None
+            elif palettes is not None and palette in palettes:
+                self.palette = palettes[palette]
+            elif palette in PALETTES:
+                self.palette = PALETTES[palette]
+            else:
+                raise ValueError(f"unknown palette: {palette}")
+        else:
+            self.palette = compile_palette(palette)
+        self.palettes = palettes
+
+        if isinstance(output, str):
+            output = make_writer(output, square_size)
+        self.writer: Writer = output
+        self.cache = cache
+        self.on_timings = on_timings
+
+    def choose_palette(self, data: bytes) -> Palette:
+        """
+        Get the palette used for a hash.
+
+        :param data: the hash data.
+        :returns: the palette.
+        """
+        if self.palette is None:
+            return self.matricizer.choose_palette(data, self.palettes)
+        return self.palette
+
+    def colorize(self, data: bytes) -> ColorMatrix:
+        """
+        Turn a hash into a color matrix, without writing it.
+
+        :param data: the hash data.
+        :returns: the color matrix.
+        """
+        return colorize(self.choose_palette(data), self.matricizer.matricize(data))
+
+    def render(self, data: bytes, timings: "Timings | None" = None) -> bytes:
+        """
+        Render a hash.
+
+        :param data: the hash data.
+        :param timings: if supplied, the time spent in each stage is added to these timings, and
+                        they are passed to `on_timings` instead of new ones. This lets callers time
+                        earlier stages (such as hashing) themselves.
+        :returns: the rendered image.
+        """
+        if timings is not None or self.on_timings is not None:
+            timings = self._timings(timings)
+            output = self._render_timed(data, timings)
+            timings.bytes_out += len(output)
+            self._report(timings)
+            return output
+        if self.cache is None:
+            return self.writer.write(self.colorize(data))
+        from .cache import render_key  # pylint: disable=import-outside-toplevel
+
+        key = render_key(data, self.matricizer, self.choose_palette(data), self.writer)
+        return self.cache.get_or_render(key, lambda: self.writer.write(self.colorize(data)))
+
+    def render_to(self, data: bytes, fp: BinaryIO, timings: "Timings | None" = None) -> int:
+        """
+        Render a hash straight to a binary file object.
+
+        :param data: the hash data.
+        :param fp: the file object to write the image to.
+        :param timings: if supplied, the time spent in each stage is added to these timings (see
+                        `render`).
+        :returns: the number of bytes written.
+        """
+        if timings is not None or self.on_timings is not None:
+            timings = self._timings(timings)
+            if self.cache is None:
+                matrix = self._colorize_timed(data, timings)
+                with timings.stage("write"):
+                    written = self.writer.write_to(matrix, fp)
+            else:
+                output = self._render_timed(data, timings)
+                with timings.stage("write"):
+                    fp.write(output)
+                written = len(output)
+            timings.bytes_out += written
+            self._report(timings)
+            return written
+        if self.cache is None:
+            return self.writer.write_to(self.colorize(data), fp)
+        output = self.render(data)
+        fp.write(output)
+        return len(output)
+
+    def _timings(self, timings: "Timings | None") -> "Timings":
+        if timings is not None:
+            return timings
+        from .timings import Timings  # pylint: disable=import-outside-toplevel
+
+        return Timings()
+
+    def _report(self, timings: "Timings") -> None:
+        if self.on_timings is not None:
+            self.on_timings(timings)
+
+    def _colorize_timed(self, data: bytes, timings: "Timings") -> ColorMatrix:
+        with timings.stage("matricize"):
+            matrix = self.matricizer.matricize(data)
+        with timings.stage("colorize"):
+            return colorize(self.choose_palette(data), matrix)
+
+    def _render_timed(self, data: bytes, timings: "Timings") -> bytes:
+        if self.cache is not None:
+            from .cache import render_key  # pylint: disable=import-outside-toplevel
+
+            with timings.stage("cache"):
+                key = render_key(data, self.matricizer, self.choose_palette(data), self.writer)
+                output = self.cache.get(key)
+            if output is not None:
+                return output
+        matrix = self._colorize_timed(data, timings)
+        with timings.stage("write"):
+            output = self.writer.write(matrix)
+        if self.cache is not None:
+            with timings.stage("cache"):
+                self.cache.put(key, output)
+        return output
+
+    def render_many(self, digests: Iterable[bytes]) -> Iterator[bytes]:
+        """
+        Render many hashes, lazily.
+
+        :param digests: the hashes to render.
+        :returns: an iterator over the rendered images, in the same order as the hashes.
+        """
+        for data in digests:
+            yield self.render(data)
+
+    def render_file(self, path: str | os.PathLike, algo: str = "sha512") -> bytes:
+        """
+        Hash a file and render the hash.
+
+        :param path: the path to the file.
+        :param algo: the hash algorithm to use.
+        :returns: the rendered image.
+        """
+        if self.on_timings is None:
+            with open(path, "rb") as fp:
+                return self.render(file_digests(fp, [algo])[algo])
+
+        timings = self._timings(None)
+        timings.item = os.fspath(path)
+        timings.algo = algo
+        with timings.stage("digest"):
+            with open(path, "rb") as fp:
+                timings.bytes_in = os.fstat(fp.fileno()).st_size
+                data = file_digests(fp, [algo])[algo]
+        return self.render(data, timings)
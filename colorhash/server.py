@@ -0,0 +1,485 @@
+"A long-running HTTP server that renders art, so callers don't pay for process startup per image."
+import argparse
+import asyncio
+import hashlib
+import sys
+import urllib.parse
+from http import HTTPStatus
+from typing import Collection
+
+from .cache import CACHE_VERSION, RenderCache, render_key
+from .matricizer import detect_hash_algorithm
+from .pipeline import Renderer
+
+HASH_CHOICES = ["md5", "sha1", "sha224", "sha256", "sha384", "sha512"]
+
+CONTENT_TYPES = {
+    "ansi": "text/plain; charset=utf-8",
+    "svg": "image/svg+xml",
+    "png": "image/png",
+}
+
+# Largest allowed square size, so that a single request can't ask for a gigantic image.
+MAX_SQUARE_SIZE = 256
+
+# Uploads larger than this are hashed in a worker thread instead of on the event loop.
+THREAD_HASH_SIZE = 1 << 20
+
+# Most header lines, and largest total size of the headers, allowed in a single request.
+MAX_HEADER_LINES = 100
+MAX_HEADER_SIZE = 64 << 10
+
+# Most tiles allowed in a single atlas request.
+MAX_ATLAS_TILES = 1024
+
+# Largest allowed gap between atlas tiles, in squares.
+MAX_ATLAS_GAP = 16
+
+# Largest allowed atlas, in pixels (width times height), so that a single request can't tie up the
+# server building a gigantic image.
+MAX_ATLAS_PIXELS = 1 << 24
+
+
+class HTTPError(Exception):
+    "An error that is reported to the client with the given status."
+
+    def __init__(self, status: HTTPStatus, message: str | None = None) -> None:
+        super().__init__(message or status.phrase)
+        self.status = status
+
+
+class RenderServer:
+    """
+    An HTTP/1.1 server that renders art for hashes.
+
+    The server has a single endpoint, `/render`:
+
+    * `GET /render?digest=HEX` renders the given hexadecimal hash. The hash algorithm is detected
+      from the length of the hash.
+    * `POST /render?algo=ALGORITHM` hashes the request body with the given algorithm (default:
+      sha512) and renders the hash.
+
+    Both accept the `matrix` (nibble, randomart), `palette` (auto, or a palette name), `format`
+    (svg, png, ansi) and `size` (square size in pixels) query parameters.
+
+    Many hashes can be rendered into a single image (an atlas) with
+    `GET /atlas?digests=HEX,HEX,...`, which takes the same parameters (except that the format must
+    be svg or png) plus `columns` and `gap` (in squares). `GET /atlas.json` with the same
+    parameters returns the index of the atlas: where each tile is in the image. Atlases are limited
+    to `MAX_ATLAS_TILES` tiles and `MAX_ATLAS_PIXELS` pixels.
+
+    Connections are kept alive between requests. Responses carry an ETag derived from the hash and
+    render options, and `If-None-Match` is answered with 304 Not Modified.
+
+    Images that are not cached are rendered in worker threads, so a slow render never holds up other
+    connections. A request's headers and body must arrive within `read_timeout`.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 64,
+        max_body_size: int = 64 << 20,
+        cache_size: int = 1024,
+        keep_alive_timeout: float = 15.0,
+        read_timeout: float = 30.0,
+    ) -> None:
+        """
+        Create a new render server.
+
+        :param max_concurrency: the maximum number of requests handled at once. Further requests
+                                wait for a slot.
+        :param max_body_size: the largest request body accepted, in bytes.
+        :param cache_size: the number of rendered images kept in memory.
+        :param keep_alive_timeout: how long an idle connection is kept open, in seconds.
+        :param read_timeout: how long the headers and body of a request may take to arrive, in
+                             seconds.
+        """
+        self.max_body_size = max_body_size
+        self.keep_alive_timeout = keep_alive_timeout
+        self.read_timeout = read_timeout
+        self.cache = RenderCache(cache_size)
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._renderers: dict[tuple[str, str, str, int], Renderer] = {}
+
+    def _renderer(
+        self, matrix: str, palette: str, output_type: str, square_size: int
+    ) -> Renderer:
+        key = (matrix, palette, output_type, square_size)
+        renderer = self._renderers.get(key)
+        if renderer is None:
+            try:
+                renderer = Renderer(matrix, palette, output_type, square_size, self.cache)
+            except ValueError as ex:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, str(ex)) from ex
+            self._renderers[key] = renderer
+        return renderer
+
+    async def render(
+        self,
+        method: str,
+        query: dict[str, str],
+        body: bytes,
+        etags: Collection[str] = (),
+    ) -> tuple[bytes | None, str, str]:
+        """
+        Render the art for a single request.
+
+        :param method: the request method.
+        :param query: the query parameters of the request.
+        :param body: the request body.
+        :param etags: the ETags the client already has (from `If-None-Match`).
+        :returns: the rendered image, its content type and its ETag. If the ETag is one of `etags`,
+                  nothing is rendered, and the image is None.
+        """
+        match method:
+            case "GET" | "HEAD":
+                try:
+                    hashdata = bytes.fromhex(query.get("digest", ""))
+                except ValueError as ex:
+                    raise HTTPError(HTTPStatus.BAD_REQUEST, "malformed digest") from ex
+                if detect_hash_algorithm(hashdata) is None:
+                    raise HTTPError(HTTPStatus.BAD_REQUEST, "unknown digest length")
+            case "POST":
+                algo = query.get("algo", "sha512")
+                if algo not in HASH_CHOICES:
+                    raise HTTPError(HTTPStatus.BAD_REQUEST, f"unknown algo: {algo}")
+                if len(body) > THREAD_HASH_SIZE:
+                    hashdata = await asyncio.to_thread(lambda: hashlib.new(algo, body).digest())
+                else:
+                    hashdata = hashlib.new(algo, body).digest()
+            case _:
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED)
+
+        output_type = query.get("format", "svg")
+        try:
+            square_size = int(query.get("size", "32"))
+        except ValueError as ex:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "malformed size") from ex
+        if not 1 <= square_size <= MAX_SQUARE_SIZE:
+            raise HTTPError(
+                HTTPStatus.BAD_REQUEST, f"size must be between 1 and {MAX_SQUARE_SIZE}"
+            )
+        renderer = self._renderer(
+            query.get("matrix", "nibble"),
+            query.get("palette", "auto"),
+            output_type,
+            square_size,
+        )
+
+        key = render_key(
+            hashdata, renderer.matricizer, renderer.choose_palette(hashdata), renderer.writer
+        )
+        etag = '"' + hashlib.sha256(repr(key).encode()).hexdigest()[:32] + '"'
+        if etag in etags:
+            return None, CONTENT_TYPES[output_type], etag
+        output = self.cache.get(key)
+        if output is None:
+            # rendering a large image takes a while, so keep it off the event loop
+            output = await asyncio.to_thread(
+                lambda: renderer.writer.write(renderer.colorize(hashdata))
+            )
+            self.cache.put(key, output)
+        return output, CONTENT_TYPES[output_type], etag
+
+    def render_atlas(
+        self, path: str, query: dict[str, str], etags: Collection[str] = ()
+    ) -> tuple[bytes | None, str, str]:
+        """
+        Render an atlas, or its index, for a single request.
+
+        :param path: the request path; "/atlas" for the image, or "/atlas.json" for the index.
+        :param query: the query parameters of the request.
+        :param etags: the ETags the client already has (from `If-None-Match`).
+        :returns: the atlas image or index, its content type and its ETag. If the ETag is one of
+                  `etags`, nothing is rendered, and the image or index is None.
+        """
+        # pylint: disable=import-outside-toplevel
+        import json
+
+        from .atlas import PNGAtlasWriter, SVGAtlasWriter
+
+        try:
+            digests = [bytes.fromhex(digest) for digest in query.get("digests", "").split(",")]
+            square_size = int(query.get("size", "32"))
+            columns = int(query["columns"]) if "columns" in query else None
+            gap = int(query.get("gap", "1"))
+        except ValueError as ex:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "malformed query") from ex
+        if len(digests) > MAX_ATLAS_TILES:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"at most {MAX_ATLAS_TILES} digests allowed")
+        if any(detect_hash_algorithm(digest) is None for digest in digests):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "unknown digest length")
+        if not 1 <= square_size <= MAX_SQUARE_SIZE:
+            raise HTTPError(
+                HTTPStatus.BAD_REQUEST, f"size must be between 1 and {MAX_SQUARE_SIZE}"
+            )
+        if columns is not None and columns < 1:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "malformed columns")
+        if not 0 <= gap <= MAX_ATLAS_GAP:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"gap must be between 0 and {MAX_ATLAS_GAP}")
+
+        output_type = query.get("format", "svg")
+        atlas: SVGAtlasWriter | PNGAtlasWriter
+        match output_type:
+            case "svg":
+                atlas = SVGAtlasWriter(square_size, columns, gap)
+            case "png":
+                atlas = PNGAtlasWriter(square_size, columns, gap)
+            case _:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "atlas format must be svg or png")
+        # the writer doesn't matter; only the matricizer and palette are used
+        renderer = self._renderer(
+            query.get("matrix", "nibble"), query.get("palette", "auto"), output_type, square_size
+        )
+        etag_key = (CACHE_VERSION, path, renderer.matricizer.__class__.__qualname__,
+                    query.get("palette", "auto"), output_type, square_size, columns, gap,
+                    tuple(digests))
+        etag = '"' + hashlib.sha256(repr(etag_key).encode()).hexdigest()[:32] + '"'
+        content_type = "application/json" if path == "/atlas.json" else CONTENT_TYPES[output_type]
+        if etag in etags:
+            return None, content_type, etag
+
+        tiles = [renderer.colorize(digest) for digest in digests]
+        grid_columns, grid_rows, cell_w, cell_h = atlas.layout(tiles)
+        width = (grid_columns * (cell_w + gap) - gap) * square_size
+        height = (grid_rows * (cell_h + gap) - gap) * square_size
+        if width * height > MAX_ATLAS_PIXELS:
+            raise HTTPError(
+                HTTPStatus.BAD_REQUEST,
+                f"atlas too large: {width}x{height} pixels (at most {MAX_ATLAS_PIXELS} allowed)",
+            )
+        if path == "/atlas.json":
+            index = atlas.index(tiles, [digest.hex() for digest in digests])
+            return json.dumps(index).encode(), content_type, etag
+        return atlas.write(tiles), content_type, etag
+
+    async def handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        "Handle every request on a single (possibly kept alive) connection."
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(
+                        reader.readuntil(b"\r\n"), self.keep_alive_timeout
+                    )
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+                    break
+                keep_alive = await self._handle_request(request_line, reader, writer)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle_request(
+        self,
+        request_line: bytes,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> bool:
+        parts = request_line.decode("latin-1").rstrip("\r\n").split(" ")
+        if len(parts) != 3 or not parts[2].startswith("HTTP/1."):
+            self._respond(writer, HTTPStatus.BAD_REQUEST, b"malformed request line\n")
+            return False
+        method, target, version = parts
+
+        try:
+            headers = await asyncio.wait_for(self._read_headers(reader), self.read_timeout)
+        except asyncio.TimeoutError:
+            self._respond(writer, HTTPStatus.REQUEST_TIMEOUT, b"request timed out\n")
+            return False
+        if headers is None:
+            self._respond(
+                writer, HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, b"request headers too large\n"
+            )
+            return False
+
+        connection = headers.get("connection", "").lower()
+        if version == "HTTP/1.0":
+            keep_alive = connection == "keep-alive"
+        else:
+            keep_alive = connection != "close"
+
+        if "transfer-encoding" in headers:
+            self._respond(writer, HTTPStatus.LENGTH_REQUIRED, b"chunked uploads are not supported\n")
+            return False
+        content_length = headers.get("content-length", "0")
+        if not (content_length.isascii() and content_length.isdigit()):
+            self._respond(writer, HTTPStatus.BAD_REQUEST, b"malformed Content-Length\n")
+            return False
+        length = int(content_length)
+        if length > self.max_body_size:
+            self._respond(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, b"request body too large\n")
+            return False
+        try:
+            body = await asyncio.wait_for(reader.readexactly(length), self.read_timeout)
+        except asyncio.TimeoutError:
+            self._respond(writer, HTTPStatus.REQUEST_TIMEOUT, b"request timed out\n")
+            return False
+
+        url = urllib.parse.urlsplit(target)
+        if url.path not in ("/render", "/atlas", "/atlas.json"):
+            self._respond(writer, HTTPStatus.NOT_FOUND, b"not found\n", keep_alive)
+            return keep_alive
+        query = dict(urllib.parse.parse_qsl(url.query))
+        # checked before rendering, so that conditional requests are cheap
+        etags = {tag.strip() for tag in headers.get("if-none-match", "").split(",")} - {""}
+
+        async with self._slots:
+            try:
+                if url.path == "/render":
+                    output, content_type, etag = await self.render(method, query, body, etags)
+                elif method in ("GET", "HEAD"):
+                    # an atlas is a lot of work at once, so keep it off the event loop
+                    output, content_type, etag = await asyncio.to_thread(
+                        self.render_atlas, url.path, query, etags
+                    )
+                else:
+                    raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED)
+            except HTTPError as ex:
+                self._respond(writer, ex.status, f"{ex}\n".encode(), keep_alive)
+                return keep_alive
+            except ValueError as ex:
+                self._respond(writer, HTTPStatus.BAD_REQUEST, f"{ex}\n".encode(), keep_alive)
+                return keep_alive
+
+        extra = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+        if output is None:
+            self._respond(writer, HTTPStatus.NOT_MODIFIED, b"", keep_alive, extra=extra)
+        else:
+            extra["Content-Type"] = content_type
+            self._respond(
+                writer, HTTPStatus.OK, output, keep_alive, extra=extra, head=method == "HEAD"
+            )
+        return keep_alive
+
+    @staticmethod
+    async def _read_headers(reader: asyncio.StreamReader) -> dict[str, str] | None:
+        "Read the headers of a request. Returns None if there are too many of them."
+        headers: dict[str, str] = {}
+        size = 0
+        for _ in range(MAX_HEADER_LINES + 1):
+            line = await reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                return headers
+            size += len(line)
+            if size > MAX_HEADER_SIZE:
+                return None
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return None
+
+    @staticmethod
+    def _respond(
+        writer: asyncio.StreamWriter,
+        status: HTTPStatus,
+        body: bytes,
+        keep_alive: bool = False,
+        extra: dict[str, str] | None = None,
+        head: bool = False,
+    ) -> None:
+        headers = {
+            "Content-Length": str(len(body)),
+            "Connection": "keep-alive" if keep_alive else "close",
+        }
+        if status >= 400:
+            headers["Content-Type"] = "text/plain; charset=utf-8"
+        headers.update(extra or {})
+        if status == HTTPStatus.NOT_MODIFIED:
+            del headers["Content-Length"]
+        lines = [f"HTTP/1.1 {status.value} {status.phrase}"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        if not head:
+            writer.write(body)
+
+
+async def serve(
+    server: RenderServer,
+    host: str | None = None,
+    port: int | None = None,
+    unix: str | None = None,
+) -> None:
+    """
+    Run a render server until it is cancelled.
+
+    :param server: the render server to run.
+    :param host: the host to listen on, for TCP.
+    :param port: the port to listen on, for TCP.
+    :param unix: the path of a Unix socket to listen on, instead of TCP.
+    """
+    if unix is not None:
+        listener = await asyncio.start_unix_server(server.handle_connection, path=unix)
+    else:
+        listener = await asyncio.start_server(server.handle_connection, host, port)
+    async with listener:
+        await listener.serve_forever()
+
+
+def serve_main(argv: list[str]) -> None:
+    "Entrypoint for the `serve` subcommand."
+    progname: str = sys.argv[0]
+    if progname.endswith("__main__.py"):
+        progname = "colorhash"
+
+    ap = argparse.ArgumentParser(
+        prog=f"{progname} serve",
+        description="Run an HTTP server that renders art for hashes. "
+        "GET /render?digest=HEX renders a hexadecimal hash; POST /render?algo=ALGORITHM renders "
+        "the hash of the request body. Both accept the matrix, palette, format (svg, png, ansi) "
+        "and size query parameters.",
+    )
+    ap.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="The host to listen on. default: 127.0.0.1",
+    )
+    ap.add_argument(
+        "--port",
+        type=int,
+        default=8420,
+        help="The TCP port to listen on. default: 8420",
+    )
+    ap.add_argument(
+        "--unix",
+        metavar="PATH",
+        help="Listen on a Unix socket at this path instead of a TCP port.",
+    )
+    ap.add_argument(
+        "--max-concurrency",
+        metavar="N",
+        type=int,
+        default=64,
+        help="The maximum number of requests handled at once. default: 64",
+    )
+    ap.add_argument(
+        "--max-body-size",
+        metavar="BYTES",
+        type=int,
+        default=64 << 20,
+        help="The largest request body accepted, in bytes. default: 64MiB",
+    )
+    ap.add_argument(
+        "--cache-size",
+        metavar="N",
+        type=int,
+        default=1024,
+        help="The number of rendered images kept in memory. default: 1024",
+    )
+    args = ap.parse_args(argv)
+
+    async def run() -> None:
+        server = RenderServer(
+            max_concurrency=args.max_concurrency,
+            max_body_size=args.max_body_size,
+            cache_size=args.cache_size,
+        )
+        await serve(server, args.host, args.port, args.unix)
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
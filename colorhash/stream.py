@@ -0,0 +1,190 @@
+"""
+Streaming mode: read records from a stream and render each one as soon as it arrives.
+
+Records are read with `read1`, so a record is rendered as soon as its delimiter arrives rather than
+when a whole buffer has filled up. Only one record is held in memory at a time (up to a maximum
+size), and every output is flushed before the next record is read, so a slow reader of the output
+slows down the reading of the input instead of letting output pile up in memory.
+"""
+import os
+import struct
+from typing import TYPE_CHECKING, BinaryIO, Callable, Iterator, Sequence
+
+from .digest import hash_input
+
+if TYPE_CHECKING:
+    from .pipeline import Renderer
+    from .timings import Timings
+
+DELIMITERS = {
+    "lines": b"\n",
+    "nul": b"\0",
+}
+
+# The largest record accepted by default. Longer records are skipped.
+DEFAULT_MAX_RECORD_SIZE = 1 << 20
+
+READ_SIZE = 1 << 16
+
+# Frames are prefixed with their length, as a 32 bit big-endian unsigned integer.
+FRAME_HEADER = struct.Struct(">I")
+
+
+def iter_records(
+    fp: BinaryIO, delimiter: bytes = b"\n", max_size: int = DEFAULT_MAX_RECORD_SIZE
+) -> Iterator[bytes | None]:
+    """
+    Read delimited records from a binary stream, yielding each one as soon as it is complete.
+
+    :param fp: the stream to read from. It should support `read1` (like `sys.stdin.buffer`);
+               plain `read` is used otherwise.
+    :param delimiter: the byte that ends each record. The delimiter is not included in the records.
+                      A final record without a delimiter is still yielded, unless it is empty.
+    :param max_size: the largest record allowed, in bytes. Longer records are skipped without being
+                     held in memory, and None is yielded in their place.
+    :returns: an iterator over the records.
+    """
+    read = getattr(fp, "read1", fp.read)
+    buf = bytearray()
+    skipping = False
+    while True:
+        chunk = read(READ_SIZE)
+        if not chunk:
+            break
+        start = 0
+        while True:
+            end = chunk.find(delimiter, start)
+            if end < 0:
+                break
+            if skipping:
+                skipping = False
+            elif len(buf) + end - start > max_size:
+                yield None
+            else:
+                buf += chunk[start:end]
+                yield bytes(buf)
+            buf.clear()
+            start = end + 1
+        if not skipping:
+            buf += chunk[start:]
+            if len(buf) > max_size:
+                # too long already; drop what we have and ignore the rest of the record
+                buf.clear()
+                skipping = True
+                yield None
+    if buf:
+        yield bytes(buf)
+
+
+def write_frame(fp: BinaryIO, payload: bytes) -> int:
+    """
+    Write a length-prefixed frame.
+
+    :param fp: the file object to write to.
+    :param payload: the contents of the frame.
+    :returns: the number of bytes written.
+    """
+    return fp.write(FRAME_HEADER.pack(len(payload))) + fp.write(payload)
+
+
+def _digest_record(record: bytes, input_type: str, algos: Sequence[str]) -> dict[str, bytes]:
+    if input_type == "hash":
+        return {"hash": bytes.fromhex(record.decode("ascii"))}
+    import hashlib  # pylint: disable=import-outside-toplevel
+
+    # records are hashed as they are, without decoding them
+    return {algo: hashlib.new(algo, record).digest() for algo in algos}
+
+
+def render_stream(
+    infile: BinaryIO,
+    outfile: BinaryIO,
+    renderer: "Renderer",
+    input_type: str,
+    algos: Sequence[str],
+    frames: bool,
+    delimiter: bytes = b"\n",
+    max_size: int = DEFAULT_MAX_RECORD_SIZE,
+    on_error: Callable[[int, str], None] | None = None,
+    make_timings: "Callable[[str], Timings] | None" = None,
+) -> int:
+    """
+    Render every record of a stream, writing each output as soon as its record has been read.
+
+    :param infile: the stream to read records from.
+    :param outfile: the stream to write outputs to.
+    :param renderer: the renderer to use.
+    :param input_type: how each record should be treated; one of "path", "tree", "hash" or
+                       "data". Hash records may be surrounded by whitespace, and blank hash records
+                       are ignored. The hash algorithm of hash records is detected from their
+                       length.
+    :param algos: the hash algorithms to use, for the path and data input types. Each record is
+                  rendered once for each algorithm.
+    :param frames: if True, each output is written as a length-prefixed frame (see `write_frame`),
+                   and a record that could not be rendered is written as an empty frame for each
+                   algorithm, so frames always line up with records. If False, outputs are written
+                   as they are, followed by a newline, and records that could not be rendered are
+                   left out.
+    :param delimiter: the byte that ends each record.
+    :param max_size: the largest record allowed, in bytes.
+    :param on_error: if supplied, this is called with the (zero-based) record number and an error
+                     message for every record that could not be rendered.
+    :param make_timings: if supplied, this is called to create the timings for each record, which
+                         are then filled in and passed to the renderer.
+    :returns: the number of records that could not be rendered.
+    """
+    failed = 0
+    for index, record in enumerate(iter_records(infile, delimiter, max_size)):
+        outputs: list[tuple[bytes, "Timings | None"]] = []
+        try:
+            if record is None:
+                raise ValueError(f"record is longer than {max_size} bytes")
+            if input_type == "hash":
+                record = record.strip()
+                if not record:
+                    continue
+            timings = make_timings(f"record {index}") if make_timings is not None else None
+            if input_type in ("path", "tree"):
+                digests = hash_input(os.fsdecode(record), input_type, algos, timings=timings)
+            elif timings is None:
+                digests = _digest_record(record, input_type, algos)
+            else:
+                with timings.stage("digest"):
+                    digests = _digest_record(record, input_type, algos)
+                timings.bytes_in = len(record)
+            for i, (algo, hashdata) in enumerate(digests.items()):
+                algo_timings = None
+                if timings is not None:
+                    algo_timings = make_timings(timings.item or "")  # type: ignore
+                    algo_timings.algo = algo if input_type != "hash" else None
+                    if i == 0:
+                        algo_timings.bytes_in = timings.bytes_in
+                        algo_timings.stages.update(timings.stages)
+                outputs.append((hashdata, algo_timings))
+        except (OSError, ValueError) as ex:
+            failed += 1
+            if on_error is not None:
+                on_error(index, str(ex))
+            if frames:
+                for _ in range(1 if input_type == "hash" else len(algos)):
+                    write_frame(outfile, b"")
+                outfile.flush()
+            continue
+
+        for hashdata, timings in outputs:
+            try:
+                output = renderer.render(hashdata, timings)
+            except ValueError as ex:
+                failed += 1
+                if on_error is not None:
+                    on_error(index, str(ex))
+                output = b""
+                if not frames:
+                    continue
+            if frames:
+                write_frame(outfile, output)
+            else:
+                outfile.write(output)
+                outfile.write(b"\n")
+        outfile.flush()
+    return failed
@@ -0,0 +1,191 @@
+"Timing of each stage of turning an input into art, for finding out where the time goes."
+import contextlib
+import json
+import math
+import time
+from typing import Iterator
+
+# The stages, in the order they happen. "cache" is the render cache lookup (including computing
+# the cache key); on a cache hit, it is the only stage after "digest".
+STAGES = ["digest", "cache", "matricize", "colorize", "write"]
+
+# The percentiles reported by `TimingsSummary`.
+PERCENTILES = [50, 90, 99]
+
+
+def format_seconds(seconds: float) -> str:
+    "Format a duration for people to read."
+    if seconds >= 1:
+        return f"{seconds:.2f}s"
+    if seconds >= 0.001:
+        return f"{seconds * 1000:.2f}ms"
+    return f"{seconds * 1_000_000:.1f}us"
+
+
+def format_bytes(size: int) -> str:
+    "Format a size in bytes for people to read."
+    for unit in ["B", "KiB", "MiB"]:
+        if size < 1024:
+            return f"{size}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+        size /= 1024  # type: ignore
+    return f"{size:.1f}GiB"
+
+
+class Timings:
+    """
+    The wall time spent in each stage of rendering a single input, and the number of bytes that
+    went in and came out.
+
+    Stages are timed with `stage`:
+
+        timings = Timings("file.txt")
+        with timings.stage("digest"):
+            ...
+    """
+
+    def __init__(self, item: str | None = None, algo: str | None = None) -> None:
+        """
+        Create new, empty timings.
+
+        :param item: the input being rendered, if known.
+        :param algo: the hash algorithm, if known.
+        """
+        self.item = item
+        self.algo = algo
+        self.stages: dict[str, float] = {}
+        # the size of the input that was hashed, when it is known (it is not known for STDIN)
+        self.bytes_in: int | None = None
+        self.bytes_out = 0
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Time a stage. Time spent in the same stage more than once is added up.
+
+        :param name: the name of the stage; usually one of `STAGES`.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    @property
+    def total(self) -> float:
+        "The total time spent in every stage, in seconds."
+        return sum(self.stages.values())
+
+    def as_dict(self) -> dict:
+        "Get the timings as a dictionary, suitable for JSON. Times are in seconds."
+        return {
+            "item": self.item,
+            "algo": self.algo,
+            "stages": self.stages,
+            "total": self.total,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+        }
+
+    def format(self) -> str:
+        "Format the timings as a single line for people to read."
+        label = self.item or "-"
+        if self.algo is not None:
+            label += f" ({self.algo})"
+        parts = [f"{name} {format_seconds(seconds)}" for name, seconds in self.stages.items()]
+        parts.append(f"total {format_seconds(self.total)}")
+        if self.bytes_in is not None:
+            parts.append(f"in {format_bytes(self.bytes_in)}")
+        parts.append(f"out {format_bytes(self.bytes_out)}")
+        return f"{label}: " + "  ".join(parts)
+
+
+def percentile(values: list[float], p: float) -> float:
+    """
+    Get a percentile of some values, using the nearest-rank method.
+
+    :param values: the values, sorted.
+    :param p: the percentile, from 0 to 100.
+    :returns: the value at that percentile.
+    """
+    return values[max(0, min(len(values) - 1, math.ceil(p / 100 * len(values)) - 1))]
+
+
+class TimingsSummary:
+    "Percentiles of the time spent in each stage, over many renders."
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._stages: dict[str, list[float]] = {}
+        self._totals: list[float] = []
+
+    def add(self, timings: Timings) -> None:
+        """
+        Add the timings of a single render.
+
+        :param timings: the timings to add.
+        """
+        self.count += 1
+        self.bytes_in += timings.bytes_in or 0
+        self.bytes_out += timings.bytes_out
+        for name, seconds in timings.stages.items():
+            self._stages.setdefault(name, []).append(seconds)
+        self._totals.append(timings.total)
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        """
+        Get statistics for each stage, plus the total.
+
+        :returns: for each stage (in `STAGES` order, followed by any others and then "total"), the
+                  number of renders that went through it, the sum of its times, each of
+                  `PERCENTILES` (as "p50" etc.) and the maximum. Times are in seconds.
+        """
+        order = [name for name in STAGES if name in self._stages]
+        order += [name for name in self._stages if name not in STAGES]
+        result = {}
+        for name, values in [(name, self._stages[name]) for name in order] + [
+            ("total", self._totals)
+        ]:
+            if not values:
+                continue
+            values = sorted(values)
+            stats = {"count": len(values), "sum": sum(values)}
+            for p in PERCENTILES:
+                stats[f"p{p}"] = percentile(values, p)
+            stats["max"] = values[-1]
+            result[name] = stats
+        return result
+
+    def as_dict(self) -> dict:
+        "Get the summary as a dictionary, suitable for JSON. Times are in seconds."
+        return {
+            "count": self.count,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "stages": self.stats(),
+        }
+
+    def format(self) -> str:
+        "Format the summary as a table for people to read."
+        columns = ["count", "sum"] + [f"p{p}" for p in PERCENTILES] + ["max"]
+        lines = [
+            f"{self.count} renders, {format_bytes(self.bytes_in)} in, "
+            f"{format_bytes(self.bytes_out)} out",
+            f"{'stage':10}" + "".join(f"{column:>10}" for column in columns),
+        ]
+        for name, stats in self.stats().items():
+            cells = [str(stats["count"])] + [format_seconds(stats[c]) for c in columns[1:]]
+            lines.append(f"{name:10}" + "".join(f"{cell:>10}" for cell in cells))
+        return "\n".join(lines)
+
+
+def json_line(kind: str, data: dict) -> str:
+    """
+    Format timings as a single JSON line.
+
+    :param kind: what the line holds; "render" for a single render, or "summary".
+    :param data: the timings, from `Timings.as_dict` or `TimingsSummary.as_dict`.
+    :returns: the JSON line, without a trailing newline.
+    """
+    return json.dumps({"type": kind, **data}, separators=(",", ":"))
@@ -0,0 +1,161 @@
+"""
+Merkle-style digests of whole directory trees.
+
+The digest of a directory is the hash of its sorted entries, where each entry is a kind byte, the
+entry name, a NUL byte and the digest of the entry:
+
+* `f` - a regular file; the digest is the hash of its contents
+* `x` - a regular file that is executable by its owner; as above
+* `l` - a symbolic link (which is not followed); the digest is the hash of the link target
+* `d` - a directory; the digest is the digest of that directory, computed the same way
+
+Entries are sorted by name, as bytes. Anything else (sockets, FIFOs, devices) is left out. The
+digest only depends on the names, kinds and contents in the tree, so the same tree gives the same
+digest on any machine.
+
+With a `DigestCache`, file hashes are cached as usual, and the digest of every subtree is cached
+as well, keyed by the names and `stat` results of everything underneath it. A subtree in which
+nothing has changed is not read at all, so re-fingerprinting a mostly unchanged tree only hashes
+the files that changed.
+"""
+import hashlib
+import os
+import stat
+import time
+from typing import TYPE_CHECKING, Sequence
+
+from .batch import imap_ordered
+from .digest import file_digests
+from .digestcache import RACY_SECONDS
+
+if TYPE_CHECKING:
+    from .digestcache import DigestCache
+
+
+class _Node:
+    "A directory in the tree being fingerprinted."
+
+    __slots__ = ("path", "entries", "key", "racy", "digests")
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        # (name, kind, child), sorted by name. The child is a _Node for directories, the stat
+        # result for files and the link target for symbolic links.
+        self.entries: list[tuple[bytes, bytes, "_Node | os.stat_result | bytes"]] = []
+        # the subtree cache key, and whether anything in the subtree was modified too recently to
+        # be cached
+        self.key = b""
+        self.racy = False
+        # the digest for each algorithm, once known
+        self.digests: dict[str, bytes] | None = None
+
+
+def _scan(path: str, algos: Sequence[str], now_ns: int) -> _Node:
+    """
+    Read a directory tree, and work out the subtree cache key of every directory in it.
+
+    The key of a directory covers the name, kind and `stat` signature (device, inode, mode, size
+    and modification time) of every entry, and the keys of its subdirectories, so it changes
+    whenever anything underneath the directory changes.
+    """
+    node = _Node(path)
+    with os.scandir(path) as it:
+        entries = sorted(it, key=lambda entry: os.fsencode(entry.name))
+    key = hashlib.sha256(",".join(algos).encode() + b"\0")
+    for entry in entries:
+        name = os.fsencode(entry.name)
+        if entry.is_symlink():
+            target = os.fsencode(os.readlink(entry.path))
+            node.entries.append((name, b"l", target))
+            key.update(b"l" + name + b"\0" + len(target).to_bytes(4, "big") + target)
+        elif entry.is_dir(follow_symlinks=False):
+            child = _scan(entry.path, algos, now_ns)
+            node.racy = node.racy or child.racy
+            node.entries.append((name, b"d", child))
+            key.update(b"d" + name + b"\0" + child.key)
+        elif entry.is_file(follow_symlinks=False):
+            st = entry.stat(follow_symlinks=False)
+            kind = b"x" if st.st_mode & stat.S_IXUSR else b"f"
+            node.racy = node.racy or now_ns - st.st_mtime_ns < RACY_SECONDS * 1_000_000_000
+            node.entries.append((name, kind, st))
+            key.update(
+                kind
+                + name
+                + b"\0"
+                + b",".join(
+                    str(v).encode()
+                    for v in (st.st_dev, st.st_ino, st.st_mode, st.st_size, st.st_mtime_ns)
+                )
+            )
+    node.key = key.digest()
+    return node
+
+
+def tree_digests(
+    root: str,
+    algos: Sequence[str],
+    digest_cache: "DigestCache | None" = None,
+    jobs: int = 1,
+) -> dict[str, bytes]:
+    """
+    Get the Merkle-style digest of a directory tree (see the module documentation).
+
+    :param root: the directory to fingerprint.
+    :param algos: the hash algorithms to use. Every file is read once, for all of them.
+    :param digest_cache: if supplied, file hashes and subtree digests are looked up in (and added
+                         to) this cache.
+    :param jobs: the number of files to hash at once.
+    :returns: the digest of the tree for each algorithm.
+    """
+    if not os.path.isdir(root):
+        raise NotADirectoryError(f"not a directory: {root}")
+    tree = _scan(root, algos, time.time_ns())
+
+    # Find the subtrees that are cached, and the files underneath the ones that are not
+    files: list[str] = []
+    todo = [tree]
+    while todo:
+        node = todo.pop()
+        if digest_cache is not None:
+            node.digests = digest_cache.lookup_subtree(node.key)
+            if node.digests is not None:
+                continue
+        for name, kind, child in node.entries:
+            if kind == b"d":
+                todo.append(child)  # type: ignore
+            elif kind in (b"f", b"x"):
+                files.append(os.path.join(node.path, os.fsdecode(name)))
+
+    def hash_file(path: str) -> dict[str, bytes]:
+        with open(path, "rb") as fp:
+            if digest_cache is not None:
+                return digest_cache.digests(fp, algos, file_digests)
+            return file_digests(fp, algos)
+
+    file_hashes: dict[str, dict[str, bytes]] = {}
+    for path, digests, error in imap_ordered(hash_file, files, jobs):
+        if error is not None:
+            raise error
+        assert digests is not None
+        file_hashes[path] = digests
+
+    def finish(node: _Node) -> dict[str, bytes]:
+        if node.digests is not None:
+            return node.digests
+        hashers = [hashlib.new(algo) for algo in algos]
+        for name, kind, child in node.entries:
+            match kind:
+                case b"d":
+                    digests = finish(child)  # type: ignore
+                case b"l":
+                    digests = {algo: hashlib.new(algo, child).digest() for algo in algos}  # type: ignore
+                case _:
+                    digests = file_hashes[os.path.join(node.path, os.fsdecode(name))]
+            for algo, hasher in zip(algos, hashers):
+                hasher.update(kind + name + b"\0" + digests[algo])
+        node.digests = {algo: hasher.digest() for algo, hasher in zip(algos, hashers)}
+        if digest_cache is not None and not node.racy:
+            digest_cache.store_subtree(node.key, node.digests)
+        return node.digests
+
+    return finish(tree)
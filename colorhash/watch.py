@@ -0,0 +1,211 @@
+"""
+Watch mode: keep the hash of a growing file up to date without rehashing all of it.
+
+Files are polled (no inotify or other platform-specific notifications are used). When a file has
+grown, only the new data is hashed: the hasher state is kept between polls, and copies of it
+(`hash.copy()`) are kept as checkpoints along the way. Each checkpoint also keeps a small sample of
+the data just before it, which is compared against the file before the checkpoint is used, so that
+a file whose end was rewritten (e.g. an archive whose index is rewritten whenever it grows) is
+resumed from the last checkpoint that still matches.
+
+This assumes that files only change by growing, or by being rewritten near the end. Data before
+a matching checkpoint is not read again, so changes there are only noticed when the file shrinks,
+is replaced (a new inode, as with log rotation), is rewritten without growing, or changes within
+its first `SAMPLE_SIZE` bytes (which are checked as well, to catch files rewritten from the start),
+all of which cause a full rehash.
+"""
+import hashlib
+import os
+import time
+from typing import Any, Callable, Sequence
+
+from .digest import CHUNK_SIZE
+
+# How much of the data before each checkpoint is kept, to check that the data is unchanged.
+SAMPLE_SIZE = 4096
+
+# How often a checkpoint is taken, in bytes, while hashing.
+DEFAULT_CHECKPOINT_INTERVAL = 64 << 20
+
+# The most checkpoints kept per file; the oldest are dropped first.
+MAX_CHECKPOINTS = 16
+
+
+class _Checkpoint:
+    "The hasher state after hashing the first `offset` bytes of a file."
+
+    __slots__ = ("offset", "hashers", "sample")
+
+    def __init__(self, offset: int, hashers: list[Any], sample: bytes) -> None:
+        self.offset = offset
+        self.hashers = hashers
+        self.sample = sample
+
+
+class FileWatcher:
+    """
+    Keeps track of the hashes of a single file, hashing only what changed since the last poll.
+    """
+
+    def __init__(
+        self,
+        path: str | os.PathLike,
+        algos: Sequence[str],
+        checkpoint_interval: int = DEFAULT_CHECKPOINT_INTERVAL,
+    ) -> None:
+        """
+        Start watching a file. Nothing is read until the first `poll`.
+
+        :param path: the file to watch.
+        :param algos: the hash algorithms to use.
+        :param checkpoint_interval: how often a checkpoint is taken, in bytes.
+        """
+        self.path = path
+        self.algos = list(algos)
+        self.checkpoint_interval = checkpoint_interval
+        self.digests: dict[str, bytes] | None = None
+        # statistics: how many times the whole file was hashed, and how much was hashed in total
+        self.full_rehashes = 0
+        self.bytes_hashed = 0
+        self._identity: tuple[int, int] | None = None
+        self._mtime_ns = 0
+        self._checkpoints: list[_Checkpoint] = []
+        # the start of the file, as of the last poll
+        self._head = b""
+
+    def poll(self) -> dict[str, bytes] | None:
+        """
+        Check the file for changes, and hash whatever changed.
+
+        :returns: the new hashes of the file for each algorithm if they changed since the last poll
+                  (or if this is the first poll), otherwise None. None is also returned while the
+                  file does not exist.
+        :raises OSError: if the file could not be opened or read (e.g. while it is being replaced).
+                         If reading failed part of the way through, the next poll hashes the whole
+                         file again.
+        """
+        try:
+            fp = open(self.path, "rb")  # pylint: disable=consider-using-with
+        except FileNotFoundError:
+            return None
+        with fp:
+            try:
+                self._update(fp)
+            except OSError:
+                # forget everything, so the next poll starts over from a full rehash
+                self._identity = None
+                self._checkpoints = []
+                raise
+
+        digests = {
+            algo: hasher.digest()
+            for algo, hasher in zip(self.algos, self._checkpoints[-1].hashers)
+        }
+        if digests == self.digests:
+            return None
+        self.digests = digests
+        return digests
+
+    def _update(self, fp: Any) -> None:
+        # hash whatever changed in the open file since the last poll
+        st = os.fstat(fp.fileno())
+        identity = (st.st_dev, st.st_ino)
+        end = self._checkpoints[-1].offset if self._checkpoints else -1
+        if identity == self._identity and st.st_size == end and st.st_mtime_ns == self._mtime_ns:
+            return
+
+        start = None
+        # only resume if the file is the same one, has grown, and still starts the same way
+        if identity == self._identity and st.st_size > end and self._same_head(fp):
+            start = self._resume_point(fp)
+        if start is None:
+            self.full_rehashes += 1
+            start = _Checkpoint(0, [hashlib.new(algo) for algo in self.algos], b"")
+            self._checkpoints = []
+        else:
+            self._checkpoints = [cp for cp in self._checkpoints if cp.offset < start.offset]
+
+        self._hash_from(fp, start)
+        fp.seek(0)
+        self._head = fp.read(SAMPLE_SIZE)
+        self._identity = identity
+        self._mtime_ns = st.st_mtime_ns
+
+    def _same_head(self, fp: Any) -> bool:
+        fp.seek(0)
+        return fp.read(len(self._head)) == self._head
+
+    def _resume_point(self, fp: Any) -> _Checkpoint | None:
+        # the newest checkpoint whose sample still matches the file
+        for checkpoint in reversed(self._checkpoints):
+            fp.seek(checkpoint.offset - len(checkpoint.sample))
+            if fp.read(len(checkpoint.sample)) == checkpoint.sample:
+                return checkpoint
+        return None
+
+    def _hash_from(self, fp: Any, checkpoint: _Checkpoint) -> None:
+        # hash from a checkpoint to the end of the file, taking checkpoints along the way
+        hashers = [hasher.copy() for hasher in checkpoint.hashers]
+        offset = checkpoint.offset
+        tail = checkpoint.sample
+        interval = self.checkpoint_interval
+        fp.seek(offset)
+        while True:
+            # stop reading at each checkpoint boundary, so checkpoints land exactly on them
+            boundary = (offset // interval + 1) * interval
+            chunk = fp.read(min(CHUNK_SIZE, boundary - offset))
+            if not chunk:
+                break
+            for hasher in hashers:
+                hasher.update(chunk)
+            offset += len(chunk)
+            self.bytes_hashed += len(chunk)
+            tail = (tail + chunk)[-SAMPLE_SIZE:]
+            if offset == boundary:
+                self._add_checkpoint(_Checkpoint(offset, [h.copy() for h in hashers], tail))
+        if not self._checkpoints or self._checkpoints[-1].offset != offset:
+            self._add_checkpoint(_Checkpoint(offset, hashers, tail))
+
+    def _add_checkpoint(self, checkpoint: _Checkpoint) -> None:
+        self._checkpoints.append(checkpoint)
+        if len(self._checkpoints) > MAX_CHECKPOINTS:
+            del self._checkpoints[0]
+
+
+def watch(
+    path: str | os.PathLike,
+    algos: Sequence[str],
+    on_change: Callable[[dict[str, bytes]], None],
+    interval: float = 1.0,
+    checkpoint_interval: int = DEFAULT_CHECKPOINT_INTERVAL,
+    on_error: Callable[[OSError], None] | None = None,
+) -> None:
+    """
+    Watch a file forever, calling `on_change` with its hashes whenever they change (and once at the
+    start, as soon as the file exists).
+
+    Errors reading the file (such as a `PermissionError` while a log is being rotated) don't stop
+    the watch; the file is polled again after the usual interval.
+
+    :param path: the file to watch.
+    :param algos: the hash algorithms to use.
+    :param on_change: called with the new hashes of the file for each algorithm.
+    :param interval: how long to wait between polls, in seconds.
+    :param checkpoint_interval: how often a checkpoint is taken, in bytes.
+    :param on_error: if supplied, called with each error reading the file. An error that repeats on
+                     consecutive polls is only reported once.
+    """
+    watcher = FileWatcher(path, algos, checkpoint_interval)
+    last_error = None
+    while True:
+        try:
+            digests = watcher.poll()
+        except OSError as ex:
+            if on_error is not None and str(ex) != last_error:
+                on_error(ex)
+            last_error = str(ex)
+        else:
+            last_error = None
+            if digests is not None:
+                on_change(digests)
+        time.sleep(interval)
@@ -1,8 +1,40 @@
 "Colorhash writer classes"
 import abc
-import zlib
+import io
+from typing import BinaryIO, Iterable, Sequence
 
-from .color import Color, ColorMatrix
+from .color import ColorMatrix, IndexedColorMatrix
+from .matricizer import Matrix
+from .palettes import CompiledPalette
+
+
+def index_colors(matrix: ColorMatrix) -> tuple[CompiledPalette, Matrix]:
+    """
+    Split a color matrix into a compiled palette and a matrix of indices into that palette.
+
+    Matrices created by `colorize` already carry their compiled palette, so this is free for them.
+    Any other color matrix gets a palette compiled from its unique colors.
+
+    :param matrix: the color matrix to split.
+    :returns: the compiled palette, and the matrix of palette indices.
+    """
+    if isinstance(matrix, IndexedColorMatrix):
+        return matrix.palette, matrix.matrix
+
+    colors = []
+    indices: dict[tuple, int] = {}
+    rows = []
+    for row in matrix:
+        values = []
+        for color in row:
+            rgb = color.to_rgb()
+            key = (color.to_html_color(), rgb.r, rgb.g, rgb.b)
+            if key not in indices:
+                indices[key] = len(colors)
+                colors.append(color)
+            values.append(indices[key])
+        rows.append(values)
+    return CompiledPalette(colors), rows
 
 
 class Writer(metaclass=abc.ABCMeta):
@@ -22,35 +54,76 @@ class Writer(metaclass=abc.ABCMeta):
         :returns: the generated image as a string.
         """
 
+    def write_to(self, matrix: ColorMatrix, fp: BinaryIO) -> int:
+        """
+        Write the color matrix to a binary file object.
+
+        Writers that can produce their output a piece at a time override this to avoid building the
+        whole image in memory first.
+
+        :param matrix: the color matrix to generate the image for.
+        :param fp: the file object to write the image to.
+        :returns: the number of bytes written.
+        """
+        output = self.write(matrix)
+        fp.write(output)
+        return len(output)
+
 
 class ANSIWriter(Writer):
     """
-    ANSI terminal writer. This will output a 24-bit true color string.
+    ANSI terminal writer. By default, this will output a 24-bit true color string.
     """
 
+    def __init__(self, colors: str = "truecolor") -> None:
+        """
+        Create a new ANSI writer.
+
+        :param colors: the colors supported by the terminal; one of "truecolor", "256" or "16".
+        """
+        self.colors = colors
+
     def write(self, matrix: ColorMatrix) -> bytes:
         """
         Write the color matrix to an ANSI string.
 
-        :param matrix: the color matrix to generate the SVG for.
-        :returns: the full generated SVG as a string.
+        :param matrix: the color matrix to generate the ANSI string for.
+        :returns: the full generated ANSI string.
+        """
+        out = io.BytesIO()
+        self.write_to(matrix, out)
+        return out.getvalue()
+
+    def write_to(self, matrix: ColorMatrix, fp: BinaryIO) -> int:
+        """
+        Write the color matrix to a binary file object, one line at a time.
+
+        Color escape sequences are only written when the color changes from the previous square.
+
+        :param matrix: the color matrix to generate the ANSI string for.
+        :param fp: the file object to write the ANSI string to.
+        :returns: the number of bytes written.
         """
         esc = "\x1b"
         reset = f"{esc}[0m"
         c = "██"
 
-        def ansi_color(c: Color) -> str:
-            c = c.to_rgb()
-            return f"{esc}[38;2;{round(c.r)};{round(c.g)};{round(c.b)}m"
-
-        out = ""
-        for row in matrix:
-            for col in row:
-                out += ansi_color(col)
-                out += c
-            out += "\n"
-        out += reset
-        return out.encode()
+        palette, values = index_colors(matrix)
+        escapes = palette.ansi_table(self.colors)
+        written = 0
+        last = None
+        for row in values:
+            line = []
+            for v in row:
+                escape = escapes[v]
+                if escape != last:
+                    line.append(escape)
+                    last = escape
+                line.append(c)
+            line.append("\n")
+            written += fp.write("".join(line).encode())
+        written += fp.write(reset.encode())
+        return written
 
 
 class SVGWriter(Writer):
@@ -58,13 +131,16 @@ class SVGWriter(Writer):
     SVG string writer.
     """
 
-    def __init__(self, square_size: int) -> None:
+    def __init__(self, square_size: int, compact: bool = False) -> None:
         """
         Create a new SVG writer that uses the given square size.
 
         :param square_size: the size of the squares generated, in pixels.
+        :param compact: if true, generate a compact SVG, with a single path per color instead of a
+                        rect per square.
         """
         self.square_size = square_size
+        self.compact = compact
 
     def write(self, matrix: ColorMatrix) -> bytes:
         """
@@ -73,44 +149,209 @@ class SVGWriter(Writer):
         :param matrix: the color matrix to generate the SVG for.
         :returns: the full generated SVG as a string.
         """
-        h = len(matrix)
-        w = len(matrix[0])
+        if self.compact:
+            return self._write_compact(*index_colors(matrix))
+        out = io.BytesIO()
+        self.write_to(matrix, out)
+        return out.getvalue()
+
+    def write_to(self, matrix: ColorMatrix, fp: BinaryIO) -> int:
+        """
+        Write an SVG to a binary file object, one row of squares at a time.
+
+        Compact SVGs group the squares by color, so they can't be written until the whole matrix
+        has been seen; they are generated in memory and then written.
+
+        :param matrix: the color matrix to generate the SVG for.
+        :param fp: the file object to write the SVG to.
+        :returns: the number of bytes written.
+        """
+        palette, values = index_colors(matrix)
+        if self.compact:
+            return fp.write(self._write_compact(palette, values))
+        h = len(values)
+        w = len(values[0])
+        size = self.square_size
 
         # Start SVG string
-        svg = f'<svg width="{w * self.square_size}" height="{h * self.square_size}" xmlns="http://www.w3.org/2000/svg">\n'
+        written = fp.write(
+            f'<svg width="{w * size}" height="{h * size}" xmlns="http://www.w3.org/2000/svg">\n'
+            .encode()
+        )
 
         # Generate grid
-        for r in range(h):
-            for c in range(w):
-                x = c * self.square_size
-                y = r * self.square_size
-                color = matrix[r][c]
-                svg += f'  <rect x="{x}" y="{y}" width="{self.square_size}" height="{self.square_size}" fill="{color.to_html_color()}" />\n'
+        fills = palette.html
+        for r, row in enumerate(values):
+            y = r * size
+            svg = []
+            for c, v in enumerate(row):
+                x = c * size
+                svg.append(
+                    f'  <rect x="{x}" y="{y}" width="{size}" height="{size}" fill="{fills[v]}" />\n'
+                )
+            written += fp.write("".join(svg).encode())
 
         # Close SVG string
-        svg += "</svg>"
-        return svg.encode()
+        written += fp.write(b"</svg>")
+        return written
+
+    def _write_compact(self, palette: CompiledPalette, values: Matrix) -> bytes:
+        """
+        Generate a compact SVG.
+
+        Each color is drawn as a single path, and horizontal runs of the same color are merged into
+        one rectangle of that path. Colors are written once, as the fill of their path. (CSS classes
+        are not used, because SVGs that are embedded inline in an HTML page share its stylesheet,
+        and the class names from one image would clash with those of another.)
+        """
+        h = len(values)
+        w = len(values[0])
+        size = self.square_size
+
+        # color -> path data, in order of first appearance
+        paths: dict[str, list[str]] = {}
+        fills = palette.html
+        for r, row in enumerate(values):
+            y = r * size
+            c = 0
+            while c < w:
+                v = row[c]
+                run = c + 1
+                while run < w and row[run] == v:
+                    run += 1
+                paths.setdefault(fills[v], []).append(
+                    f"M{c * size} {y}h{(run - c) * size}v{size}h-{(run - c) * size}z"
+                )
+                c = run
+
+        svg = [
+            f'<svg width="{w * size}" height="{h * size}" xmlns="http://www.w3.org/2000/svg">'
+        ]
+        for fill, d in paths.items():
+            svg.append(f'<path fill="{fill}" d="{"".join(d)}"/>')
+        svg.append("</svg>")
+        return "".join(svg).encode()
+
+
+def pack_pixels(pixels: bytes, depth: int) -> bytes:
+    """
+    Pack a row of palette indices into bytes for a PNG scanline.
+
+    :param pixels: the palette indices, one per byte.
+    :param depth: the PNG bit depth; one of 1, 2, 4 or 8.
+    :returns: the packed pixels, most significant bits first, with the last byte padded with zeroes.
+    """
+    if depth == 8:
+        return pixels
+    per_byte = 8 // depth
+    pixels += bytes(-len(pixels) % per_byte)
+    packed = bytearray()
+    for group in zip(*[pixels[k::per_byte] for k in range(per_byte)]):
+        b = 0
+        for i in group:
+            b = (b << depth) | i
+        packed.append(b)
+    return bytes(packed)
+
+
+# Pixels per metre at 96 DPI, which is what most software assumes when there is no pHYs chunk.
+PNG_DEFAULT_PPM = 3780
+
+# The most compressed image data held before it is written out as an IDAT chunk. Images that
+# compress to less than this have a single IDAT chunk.
+PNG_IDAT_SIZE = 1 << 16
 
 
 class PNGWriter(Writer):
-    def __init__(self, square_size: int) -> None:
+    def __init__(
+        self,
+        square_size: int,
+        compression_level: int = -1,
+        strategy: int = 0,
+        scale_hint: bool = False,
+    ) -> None:
         """
         Create a new PNG writer that uses the given square size.
 
         :param square_size: the size of the squares generated, in pixels.
+        :param compression_level: the zlib compression level, from 0 to 9 (or -1 for the zlib
+                                  default).
+        :param strategy: the zlib compression strategy (e.g. `zlib.Z_RLE`). default:
+                         `zlib.Z_DEFAULT_STRATEGY`
+        :param scale_hint: if true, draw each square as a single pixel and add a pHYs chunk that
+                           tells viewers to scale the image up by `square_size`, instead of drawing
+                           the squares at full size. This keeps large square sizes cheap.
         """
         self.square_size = square_size
+        self.compression_level = compression_level
+        self.strategy = strategy
+        self.scale_hint = scale_hint
 
     def write(self, matrix: ColorMatrix) -> bytes:
         """
         Generate a PNG based on a given matrix.
 
-        :param matrix: the color matrix to generate the SVG for.
-        :returns: the full generated PNG as an ASCII-encoded string. It's probably a good idea to
-                  convert this to bytes since it's binary data being shoved into a string type.
+        :param matrix: the color matrix to generate the PNG for.
+        :returns: the full generated PNG.
         """
-        w = self.square_size * len(matrix[0])
-        h = self.square_size * len(matrix)
+        out = io.BytesIO()
+        self.write_to(matrix, out)
+        return out.getvalue()
+
+    def write_to(self, matrix: ColorMatrix, fp: BinaryIO) -> int:
+        """
+        Write a PNG to a binary file object. The image data is compressed and written as it is
+        generated (see `write_rows`).
+
+        :param matrix: the color matrix to generate the PNG for.
+        :param fp: the file object to write the PNG to.
+        :returns: the number of bytes written.
+        """
+        palette, values = index_colors(matrix)
+
+        # Create the PNG palette from the unique colors in the image, in order of appearance. Since
+        # palette entries may share an RGB value, map palette indices to PNG palette indices.
+        rgb = palette.rgb
+        plte: dict[bytes, int] = {}
+        pal2png: dict[int, int] = {}
+        rows = []
+        for row in values:
+            indices = []
+            for v in row:
+                i = pal2png.get(v)
+                if i is None:
+                    i = pal2png[v] = plte.setdefault(rgb[v * 3 : v * 3 + 3], len(plte))
+                indices.append(i)
+            rows.append(tuple(indices))
+        return self.write_rows(fp, len(values[0]), len(values), list(plte), rows)
+
+    def write_rows(
+        self,
+        fp: BinaryIO,
+        width: int,
+        height: int,
+        colors: Sequence[bytes],
+        rows: Iterable[Sequence[int]],
+    ) -> int:
+        """
+        Write a PNG from rows of color indices, compressing and writing each row as it comes.
+
+        Compressed data is written in IDAT chunks of up to `PNG_IDAT_SIZE` bytes, so the rows can
+        come from a generator, and neither they nor the compressed image are ever all in memory.
+
+        :param fp: the file object to write the PNG to.
+        :param width: the width of the image, in squares.
+        :param height: the height of the image, in squares; the number of rows.
+        :param colors: the colors of the image, as 3 bytes of R, G and B each.
+        :param rows: each row of the image, as indices into `colors`.
+        :returns: the number of bytes written.
+        """
+        # imported here so that other outputs don't pay for it
+        import zlib  # pylint: disable=import-outside-toplevel
+
+        scale = 1 if self.scale_hint else self.square_size
+        w = scale * width
+        h = scale * height
 
         def i32(i: int) -> bytes:
             return int.to_bytes(i, 4, "big")
@@ -120,30 +361,20 @@ class PNGWriter(Writer):
             chunk = bytearray()
             chunk += i32(len(data))
             # add the name to the data so it also gets encoded with the crc32
-            data = name.encode('ascii') + data
+            data = name.encode("ascii") + data
             chunk += data
             chunk += i32(zlib.crc32(data))
             return bytes(chunk)
 
-        # Convert the matrix into RGB byte triples
-        colors = [
-            [
-                bytes([int(c.r), int(c.g), int(c.b)])
-                for c in map(lambda c: c.to_rgb(), row)
-            ]
-            for row in matrix
-        ]
-
-        # Create the palette based on the unique colors available
-        # NOTE : these could be done in the same dict and would probably save a little bit of
-        # memory, however, mypy likes it when we keep types easy
-        pal2col = {}
-        col2pal = {}
-        for i, c in enumerate(set(sum(colors, []))):
-            pal2col[i] = c
-            col2pal[c] = i
-
-        assert len(pal2col) // 2 < 16, "palette for PNG image was longer than 16 colors"
+        # Use the smallest bit depth that fits every color in the palette, or fall back to
+        # truecolor if there are too many colors for a palette.
+        truecolor = len(colors) > 256
+        if truecolor:
+            depth = 8
+            color_type = 2
+        else:
+            depth = next(d for d in (1, 2, 4, 8) if len(colors) <= 1 << d)
+            color_type = 3
 
         # Header
         png = bytearray([0x89, 0x50, 0x4E, 0x47, 0x0D, 0x0A, 0x1A, 0x0A])
@@ -151,31 +382,44 @@ class PNGWriter(Writer):
         # write the IHDR chunk
         png += chunk(
             "IHDR",
-            # width, height, bit depth (4), color type (3, palette),
+            # width, height, bit depth, color type (3, palette; or 2, truecolor),
             # compression method (always 0), filter method (always 0),
             # interlace method (0, not interlaced)
-            i32(w) + i32(h) + bytes([4, 3, 0, 0, 0]),
-        )
-        # write the palette chunk
-        png += chunk(
-            "PLTE",
-            b"".join([pal2col[i] for i in range(len(pal2col))]),
+            i32(w) + i32(h) + bytes([depth, color_type, 0, 0, 0]),
         )
-        # create scanlines and shove them into IDAT chunks
+        if not truecolor:
+            # write the palette chunk
+            png += chunk("PLTE", b"".join(colors))
+        if self.scale_hint:
+            # write the pHYs chunk: pixels per unit X and Y, unit (1, metre). Each pixel should be
+            # as large as square_size pixels would be at 96 DPI.
+            ppm = max(round(PNG_DEFAULT_PPM / self.square_size), 1)
+            png += chunk("pHYs", i32(ppm) + i32(ppm) + bytes([1]))
+        written = fp.write(png)
+
+        # create scanlines and compress them as we go. Each matrix row is turned into a scanline
+        # once (the filter type byte, 0, followed by the packed pixels) and then repeated for
+        # every line of the row.
+        compressor = zlib.compressobj(self.compression_level, strategy=self.strategy)
         idat = bytearray()
-        for row in colors:
-            line = bytearray([0])
-            for col in row:
-                b = (col2pal[col] << 4) | col2pal[col]
-                # add square_size number of colors (divided by 2, since we only need 4 bits per
-                # color)
-                for _ in range(self.square_size // 2):
-                    line += bytes([b])
-            # add square_size number of lines
-            for _ in range(self.square_size):
-                idat += line
-        # write the IDAT chunk
-        png += chunk("IDAT", zlib.compress(idat))
+        last_row = None
+        line = b""
+        for row in rows:
+            if row != last_row:
+                if truecolor:
+                    pixels = b"".join([colors[i] * scale for i in row])
+                else:
+                    pixels = pack_pixels(b"".join([bytes([i]) * scale for i in row]), depth)
+                line = b"\x00" + pixels
+                last_row = row
+            idat += compressor.compress(line * scale)
+            if len(idat) >= PNG_IDAT_SIZE:
+                # write an IDAT chunk
+                written += fp.write(chunk("IDAT", bytes(idat)))
+                idat.clear()
+        idat += compressor.flush()
+        # write the last IDAT chunk
+        written += fp.write(chunk("IDAT", bytes(idat)))
         # write the IEND chunk
-        png += chunk("IEND", bytes())
-        return png
+        written += fp.write(chunk("IEND", bytes()))
+        return written
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Golden-output regression check.
+
+Renders a fixed corpus of hashes with every matricizer and writer, and compares checksums of the
+results against the ones recorded in `tools/golden.json`. Any change to a matrix, a color or a
+single byte of output shows up as a mismatch. The corpus is the hashes of the `examples/*.in` files
+plus a large set of generated hashes of every supported length.
+
+The optimized code paths are also checked against their reference implementations, byte for byte,
+on the whole corpus (plus `--fuzz` random hashes): the table-driven randomart matricizer against
+`RandomartMatricizer.matricize_stepwise`, the nibble matricizer against a nibble-at-a-time
+implementation, and (when NumPy is installed) the bulk API against the pure Python pipeline.
+
+    tools/golden.py              # verify; exits with status 1 on any mismatch
+    tools/golden.py --generate   # record new checksums, after an intentional change
+
+Verifying also runs the startup-time check from `tools/startup.py`: rendering a single hash from the
+command line must take at most `--startup-budget-ms` (median wall time of a few fresh interpreters),
+so changes that make the CLI slow to start fail here too. `--startup-budget-ms 0` skips it.
+
+The examples are also compared against `examples/*.svg`. Those images were generated by an older
+version that rounded lightness to whole percentages, so only their layout is compared: every square
+must be in the same place and, for the nibble examples, two squares must share a color exactly when
+they did before. The randomart examples predate the current multicolor palettes, so only the
+positions of their squares are compared.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Iterator
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# pylint: disable=wrong-import-position
+from colorhash.color import colorize
+from colorhash.matricizer import (ByteMatrix, Matricizer, NibbleMatricizer,
+                                  RandomartMatricizer)
+from colorhash.writer import ANSIWriter, PNGWriter, SVGWriter, Writer
+
+GOLDEN_PATH = ROOT / "tools" / "golden.json"
+EXAMPLES_PATH = ROOT / "examples"
+
+HASHES = ["md5", "sha1", "sha224", "sha256", "sha384", "sha512"]
+
+# The number of generated hashes per hash algorithm.
+GENERATED_COUNT = 256
+
+# The number of renders covered by a single checksum. Smaller groups narrow down mismatches, at the
+# cost of a bigger golden file.
+GROUP_SIZE = 32
+
+# The format version of the golden file.
+GOLDEN_VERSION = 1
+
+# The default startup-time budget, in milliseconds, and the number of runs it is measured over. The
+# CLI takes about 50ms here; the budget leaves room for slower machines and noisy timings.
+STARTUP_BUDGET_MS = 150
+STARTUP_RUNS = 5
+
+MATRICIZERS: dict[str, Matricizer] = {
+    "nibble": NibbleMatricizer(),
+    "randomart": RandomartMatricizer(),
+}
+
+WRITERS: dict[str, Writer] = {
+    "ansi-truecolor": ANSIWriter(),
+    "ansi-256": ANSIWriter("256"),
+    "ansi-16": ANSIWriter("16"),
+    "svg": SVGWriter(32),
+    "svg-compact": SVGWriter(32, compact=True),
+    "png-1": PNGWriter(1),
+    "png-3": PNGWriter(3, scale_hint=True),
+}
+
+
+def example_hashes() -> Iterator[tuple[str, str, bytes]]:
+    "Get (example name, hash algorithm, hash) for every example input and hash algorithm."
+    for infile in sorted(EXAMPLES_PATH.glob("*.in")):
+        data = infile.read_bytes()
+        for algo in HASHES:
+            yield infile.stem, algo, hashlib.new(algo, data).digest()
+
+
+def corpus() -> dict[str, list[bytes]]:
+    "Get the hashes in the corpus, grouped by where they came from."
+    groups: dict[str, list[bytes]] = {
+        "examples": [data for _, _, data in example_hashes()]
+    }
+    for algo in HASHES:
+        groups[algo] = [
+            hashlib.new(algo, b"colorhash golden %d" % i).digest() for i in range(GENERATED_COUNT)
+        ]
+    return groups
+
+
+def checksum(outputs: list[bytes]) -> str:
+    "Get a short checksum of a group of outputs."
+    hasher = hashlib.blake2b(digest_size=8)
+    for output in outputs:
+        hasher.update(len(output).to_bytes(4, "big"))
+        hasher.update(output)
+    return hasher.hexdigest()
+
+
+def matrix_bytes(matrix: ByteMatrix) -> bytes:
+    "Get a matrix, including its dimensions, as bytes."
+    return bytes([matrix.width, matrix.height]) + bytes(matrix.data)
+
+
+def checksums() -> dict[str, list[str]]:
+    """
+    Render the whole corpus and checksum the results.
+
+    :returns: the checksums for each group of the corpus, keyed by
+              "<corpus group>/<matricizer>/<stage>".
+    """
+    result = {}
+    for group, hashes in corpus().items():
+        for name, matricizer in MATRICIZERS.items():
+            matrices = [matricizer.matricize(data) for data in hashes]
+            colors = [
+                colorize(matricizer.choose_palette(data), matrix)
+                for data, matrix in zip(hashes, matrices)
+            ]
+            stages: dict[str, list[bytes]] = {
+                "matrix": [matrix_bytes(matrix) for matrix in matrices],
+                "colors": [
+                    " ".join(color.to_html_color() for row in matrix for color in row).encode()
+                    for matrix in colors
+                ],
+            }
+            for writer_name, writer in WRITERS.items():
+                stages[writer_name] = [writer.write(matrix) for matrix in colors]
+            for stage, outputs in stages.items():
+                result[f"{group}/{name}/{stage}"] = [
+                    checksum(outputs[i : i + GROUP_SIZE])
+                    for i in range(0, len(outputs), GROUP_SIZE)
+                ]
+    return result
+
+
+def nibble_reference(data: bytes) -> ByteMatrix:
+    "The nibble matricizer, one nibble at a time."
+    algo_dims = {len(hashlib.new(algo).digest()): algo for algo in HASHES}
+    w, h = NibbleMatricizer.DIMENSIONS[algo_dims[len(data)]]
+    nibbles = []
+    for byte in data:
+        nibbles += [byte >> 4, byte & 0xF]
+    return ByteMatrix.from_rows(nibbles[r * w : (r + 1) * w] for r in range(h))
+
+
+def reference_checks(hashes: list[bytes]) -> Iterator[tuple[str, Callable[[bytes], bool]]]:
+    "Get (name, check) for each optimized code path that has a reference implementation."
+    randomart = RandomartMatricizer()
+    nibble = NibbleMatricizer()
+    yield "randomart table vs stepwise", (
+        lambda data: randomart.matricize(data) == randomart.matricize_stepwise(data)
+    )
+    yield "nibble vs nibble-at-a-time", lambda data: nibble.matricize(data) == nibble_reference(data)
+
+    try:
+        from colorhash import bulk  # pylint: disable=import-outside-toplevel
+        import numpy  # pylint: disable=import-outside-toplevel,unused-import
+    except ImportError:
+        print("skipped: bulk vs pure Python (NumPy is not installed)")
+        return
+
+    # the bulk API works on many hashes of one length at a time, so check whole batches up front
+    mismatched: set[bytes] = set()
+    for algo in HASHES:
+        batch = [data for data in hashes if len(data) == len(hashlib.new(algo).digest())]
+        if not batch:
+            continue
+        pixels = bulk.render_rgb(bulk.digests_to_array(batch))
+        for data, image in zip(batch, pixels):
+            colors = colorize(nibble.choose_palette(data), nibble.matricize(data))
+            expected = [[color.to_rgb() for color in row] for row in colors]
+            if [[(int(c.r), int(c.g), int(c.b)) for c in row] for row in expected] != [
+                [tuple(pixel) for pixel in row] for row in image.tolist()
+            ]:
+                mismatched.add(data)
+    yield "bulk vs pure Python", lambda data: data not in mismatched
+
+
+def svg_layout(svg: bytes) -> list[tuple[tuple[str, ...], str]]:
+    "Get the position and size, and the fill, of every square in an SVG image."
+    return [
+        (match.group(1, 2, 3, 4), match.group(5))
+        for match in re.finditer(
+            rb'<rect x="(\d+)" y="(\d+)" width="(\d+)" height="(\d+)" fill="([^"]+)"', svg
+        )
+    ]
+
+
+def check_examples() -> list[str]:
+    "Compare the layout of the example images against the current output."
+    errors = []
+    writer = SVGWriter(32)
+    for example, algo, data in example_hashes():
+        for name, matricizer in MATRICIZERS.items():
+            path = EXAMPLES_PATH / f"{example}-{algo}-{name}.svg"
+            if not path.exists():
+                continue
+            old = svg_layout(path.read_bytes())
+            new = svg_layout(
+                writer.write(colorize(matricizer.choose_palette(data), matricizer.matricize(data)))
+            )
+            same = [pos for pos, _ in old] == [pos for pos, _ in new]
+            if name == "nibble":
+                fills = {}
+                for (_, old_fill), (_, new_fill) in zip(old, new):
+                    same = same and fills.setdefault(old_fill, new_fill) == new_fill
+                same = same and len(set(fills.values())) == len(fills)
+            if not same:
+                errors.append(f"{path.relative_to(ROOT)}: layout differs from the current output")
+    return errors
+
+
+def check_startup(budget_ms: float) -> str | None:
+    "Measure the startup time of the CLI. Returns an error if it is over `budget_ms`."
+    from startup import measure  # pylint: disable=import-outside-toplevel
+
+    walls, _, _ = measure(STARTUP_RUNS)
+    wall = statistics.median(walls) * 1000
+    if wall > budget_ms:
+        return (
+            f"startup: median wall time {wall:.1f}ms is over budget ({budget_ms}ms); "
+            "run tools/startup.py to see the slowest imports"
+        )
+    return None
+
+
+def verify(args: argparse.Namespace) -> bool:
+    "Run every check, printing the failures. Returns True if everything passed."
+    ok = True
+
+    hashes = [data for group in corpus().values() for data in group]
+    hashes += [
+        os.urandom(len(hashlib.new(HASHES[i % len(HASHES)]).digest())) for i in range(args.fuzz)
+    ]
+    for name, check in reference_checks(hashes):
+        failures = [data.hex() for data in hashes if not check(data)]
+        if failures:
+            ok = False
+            print(f"FAIL: {name}: {len(failures)} of {len(hashes)} hashes differ, e.g.")
+            for failure in failures[:5]:
+                print(f"    {failure}")
+
+    for error in check_examples():
+        ok = False
+        print(f"FAIL: {error}")
+
+    try:
+        golden = json.loads(GOLDEN_PATH.read_text())
+    except OSError as ex:
+        print(f"ERROR: could not read {GOLDEN_PATH}: {ex}", file=sys.stderr)
+        raise SystemExit(1) from ex
+    if golden.get("version") != GOLDEN_VERSION:
+        print(f"ERROR: unsupported golden file version: {golden.get('version')}", file=sys.stderr)
+        raise SystemExit(1)
+
+    groups = corpus()
+    current = checksums()
+    for key, expected in golden["checksums"].items():
+        actual = current.get(key)
+        if actual is None:
+            ok = False
+            print(f"FAIL: {key}: no longer rendered")
+            continue
+        for i, (want, got) in enumerate(zip(expected, actual)):
+            if want != got:
+                ok = False
+                first = groups[key.split("/")[0]][i * GROUP_SIZE].hex()
+                print(f"FAIL: {key}: group {i} (starting at hash {first}) differs")
+        if len(expected) != len(actual):
+            ok = False
+            print(f"FAIL: {key}: {len(actual)} groups, expected {len(expected)}")
+    for key in current.keys() - golden["checksums"].keys():
+        print(f"note: {key} is not in the golden file; run with --generate to add it")
+
+    if args.startup_budget_ms > 0:
+        error = check_startup(args.startup_budget_ms)
+        if error is not None:
+            ok = False
+            print(f"FAIL: {error}")
+    return ok
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Check that colorhash output has not changed.")
+    ap.add_argument(
+        "--generate",
+        action="store_true",
+        help="Record the current output as the golden output, instead of verifying it.",
+    )
+    ap.add_argument(
+        "--fuzz",
+        metavar="N",
+        type=int,
+        default=1000,
+        help="Also check N random hashes against the reference implementations. default: 1000",
+    )
+    ap.add_argument(
+        "--startup-budget-ms",
+        metavar="MS",
+        type=float,
+        default=STARTUP_BUDGET_MS,
+        help="Fail if the CLI takes more than MS milliseconds to render a single hash; 0 skips the "
+        f"check. default: {STARTUP_BUDGET_MS}",
+    )
+    args = ap.parse_args()
+
+    start = time.perf_counter()
+    if args.generate:
+        GOLDEN_PATH.write_text(
+            json.dumps({"version": GOLDEN_VERSION, "checksums": checksums()}, indent=1) + "\n"
+        )
+        print(f"wrote {GOLDEN_PATH.relative_to(ROOT)}")
+        return
+
+    ok = verify(args)
+    elapsed = time.perf_counter() - start
+    print(f"{'ok' if ok else 'FAILED'} ({elapsed:.2f}s)")
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Load test for `colorhash serve`.
+
+Opens a number of keep-alive connections to a running server and sends render requests as fast as
+possible for a fixed duration, then reports the request rate and latency percentiles.
+
+    python3 -m colorhash serve &
+    tools/loadtest.py --connections 32 --duration 10
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+
+async def worker(
+    args: argparse.Namespace, digests: list[str], latencies: list[float], deadline: float
+) -> int:
+    if args.unix:
+        reader, writer = await asyncio.open_unix_connection(args.unix)
+    else:
+        reader, writer = await asyncio.open_connection(args.host, args.port)
+    errors = 0
+    i = 0
+    try:
+        while time.perf_counter() < deadline:
+            digest = digests[i % len(digests)]
+            i += 1
+            request = (
+                f"GET /render?digest={digest}&format={args.format}&matrix={args.matrix} HTTP/1.1\r\n"
+                f"Host: {args.host}\r\n\r\n"
+            )
+            start = time.perf_counter()
+            writer.write(request.encode())
+            status = await reader.readuntil(b"\r\n")
+            length = 0
+            while True:
+                line = await reader.readuntil(b"\r\n")
+                if line == b"\r\n":
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                if name.lower() == "content-length":
+                    length = int(value)
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+            if not status.startswith(b"HTTP/1.1 200"):
+                errors += 1
+    finally:
+        writer.close()
+    return errors
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser(description="Load test a running `colorhash serve`.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8420)
+    ap.add_argument("--unix", metavar="PATH", help="Connect to a Unix socket instead of TCP.")
+    ap.add_argument("--connections", type=int, default=16)
+    ap.add_argument("--duration", type=float, default=10.0, help="Seconds to run for.")
+    ap.add_argument("--format", default="svg", choices=["svg", "png", "ansi"])
+    ap.add_argument("--matrix", default="nibble", choices=["nibble", "randomart"])
+    ap.add_argument(
+        "--digests",
+        type=int,
+        default=10_000,
+        help="The number of distinct sha512 digests to request. Fewer digests means more cache hits.",
+    )
+    args = ap.parse_args()
+
+    digests = [os.urandom(64).hex() for _ in range(args.digests)]
+    latencies: list[float] = []
+    start = time.perf_counter()
+    deadline = start + args.duration
+    errors = await asyncio.gather(
+        *[worker(args, digests[i::args.connections] or digests, latencies, deadline)
+          for i in range(args.connections)]
+    )
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f"requests:  {len(latencies)} ({sum(errors)} errors)")
+    print(f"rate:      {len(latencies) / elapsed:.1f} req/s")
+    print(
+        f"latency:   p50 {quantiles[49] * 1000:.2f}ms  p90 {quantiles[89] * 1000:.2f}ms  "
+        f"p99 {quantiles[98] * 1000:.2f}ms  max {latencies[-1] * 1000:.2f}ms"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Regression check for the table-driven randomart matricizer.
+
+Compares `RandomartMatricizer.matricize` (one move table lookup per byte) against
+`RandomartMatricizer.matricize_stepwise` (the straightforward walk, two bits at a time), which must
+produce the same matrix for every hash:
+
+    tools/randomart_check.py                  # 100000 random hashes of every supported length
+    tools/randomart_check.py --count 1000000 --seed 1
+
+Besides the random hashes, every hash made of a single repeated byte is checked, for every length.
+Those walk straight into the edges and corners of the matrix and keep visiting the same cells, so
+they cover the clamping at the edges and the saturation of cells at 15. Exits with status 1 on any
+mismatch.
+"""
+import argparse
+import hashlib
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# pylint: disable=wrong-import-position
+from colorhash.matricizer import RandomartMatricizer
+
+HASHES = ["md5", "sha1", "sha224", "sha256", "sha384", "sha512"]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(
+        description="Check the table-driven randomart matricizer against the stepwise one."
+    )
+    ap.add_argument(
+        "--count",
+        metavar="N",
+        type=int,
+        default=100_000,
+        help="The number of random hashes to check, spread over every hash length. default: 100000",
+    )
+    ap.add_argument("--seed", type=int, help="Seed the random hashes, to repeat a run.")
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    sizes = [hashlib.new(algo).digest_size for algo in HASHES]
+    hashes = [bytes([value]) * size for size in sizes for value in range(256)]
+    hashes += [rng.randbytes(sizes[i % len(sizes)]) for i in range(args.count)]
+
+    start = time.perf_counter()
+    matricizer = RandomartMatricizer()
+    failures = [
+        data
+        for data in hashes
+        if matricizer.matricize(data) != matricizer.matricize_stepwise(data)
+    ]
+    elapsed = time.perf_counter() - start
+
+    for data in failures[:10]:
+        print(f"FAIL: {data.hex()}")
+    if failures:
+        print(f"FAILED: {len(failures)} of {len(hashes)} hashes differ ({elapsed:.2f}s)")
+        sys.exit(1)
+    print(f"ok: {len(hashes)} hashes ({elapsed:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
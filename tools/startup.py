@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Startup-time check for the colorhash CLI.
+
+Renders a single hash given on the command line several times, each in a fresh interpreter, and
+reports the median wall time plus the time spent importing colorhash (from `python -X importtime`).
+Exits with status 1 when the median wall time is over the budget, so it can be used as a check:
+
+    tools/startup.py --budget-ms 150
+
+Bytecode should be cached (PYTHONDONTWRITEBYTECODE unset) or every run also pays for compiling
+the package, which is not what users see.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HASH = "d41d8cd98f00b204e9800998ecf8427e"
+
+
+def run_once(python: str, env: dict[str, str]) -> tuple[float, float, list[tuple[int, str]]]:
+    "Run the CLI once. Returns the wall time, colorhash import time and per-module self times."
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [python, "-X", "importtime", "-m", "colorhash", HASH, "-x", "hash", "-a", "md5"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        env=env,
+        check=True,
+    )
+    wall = time.perf_counter() - start
+
+    imported = 0.0
+    modules = []
+    for line in proc.stderr.decode().splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = (field.strip() for field in line[12:].split("|"))
+        if not self_us.isdigit():
+            continue
+        modules.append((int(self_us), name))
+        if name == "colorhash":
+            imported = int(cumulative_us) / 1_000_000
+    return wall, imported, modules
+
+
+def measure(runs: int) -> tuple[list[float], list[float], list[tuple[int, str]]]:
+    """
+    Run the CLI `runs` times, against the colorhash in this checkout.
+
+    :param runs: the number of runs.
+    :returns: the wall time and colorhash import time of every run, and the per-module self import
+              times of the last run.
+    """
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [root, env.get("PYTHONPATH")]))
+
+    walls = []
+    imports = []
+    modules: list[tuple[int, str]] = []
+    for _ in range(runs):
+        wall, imported, modules = run_once(sys.executable, env)
+        walls.append(wall)
+        imports.append(imported)
+    return walls, imports, modules
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Measure the startup time of the colorhash CLI.")
+    ap.add_argument("--runs", type=int, default=10, help="The number of runs. default: 10")
+    ap.add_argument(
+        "--budget-ms",
+        type=float,
+        help="Fail if the median wall time is over this many milliseconds.",
+    )
+    ap.add_argument(
+        "--top", type=int, default=10, help="Show the modules with the largest self import time."
+    )
+    args = ap.parse_args()
+
+    walls, imports, modules = measure(args.runs)
+    wall = statistics.median(walls) * 1000
+    print(f"wall time:        median {wall:.1f}ms  min {min(walls) * 1000:.1f}ms")
+    print(f"colorhash import: median {statistics.median(imports) * 1000:.1f}ms")
+    if args.top:
+        print("slowest imports (last run, self time):")
+        for self_us, name in sorted(modules, reverse=True)[: args.top]:
+            print(f"    {self_us / 1000:7.2f}ms  {name.strip()}")
+
+    if args.budget_ms is not None and wall > args.budget_ms:
+        print(f"ERROR: median wall time {wall:.1f}ms is over budget ({args.budget_ms}ms)",
+              file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()